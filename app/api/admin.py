@@ -4,6 +4,7 @@ from sqlalchemy.orm import Session
 from typing import List
 from app.db.database import get_db
 from app.db.models import SMSCommand, SMS, SMSQueue
+from app.services.stats_service import StatsService
 from app.api.schemas import (
     SMSCommandCreate, SMSCommandUpdate, SMSCommandResponse,
     MessageResponse
@@ -18,10 +19,10 @@ templates = Jinja2Templates(directory="app/templates")
 @router.get("/")
 async def admin_dashboard(request: Request, db: Session = Depends(get_db)):
     """Dashboard principal de administração"""
-    # Estatísticas básicas
-    total_sms = db.query(SMS).count()
+    # Estatísticas básicas (contadores, sem contar as tabelas)
+    total_sms = StatsService.dashboard(db)["total"]
     total_commands = db.query(SMSCommand).count()
-    total_queue = db.query(SMSQueue).filter(SMSQueue.processed == False).count()
+    total_queue = StatsService.queue_totals(db)["pending"]
     
     return templates.TemplateResponse("admin/dashboard.html", {
         "request": request,
@@ -20,7 +20,7 @@ async def export_modem_diagnostic():
     """Exportar diagnóstico robusto das portas em CSV"""
     try:
         detector = ModemDetector()
-        result = detector.detect_gsm_modem_robust()
+        result = detector.detect_gsm_modem_robust(use_cache=False)
         output = io.StringIO()
         writer = csv.writer(output)
         writer.writerow(["Porta", "Status", "AT", "ATI", "Erro"])
@@ -68,7 +68,7 @@ async def modem_diagnostic():
     """Diagnóstico robusto de todas as portas seriais para modem GSM."""
     try:
         detector = ModemDetector()
-        result = detector.detect_gsm_modem_robust()
+        result = detector.detect_gsm_modem_robust(use_cache=False)
         return {
             "success": True,
             "found": result['found'],
@@ -149,6 +149,42 @@ async def get_modem_status():
             detail="Erro ao obter status do modem"
         )
 
+@router.get("/api/pool")
+async def get_modem_pool_status():
+    """API para obter o estado de todos os modems do pool de envio"""
+    try:
+        service = get_sms_service()
+        return {
+            "success": True,
+            "strategy": service.pool.strategy,
+            "modems": service.get_pool_status()
+        }
+    except Exception as e:
+        logger.error(f"Erro ao obter estado do pool de modems: {str(e)}")
+        return {
+            "success": False,
+            "strategy": None,
+            "modems": [],
+            "error": str(e)
+        }
+
+@router.get("/api/routes")
+async def get_route_metrics():
+    """API para obter o débito por rota (operadora de destino → modem)"""
+    try:
+        service = get_sms_service()
+        return {
+            "success": True,
+            "routes": service.pool.get_route_metrics()
+        }
+    except Exception as e:
+        logger.error(f"Erro ao obter métricas de encaminhamento: {str(e)}")
+        return {
+            "success": False,
+            "routes": [],
+            "error": str(e)
+        }
+
 @router.post("/api/restart", response_model=MessageResponse)
 async def restart_modem():
     """Reiniciar conexão com modem GSM"""
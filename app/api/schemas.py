@@ -88,6 +88,46 @@ class QueueStatusResponse(BaseModel):
     total_processed: int
     next_scheduled: Optional[datetime]
     processor_running: Optional[bool] = False
+    pending_segments: Optional[int] = None  # SMS longos contam por segmentos
+    segments_per_minute: Optional[float] = None
+    eta_seconds: Optional[int] = None
+
+class CampaignStatusEnum(str, Enum):
+    IMPORTING = "importing"
+    QUEUED = "queued"
+    RUNNING = "running"
+    COMPLETED = "completed"
+    FAILED = "failed"
+
+class CampaignResponse(BaseModel):
+    id: int
+    name: Optional[str]
+    message: str
+    priority: Optional[int]
+    scheduled_for: Optional[datetime]
+    status: CampaignStatusEnum
+    recipients_total: int
+    rejected: int
+    sent: int
+    failed: int
+    pending: int
+    error_message: Optional[str]
+    created_at: Optional[datetime]
+    started_at: Optional[datetime]
+    finished_at: Optional[datetime]
+    sms_per_minute: Optional[float] = None
+    eta_seconds: Optional[int] = None
+    
+    class Config:
+        from_attributes = True
+
+class BulkEnqueueResponse(BaseModel):
+    message: str
+    success: bool = True
+    campaign_id: int
+    status: CampaignStatusEnum
+    queued: Optional[int] = None  # None enquanto a importação decorre em background
+    rejected: Optional[int] = None
 
 # Schemas para Dashboard/Estatísticas
 class DashboardStats(BaseModel):
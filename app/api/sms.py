@@ -1,20 +1,38 @@
-from fastapi import APIRouter, Depends, HTTPException, status, BackgroundTasks
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, status, BackgroundTasks, UploadFile, File, Form
+from sqlalchemy import select, union_all
 from sqlalchemy.orm import Session
 from typing import List, Optional
 from app.db.database import get_db
-from app.db.models import SMS, SMSStatus, SMSDirection, SMSQueue, SMSCommand, SMSResponse, Contact, ContactGroup, ContactGroupMember
+from app.db.models import SMS, SMSStatus, SMSDirection, SMSQueue, SMSCommand, SMSResponse, Contact, ContactGroup, ContactGroupMember, Campaign
 from app.api.schemas import (
     SMSCreate, SMSBulkCreate, SMSResponse as SMSResponseSchema, 
     WebhookSMS, MessageResponse, DashboardStats, QueueStatusResponse,
-    SMSStatusUpdate, SMSContactCreate
+    SMSStatusUpdate, SMSContactCreate, BulkEnqueueResponse, CampaignResponse
 )
 from app.services.sms_service import SMSService
+from app.services.bulk_enqueue import BulkEnqueueService
+from app.services.campaign_service import CampaignService
+from app.services.rate_limiter import rate_limiter, enforce_rate_limit, api_rate_limit
+from app.services.stats_service import StatsService
+from app.utils.pdu import count_segments
+from app.core.config import settings
+from shared.pagination import CountCache, keyset_page
+from shared.search import full_text_index
+from datetime import datetime
+import os
+import tempfile
 from app.services.command_service import CommandService
 import logging
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
 
+# Pesquisa de texto integral nas mensagens (GIN no PostgreSQL, FTS5 no SQLite)
+sms_search = full_text_index(SMS.message)
+
+# Totais das listas (COUNT sobre milhões de linhas) reaproveitados entre páginas
+list_count_cache = CountCache(ttl=settings.PAGINATION_COUNT_CACHE_TTL)
+
 # Serviços serão inicializados dinamicamente
 sms_service = None
 command_service = None
@@ -35,13 +53,19 @@ def get_command_service():
         command_service = CommandService()
     return command_service
 
-@router.post("/send", response_model=SMSResponseSchema)
+@router.post("/send", response_model=SMSResponseSchema, dependencies=[Depends(api_rate_limit)])
 async def send_sms(
     sms_data: SMSCreate,
     background_tasks: BackgroundTasks,
+    request: Request,
     db: Session = Depends(get_db)
 ):
     """Enviar um SMS individual"""
+    # Limite por cliente (segmentos); modem e destinatário são limitados no envio
+    enforce_rate_limit(
+        {"user": request.client.host if request.client else "anonymous"},
+        cost=count_segments(sms_data.message)
+    )
     try:
         # Criar registro na base de dados
         sms = SMS(
@@ -90,30 +114,28 @@ async def send_sms(
             detail="Erro interno do servidor ao enviar SMS"
         )
 
-@router.post("/send-bulk", response_model=MessageResponse)
+@router.post("/send-bulk", response_model=BulkEnqueueResponse, status_code=status.HTTP_202_ACCEPTED,
+             dependencies=[Depends(api_rate_limit)])
 async def send_bulk_sms(
     bulk_data: SMSBulkCreate,
     db: Session = Depends(get_db)
 ):
-    """Enviar SMS em massa (adiciona à fila)"""
+    """
+    Enviar SMS em massa (adiciona à fila numa campanha, com inserções em bloco).
+    Devolve logo o id da campanha; os números são inseridos na fila em background.
+    """
     try:
-        total_added = 0
-        
-        for phone in bulk_data.phones:
-            queue_item = SMSQueue(
-                phone_to=phone,
-                message=bulk_data.message,
-                priority=bulk_data.priority or 0,
-                scheduled_for=bulk_data.scheduled_for
-            )
-            db.add(queue_item)
-            total_added += 1
-        
-        db.commit()
+        bulk_service = BulkEnqueueService()
+        campaign = bulk_service.create_campaign(
+            db, bulk_data.message, bulk_data.priority, bulk_data.scheduled_for
+        )
+        bulk_service.enqueue_in_background(campaign.id, bulk_data.phones)
         
-        return MessageResponse(
-            message=f"{total_added} SMS adicionados à fila de envio",
-            success=True
+        return BulkEnqueueResponse(
+            message=f"Campanha {campaign.id} criada - {len(bulk_data.phones)} destinatários a ser adicionados à fila",
+            success=True,
+            campaign_id=campaign.id,
+            status=campaign.status.value
         )
         
     except Exception as e:
@@ -123,7 +145,88 @@ async def send_bulk_sms(
             detail="Erro ao adicionar SMS à fila"
         )
 
-@router.post("/send-contacts", response_model=MessageResponse)
+@router.post("/send-upload", response_model=BulkEnqueueResponse, status_code=status.HTTP_202_ACCEPTED,
+             dependencies=[Depends(api_rate_limit)])
+async def send_sms_upload(
+    file: UploadFile = File(..., description="CSV (coluna phone/telefone/numero ou primeira coluna) ou NDJSON"),
+    message: str = Form(...),
+    priority: int = Form(0),
+    scheduled_for: Optional[datetime] = Form(None),
+    name: Optional[str] = Form(None),
+    db: Session = Depends(get_db)
+):
+    """
+    Enviar SMS para os números de um ficheiro CSV/NDJSON.
+    Devolve logo o id da campanha; os números são inseridos na fila em background.
+    """
+    tmp_path = None
+    try:
+        filename = (file.filename or "").lower()
+        file_format = "ndjson" if (
+            filename.endswith((".ndjson", ".jsonl")) or "ndjson" in (file.content_type or "")
+        ) else "csv"
+        
+        # Copiar o upload por blocos para um ficheiro temporário (o UploadFile fecha com o pedido)
+        with tempfile.NamedTemporaryFile(delete=False, suffix=f".{file_format}") as tmp:
+            tmp_path = tmp.name
+            while True:
+                chunk = await file.read(1024 * 1024)
+                if not chunk:
+                    break
+                tmp.write(chunk)
+        
+        bulk_service = BulkEnqueueService()
+        campaign = bulk_service.create_campaign(db, message, priority, scheduled_for, name=name or file.filename)
+        bulk_service.enqueue_file_in_background(campaign.id, tmp_path, file_format)
+        tmp_path = None  # A importação em background apaga o ficheiro no fim
+        
+        return BulkEnqueueResponse(
+            message=f"Campanha {campaign.id} criada - destinatários a ser adicionados à fila",
+            success=True,
+            campaign_id=campaign.id,
+            status=campaign.status.value
+        )
+        
+    except Exception as e:
+        logger.error(f"Erro ao importar ficheiro de destinatários: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Erro ao importar ficheiro de destinatários"
+        )
+    finally:
+        if tmp_path:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+
+@router.get("/campaigns/{campaign_id}", response_model=CampaignResponse)
+async def get_campaign(campaign_id: int, db: Session = Depends(get_db)):
+    """Obter estado de uma campanha"""
+    campaign = db.query(Campaign).filter(Campaign.id == campaign_id).first()
+    if not campaign:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Campanha não encontrada"
+        )
+    return _campaign_response(campaign)
+
+@router.get("/campaigns", response_model=List[CampaignResponse])
+async def list_campaigns(limit: int = 20, db: Session = Depends(get_db)):
+    """Listar campanhas mais recentes com progresso"""
+    campaigns = db.query(Campaign).order_by(Campaign.id.desc()).limit(limit).all()
+    return [_campaign_response(campaign) for campaign in campaigns]
+
+def _campaign_response(campaign: Campaign) -> CampaignResponse:
+    """Progresso da campanha (contadores da própria linha) com débito e ETA"""
+    response = CampaignResponse.from_orm(campaign)
+    throughput = CampaignService.throughput(campaign)
+    response.sms_per_minute = throughput["sms_per_minute"]
+    response.eta_seconds = throughput["eta_seconds"]
+    return response
+
+@router.post("/send-contacts", response_model=BulkEnqueueResponse, status_code=status.HTTP_202_ACCEPTED,
+             dependencies=[Depends(api_rate_limit)])
 async def send_sms_to_contacts(
     contact_data: SMSContactCreate,
     db: Session = Depends(get_db)
@@ -173,25 +276,19 @@ async def send_sms_to_contacts(
                 detail="Nenhum número de telefone encontrado nos contactos/grupos selecionados"
             )
         
-        # Adicionar SMS à fila
-        total_added = 0
-        for phone in phone_numbers:
-            logger.info(f"Adicionando SMS à fila para: {phone}")
-            queue_item = SMSQueue(
-                phone_to=phone,
-                message=contact_data.message,
-                priority=contact_data.priority or 0,
-                scheduled_for=contact_data.scheduled_for
-            )
-            db.add(queue_item)
-            total_added += 1
-        
-        db.commit()
-        logger.info(f"Total de {total_added} SMS adicionados à fila")
-        
-        return MessageResponse(
-            message=f"{total_added} SMS adicionados à fila de envio para contactos/grupos selecionados",
-            success=True
+        # Adicionar SMS à fila (inserções em bloco numa campanha, em background)
+        bulk_service = BulkEnqueueService()
+        campaign = bulk_service.create_campaign(
+            db, contact_data.message, contact_data.priority, contact_data.scheduled_for
+        )
+        bulk_service.enqueue_in_background(campaign.id, phone_numbers)
+        logger.info(f"Campanha {campaign.id}: {len(phone_numbers)} números a adicionar à fila")
+        
+        return BulkEnqueueResponse(
+            message=f"Campanha {campaign.id} criada - {len(phone_numbers)} números dos contactos/grupos selecionados a ser adicionados à fila",
+            success=True,
+            campaign_id=campaign.id,
+            status=campaign.status.value
         )
         
     except HTTPException:
@@ -261,8 +358,13 @@ async def receive_sms_webhook(
 
 @router.get("/status/{sms_id}", response_model=SMSResponseSchema)
 async def get_sms_status(sms_id: int, db: Session = Depends(get_db)):
-    """Obter status de um SMS específico"""
+    """Obter status de um SMS específico (também dos já arquivados)"""
     sms = db.query(SMS).filter(SMS.id == sms_id).first()
+    if not sms:
+        from app.services.archive_service import archive_service
+        archived = archive_service.sms_archive(db)
+        if archived is not None:
+            sms = db.execute(select(archived).where(archived.c.id == sms_id)).first()
     if not sms:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -298,6 +400,59 @@ async def update_sms_status(
         success=True
     )
 
+def _sms_dict(sms) -> dict:
+    """SMS (ou linha do arquivo) no formato das listagens"""
+    return {
+        'id': sms.id,
+        'phone_from': sms.phone_from or '',
+        'phone_to': sms.phone_to or '',
+        'message': sms.message or '',
+        'status': sms.status.value if sms.status else 'unknown',
+        'direction': sms.direction.value if sms.direction else 'unknown',
+        'created_at': sms.created_at.isoformat() if sms.created_at else '',
+        'sent_at': sms.sent_at.isoformat() if sms.sent_at else '',
+        'received_at': sms.created_at.isoformat() if sms.direction == SMSDirection.INBOUND and sms.created_at else '',
+        'external_id': sms.external_id or '',
+        'error_message': sms.error_message or ''
+    }
+
+@router.get("/search")
+async def search_sms(
+    q: str,
+    limit: int = 20,
+    direction: Optional[str] = None,
+    db: Session = Depends(get_db)
+):
+    """
+    Pesquisar SMS pelo texto da mensagem, por ordem de relevância
+    Cada palavra de q é procurada como prefixo ("pag" encontra "pagamento").
+    """
+    try:
+        query = db.query(SMS)
+        if direction == "inbound":
+            query = query.filter(SMS.direction == SMSDirection.INBOUND)
+        elif direction == "outbound":
+            query = query.filter(SMS.direction == SMSDirection.OUTBOUND)
+        
+        sms_list = sms_search.ranked(query, q, db.get_bind()).limit(limit).all()
+        sms_data = [_sms_dict(sms) for sms in sms_list]
+        
+        return {
+            'success': True,
+            'data': sms_data,
+            'total': len(sms_data),
+            'message': f'{len(sms_data)} SMS encontrados para "{q}"'
+        }
+    
+    except Exception as e:
+        logger.error(f"Erro ao pesquisar SMS: {str(e)}")
+        return {
+            'success': False,
+            'data': [],
+            'total': 0,
+            'message': f'Erro ao pesquisar SMS: {str(e)}'
+        }
+
 @router.get("/list")
 async def get_sms_list(
     limit: int = 50,
@@ -307,71 +462,91 @@ async def get_sms_list(
     sender: Optional[str] = None,
     recipient: Optional[str] = None,
     message: Optional[str] = None,
+    include_archived: bool = False,
+    cursor: Optional[str] = None,
+    include_total: bool = True,
     db: Session = Depends(get_db)
 ):
-    """Obter lista de SMS com filtros"""
+    """
+    Obter lista de SMS com filtros (include_archived: incluir as SMS já arquivadas)
+    Paginação por cursor: passar o next_cursor da resposta anterior; offset continua
+    aceite (compatibilidade) mas custa tanto mais quanto mais funda a página.
+    include_total=false evita a contagem; com true o total fica em cache alguns segundos.
+    """
     try:
         query = db.query(SMS)
+        columns = SMS
+        
+        if include_archived:
+            from app.services.archive_service import archive_service
+            archived = archive_service.sms_archive(db)
+            if archived is not None:
+                # Tabela quente + arquivo com as mesmas colunas; os filtros aplicam-se ao conjunto
+                columns = union_all(select(*SMS.__table__.columns), select(*archived.c)).subquery().c
+                query = db.query(*columns)
         
         # Aplicar filtros
         if direction:
             if direction == "inbound":
-                query = query.filter(SMS.direction == SMSDirection.INBOUND)
+                query = query.filter(columns.direction == SMSDirection.INBOUND)
             elif direction == "outbound":
-                query = query.filter(SMS.direction == SMSDirection.OUTBOUND)
+                query = query.filter(columns.direction == SMSDirection.OUTBOUND)
         
         if status:
             if status == "pending":
-                query = query.filter(SMS.status == SMSStatus.PENDING)
+                query = query.filter(columns.status == SMSStatus.PENDING)
             elif status == "sent":
-                query = query.filter(SMS.status == SMSStatus.SENT)
+                query = query.filter(columns.status == SMSStatus.SENT)
             elif status == "delivered":
-                query = query.filter(SMS.status == SMSStatus.DELIVERED)
+                query = query.filter(columns.status == SMSStatus.DELIVERED)
             elif status == "failed":
-                query = query.filter(SMS.status == SMSStatus.FAILED)
+                query = query.filter(columns.status == SMSStatus.FAILED)
             elif status == "received":
-                query = query.filter(SMS.status == SMSStatus.RECEIVED)
+                query = query.filter(columns.status == SMSStatus.RECEIVED)
         
         if sender:
-            query = query.filter(SMS.phone_from.contains(sender))
+            query = query.filter(columns.phone_from.contains(sender))
             
         if recipient:
-            query = query.filter(SMS.phone_to.contains(recipient))
+            query = query.filter(columns.phone_to.contains(recipient))
         
         if message:
-            query = query.filter(SMS.message.contains(message))
-        
-        # Contar total antes da paginação
-        total_count = query.count()
-        
-        # Ordenar por data mais recente e aplicar paginação
-        sms_list = query.order_by(SMS.created_at.desc()).offset(offset).limit(limit).all()
+            if columns is SMS:
+                query = sms_search.filter(query, message, db.get_bind())
+            else:
+                # O arquivo não tem índice de texto: pesquisa por substring no conjunto
+                query = query.filter(columns.message.contains(message))
+        
+        # Total (opcional) reaproveitado enquanto os filtros forem os mesmos
+        total_count = None
+        if include_total:
+            count_key = ("list", direction, status, sender, recipient, message, include_archived)
+            total_count = list_count_cache.get(count_key, query.count)
+        
+        # Ordenar por data mais recente: a seguir ao cursor ou, no modo antigo, com OFFSET
+        sms_list, next_cursor = keyset_page(
+            query, columns.created_at, columns.id, limit, cursor, db.get_bind().dialect.name, offset
+        )
         
         # Converter para dict para JSON
-        sms_data = []
-        for sms in sms_list:
-            sms_data.append({
-                'id': sms.id,
-                'phone_from': sms.phone_from or '',
-                'phone_to': sms.phone_to or '',
-                'message': sms.message or '',
-                'status': sms.status.value if sms.status else 'unknown',
-                'direction': sms.direction.value if sms.direction else 'unknown',
-                'created_at': sms.created_at.isoformat() if sms.created_at else '',
-                'sent_at': sms.sent_at.isoformat() if sms.sent_at else '',
-                'received_at': sms.created_at.isoformat() if sms.direction == SMSDirection.INBOUND and sms.created_at else '',
-                'external_id': sms.external_id or '',
-                'error_message': sms.error_message or ''
-            })
+        sms_data = [_sms_dict(sms) for sms in sms_list]
         
         return {
             'success': True,
             'data': sms_data,
             'total': len(sms_data),
             'total_count': total_count,
-            'message': f'{len(sms_data)} SMS encontrados de {total_count} total'
+            'next_cursor': next_cursor,
+            'has_more': next_cursor is not None,
+            'message': (
+                f'{len(sms_data)} SMS encontrados de {total_count} total'
+                if total_count is not None else f'{len(sms_data)} SMS encontrados'
+            )
         }
     
+    except ValueError as e:
+        # Cursor inválido ("status" aqui é o filtro, não fastapi.status)
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         logger.error(f"Erro ao listar SMS: {str(e)}")
         return {
@@ -407,33 +582,48 @@ async def delete_sms(sms_id: int, db: Session = Depends(get_db)):
             'message': f'Erro ao excluir SMS: {str(e)}'
         }
 
+def _paginate_sms(query, response: Response, limit: int, offset: int, cursor: Optional[str], db: Session):
+    """Página por cursor ou, com offset, pelo modo antigo; a seguinte vai no cabeçalho X-Next-Cursor"""
+    try:
+        sms_list, next_cursor = keyset_page(
+            query, SMS.created_at, SMS.id, limit, cursor, db.get_bind().dialect.name, offset
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return sms_list
+
 @router.get("/inbox", response_model=List[SMSResponseSchema])
 async def get_inbox(
+    response: Response,
     limit: int = 50,
     offset: int = 0,
+    cursor: Optional[str] = None,
     db: Session = Depends(get_db)
 ):
-    """Obter SMS recebidos (inbox)"""
-    sms_list = db.query(SMS).filter(
-        SMS.direction == SMSDirection.INBOUND
-    ).order_by(SMS.created_at.desc()).offset(offset).limit(limit).all()
+    """Obter SMS recebidos (inbox); a página seguinte vem no cabeçalho X-Next-Cursor"""
+    query = db.query(SMS).filter(SMS.direction == SMSDirection.INBOUND)
+    sms_list = _paginate_sms(query, response, limit, offset, cursor, db)
     
     return [SMSResponseSchema.from_orm(sms) for sms in sms_list]
 
 @router.get("/outbox", response_model=List[SMSResponseSchema])
 async def get_outbox(
+    response: Response,
     limit: int = 50,
     offset: int = 0,
+    cursor: Optional[str] = None,
     status_filter: Optional[str] = None,
     db: Session = Depends(get_db)
 ):
-    """Obter SMS enviados (outbox)"""
+    """Obter SMS enviados (outbox); a página seguinte vem no cabeçalho X-Next-Cursor"""
     query = db.query(SMS).filter(SMS.direction == SMSDirection.OUTBOUND)
     
     if status_filter:
         query = query.filter(SMS.status == status_filter)
     
-    sms_list = query.order_by(SMS.created_at.desc()).offset(offset).limit(limit).all()
+    sms_list = _paginate_sms(query, response, limit, offset, cursor, db)
     
     return [SMSResponseSchema.from_orm(sms) for sms in sms_list]
 
@@ -446,9 +636,8 @@ async def get_queue_status(db: Session = Depends(get_db)):
         # Status do processador
         processor_status = queue_processor.get_queue_status()
         
-        # Status da base de dados
-        total_pending = db.query(SMSQueue).filter(SMSQueue.processed == False).count()
-        total_processed = db.query(SMSQueue).filter(SMSQueue.processed == True).count()
+        # Status da base de dados (contadores da fila)
+        totals = StatsService.queue_totals(db)
         
         next_scheduled = db.query(SMSQueue.scheduled_for).filter(
             SMSQueue.processed == False,
@@ -456,10 +645,13 @@ async def get_queue_status(db: Session = Depends(get_db)):
         ).order_by(SMSQueue.scheduled_for.asc()).first()
         
         return QueueStatusResponse(
-            total_pending=total_pending,
-            total_processed=total_processed,
+            total_pending=totals["pending"],
+            total_processed=totals["processed"],
             next_scheduled=next_scheduled[0] if next_scheduled else None,
-            processor_running=processor_status.get("is_running", False)
+            processor_running=processor_status.get("is_running", False),
+            pending_segments=processor_status.get("pending_segments"),
+            segments_per_minute=processor_status.get("segments_per_minute"),
+            eta_seconds=processor_status.get("eta_seconds")
         )
     
     except Exception as e:
@@ -471,41 +663,33 @@ async def get_queue_status(db: Session = Depends(get_db)):
             processor_running=False
         )
 
+@router.get("/rate-limits")
+async def get_rate_limits():
+    """Limites de taxa ativos e decisões (permitidas/limitadas) por âmbito"""
+    return rate_limiter.get_stats()
+
 @router.get("/stats", response_model=DashboardStats)
-async def get_dashboard_stats(db: Session = Depends(get_db)):
-    """Obter estatísticas para o dashboard"""
-    total_sent = db.query(SMS).filter(
-        SMS.direction == SMSDirection.OUTBOUND,
-        SMS.status.in_([SMSStatus.SENT, SMSStatus.DELIVERED])
-    ).count()
-    
-    total_received = db.query(SMS).filter(
-        SMS.direction == SMSDirection.INBOUND
-    ).count()
-    
-    total_pending = db.query(SMS).filter(
-        SMS.status == SMSStatus.PENDING
-    ).count()
-    
-    total_failed = db.query(SMS).filter(
-        SMS.status == SMSStatus.FAILED
-    ).count()
-    
-    total_outbound = db.query(SMS).filter(
-        SMS.direction == SMSDirection.OUTBOUND
-    ).count()
-    
-    success_rate = (total_sent / total_outbound * 100) if total_outbound > 0 else 0
+async def get_dashboard_stats(
+    date_from: Optional[datetime] = None,
+    date_to: Optional[datetime] = None,
+    db: Session = Depends(get_db)
+):
+    """
+    Obter estatísticas para o dashboard
+    Sem intervalo lê os contadores mantidos a cada envio; com date_from/date_to
+    faz uma única contagem agrupada por estado e direção.
+    """
+    stats = StatsService.dashboard(db, date_from, date_to)
     
     commands_active = db.query(SMSCommand).filter(
         SMSCommand.is_active == True
     ).count()
     
     return DashboardStats(
-        total_sms_sent=total_sent,
-        total_sms_received=total_received,
-        total_sms_pending=total_pending,
-        total_sms_failed=total_failed,
-        success_rate=round(success_rate, 2),
+        total_sms_sent=stats["sent"],
+        total_sms_received=stats["received"],
+        total_sms_pending=stats["pending"],
+        total_sms_failed=stats["failed"],
+        success_rate=stats["success_rate"],
         commands_active=commands_active
     )
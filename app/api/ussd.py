@@ -4,6 +4,7 @@ from sqlalchemy.orm import Session
 from app.db.database import get_db
 from app.api.schemas import USSDRequest, USSDResponse, USSDHistoryResponse, MessageResponse
 from app.services.ussd_service import USSDService
+from app.services.rate_limiter import ussd_rate_limit
 import logging
 
 router = APIRouter()
@@ -57,7 +58,7 @@ async def ussd_page(request: Request):
             detail="Erro interno do servidor"
         )
 
-@router.post("/api/send-simple", response_model=USSDResponse)
+@router.post("/api/send-simple", response_model=USSDResponse, dependencies=[Depends(ussd_rate_limit)])
 async def send_ussd_simple(
     ussd_request: USSDRequest,
     db: Session = Depends(get_db)
@@ -84,7 +85,7 @@ async def send_ussd_simple(
             detail=f"Erro interno: {str(e)}"
         )
 
-@router.post("/api/send", response_model=USSDResponse)
+@router.post("/api/send", response_model=USSDResponse, dependencies=[Depends(ussd_rate_limit)])
 async def send_ussd(
     ussd_request: USSDRequest,
     db: Session = Depends(get_db)
@@ -3,6 +3,7 @@ from sqlalchemy.orm import Session
 from app.db.database import get_db
 from app.api.schemas_ussd_session import USSDSessionStartRequest, USSDSessionReplyRequest, USSDSessionResponse
 from app.services.ussd_service import USSDService
+from app.services.rate_limiter import ussd_rate_limit
 import logging
 
 router = APIRouter()
@@ -14,7 +15,7 @@ ussd_sessions = {}
 def get_ussd_service():
     return USSDService()
 
-@router.post("/ussd/api/session/start", response_model=USSDSessionResponse)
+@router.post("/ussd/api/session/start", response_model=USSDSessionResponse, dependencies=[Depends(ussd_rate_limit)])
 async def start_ussd_session(
     req: USSDSessionStartRequest,
     db: Session = Depends(get_db)
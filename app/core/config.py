@@ -20,15 +20,29 @@ class Settings(BaseSettings):
     GSM_TIMEOUT: int = 10  # Timeout em segundos
     GSM_PIN: Optional[str] = None  # PIN do cartão SIM (se necessário)
     GSM_SMSC: Optional[str] = None  # Centro de mensagens SMS (será detectado automaticamente)
+    GSM_SMS_MODE: str = "TEXT"  # "TEXT" (AT+CMGF=1) ou "PDU" (AT+CMGF=0: acentos/emoji via UCS-2, contagem exata de segmentos)
     
     # Configurações de Monitoramento
     GSM_CHECK_INTERVAL: int = 30  # Intervalo para verificar conexão (segundos)
     GSM_AUTO_DETECT: bool = True  # Detecção automática de porta
     GSM_PREFERRED_PORTS: list = ["COM4", "COM6", "COM5", "COM1", "COM3", "COM2"]  # Portas preferenciais (Qualcomm primeiro)
+    GSM_FINGERPRINT_CACHE: str = "modem_fingerprints.json"  # Cache de modems conhecidos (vazio = sem persistência)
+    GSM_HOTPLUG_ENABLED: bool = True  # Reagir à ligação/remoção de modems USB (Linux: udev ou /sys/class/tty)
+    GSM_HOTPLUG_INTERVAL: float = 0.5  # Intervalo de verificação de /sys/class/tty sem pyudev (segundos)
+    
+    # Pool de modems (vários SIMs para envio)
+    GSM_POOL_ENABLED: bool = False  # Usar vários modems para envio
+    GSM_POOL_PORTS: list = []  # Portas do pool (vazio = todos os modems detetados)
+    GSM_POOL_STRATEGY: str = "operator"  # "operator" (on-net primeiro), "least_loaded" ou "round_robin"
     
     # Redis (Filas)
     REDIS_URL: str = "redis://localhost:6379/0"
     
+    # Limitação de taxa (RATE_LIMIT_* de shared/constants por modem, utilizador e destino)
+    RATE_LIMIT_ENABLED: bool = True
+    RATE_LIMIT_BACKEND: str = "memory"  # "memory" ou "redis" (REDIS_URL, partilhado entre processos)
+    RATE_LIMIT_MAX_WAIT: int = 30  # Espera máxima por fichas num envio antes de o dar como limitado (segundos)
+    
     # Segurança
     SECRET_KEY: str = "sua_chave_secreta_muito_forte_aqui_mude_em_producao"
     ALGORITHM: str = "HS256"
@@ -41,8 +55,33 @@ class Settings(BaseSettings):
     
     # Configurações de SMS
     SMS_CHECK_INTERVAL: int = 30  # Intervalo para verificar SMS recebidas (segundos)
+    SMS_RECONCILE_INTERVAL: int = 300  # Varredura completa (AT+CMGL) quando há notificações +CMTI (segundos)
     SMS_MAX_RETRIES: int = 3  # Máximo de tentativas para envio
-    SMS_RETRY_DELAY: int = 60  # Delay entre tentativas (segundos)
+    SMS_RETRY_DELAY: int = 60  # Delay entre tentativas (segundos; dobra a cada tentativa falhada)
+    SMS_RETRY_MAX_DELAY: int = 3600  # Teto do atraso exponencial entre tentativas (segundos)
+    CAMPAIGN_IMPORT_STALL_SECONDS: int = 300  # Campanha em importação sem novos itens há X segundos = importação interrompida
+    
+    # Arquivo de linhas frias (tabelas mensais; partições nativas no PostgreSQL)
+    # Opcional: as SMS arquivadas só aparecem em /list?include_archived=true, em /status/{id}
+    # e nos totais de sempre; inbox/outbox, /search e /stats com datas leem só a tabela quente
+    ARCHIVE_ENABLED: bool = False
+    ARCHIVE_INTERVAL: int = 3600  # Intervalo entre ciclos de arquivo (segundos)
+    ARCHIVE_BATCH_SIZE: int = 1000  # Linhas movidas por transação
+    ARCHIVE_QUEUE_AFTER_DAYS: int = 7  # Itens processados da fila saem da tabela quente após X dias
+    ARCHIVE_SMS_AFTER_DAYS: int = 90  # SMS em estado final saem da tabela quente após X dias
+    ARCHIVE_RETENTION_MONTHS: int = 0  # Meses guardados no arquivo (0 = sem limite)
+    
+    # Ritmo de envio adaptativo por modem (AIMD guiado por +CMS ERROR e latência do SMSC)
+    SMS_PACING_ENABLED: bool = True
+    SMS_PACING_INITIAL_RATE: float = 20  # SMS/minuto no arranque
+    SMS_PACING_MIN_RATE: float = 1  # Piso sob congestionamento
+    SMS_PACING_MAX_RATE: float = 60  # Teto em condições normais
+    SMS_PACING_INCREASE: float = 1  # SMS/minuto a mais por envio bem-sucedido
+    SMS_PACING_DECREASE: float = 0.5  # Fator aplicado ao ritmo em cada sinal de congestionamento
+    SMS_PACING_LATENCY_TARGET: float = 10  # Tempo até +CMGS acima do qual a rede é considerada congestionada (segundos)
+    
+    # Paginação das listas de SMS (cursor sobre created_at, id)
+    PAGINATION_COUNT_CACHE_TTL: int = 30  # Segundos durante os quais o total de uma lista é reaproveitado
     
     class Config:
         env_file = ".env"
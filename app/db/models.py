@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Text, DateTime, Boolean, ForeignKey, Enum
+from sqlalchemy import Column, Integer, BigInteger, String, Text, DateTime, Boolean, ForeignKey, Enum, Index, false
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from app.db.database import Base
@@ -16,6 +16,13 @@ class SMSDirection(enum.Enum):
     INBOUND = "inbound"       # SMS recebido
     OUTBOUND = "outbound"     # SMS enviado
 
+class CampaignStatus(enum.Enum):
+    IMPORTING = "importing"    # Destinatários a ser inseridos na fila
+    QUEUED = "queued"          # Todos os destinatários na fila
+    RUNNING = "running"        # Envio em curso
+    COMPLETED = "completed"    # Todos os itens processados
+    FAILED = "failed"          # Importação interrompida
+
 class SMS(Base):
     """Tabela principal para armazenar todas as mensagens SMS"""
     __tablename__ = "sms"
@@ -39,6 +46,9 @@ class SMS(Base):
     # IDs externos (do provedor de SMS)
     external_id = Column(String(100), nullable=True, unique=True)
     
+    # Deduplicação de SMS recebidos (remetente + SCTS + hash do conteúdo)
+    dedupe_key = Column(String(64), nullable=True, unique=True)
+    
     # Informações adicionais
     error_message = Column(Text, nullable=True)
     retry_count = Column(Integer, default=0)
@@ -47,9 +57,76 @@ class SMS(Base):
     responses = relationship("SMSResponse", back_populates="original_sms", foreign_keys="SMSResponse.original_sms_id")
     response_to = relationship("SMSResponse", back_populates="response_sms", foreign_keys="SMSResponse.response_sms_id")
     
+    __table_args__ = (
+        # Paginação por cursor: listas ordenadas por (created_at, id), com ou sem filtro de direção
+        Index("ix_sms_created_at_id", created_at, id),
+        Index("ix_sms_direction_created_at_id", direction, created_at, id),
+    )
+    
     def __repr__(self):
         return f"<SMS(id={self.id}, from={self.phone_from}, to={self.phone_to}, status={self.status})>"
 
+class SMSPart(Base):
+    """Segmentos de SMS concatenados recebidos, guardados até a mensagem ficar completa"""
+    __tablename__ = "sms_parts"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    
+    # Identificação da mensagem concatenada (UDH)
+    phone_from = Column(String(20), nullable=False, index=True)
+    reference = Column(Integer, nullable=False)
+    total = Column(Integer, nullable=False)
+    sequence = Column(Integer, nullable=False)
+    
+    # Conteúdo do segmento
+    message = Column(Text, nullable=False)
+    sent_timestamp = Column(String(30), nullable=True)  # SCTS do segmento
+    dedupe_key = Column(String(64), nullable=False, unique=True)
+    
+    # SMS montado (NULL enquanto faltarem segmentos)
+    sms_id = Column(Integer, ForeignKey("sms.id"), nullable=True, index=True)
+    
+    # Timestamps
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    
+    def __repr__(self):
+        return f"<SMSPart(from={self.phone_from}, ref={self.reference}, {self.sequence}/{self.total})>"
+
+class Campaign(Base):
+    """Envio em massa: agrupa os itens da fila criados por um mesmo pedido"""
+    __tablename__ = "campaigns"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    name = Column(String(100), nullable=True)
+    
+    # Mensagem e parâmetros comuns a todos os destinatários
+    message = Column(Text, nullable=False)
+    priority = Column(Integer, default=0)
+    scheduled_for = Column(DateTime(timezone=True), nullable=True)
+    
+    # Importação dos destinatários
+    status = Column(Enum(CampaignStatus), default=CampaignStatus.IMPORTING, index=True)
+    recipients_total = Column(Integer, default=0)  # Itens inseridos na fila
+    rejected = Column(Integer, default=0)  # Números inválidos ou repetidos
+    error_message = Column(Text, nullable=True)
+    
+    # Progresso (atualizado item a item pelo processador da fila)
+    sent = Column(Integer, default=0)
+    failed = Column(Integer, default=0)
+    
+    # Timestamps
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    started_at = Column(DateTime(timezone=True), nullable=True)  # Primeiro item processado
+    finished_at = Column(DateTime(timezone=True), nullable=True)  # Último item processado
+    
+    def __repr__(self):
+        return f"<Campaign(id={self.id}, recipients={self.recipients_total}, status={self.status})>"
+    
+    @property
+    def pending(self):
+        """Itens da campanha ainda por processar"""
+        return max(0, (self.recipients_total or 0) - (self.sent or 0) - (self.failed or 0))
+
 class SMSQueue(Base):
     """Fila de SMS para envio em massa"""
     __tablename__ = "sms_queue"
@@ -68,15 +145,49 @@ class SMSQueue(Base):
     processed = Column(Boolean, default=False, index=True)
     processed_at = Column(DateTime(timezone=True), nullable=True)
     
+    # Concessão (lease): worker que reclamou o item e até quando (expirada = item livre de novo)
+    lease_owner = Column(String(64), nullable=True)
+    lease_expires_at = Column(DateTime(timezone=True), nullable=True)
+    
+    # Campanha de origem (NULL para itens avulsos)
+    campaign_id = Column(Integer, ForeignKey("campaigns.id"), nullable=True, index=True)
+    
     # Relacionamento com SMS enviado
     sms_id = Column(Integer, ForeignKey("sms.id"), nullable=True)
     
     # Timestamps
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     
+    # Índices parciais da fila por enviar (ver migrations/add_sms_queue_due_indexes.py):
+    # - sem agendamento: já na ordem de envio (prioridade desc, mais antigos primeiro)
+    # - agendados: por hora, para ler só os que já venceram
+    __table_args__ = (
+        Index(
+            "ix_sms_queue_due_unscheduled", priority.desc(), created_at, id,
+            postgresql_where=(processed == false()) & scheduled_for.is_(None),
+            sqlite_where=(processed == false()) & scheduled_for.is_(None)
+        ),
+        Index(
+            "ix_sms_queue_due_scheduled", scheduled_for,
+            postgresql_where=(processed == false()) & scheduled_for.isnot(None),
+            sqlite_where=(processed == false()) & scheduled_for.isnot(None)
+        ),
+    )
+    
     def __repr__(self):
         return f"<SMSQueue(id={self.id}, to={self.phone_to}, processed={self.processed})>"
 
+class StatCounter(Base):
+    """Contador agregado mantido incrementalmente (ver app/services/stats_service.py)"""
+    __tablename__ = "stat_counters"
+    
+    metric = Column(String(32), primary_key=True)  # "sms" ou "sms_queue"
+    key = Column(String(64), primary_key=True)  # ex: "outbound:sent", "pending"
+    value = Column(BigInteger, nullable=False, default=0)
+    
+    def __repr__(self):
+        return f"<StatCounter({self.metric}.{self.key}={self.value})>"
+
 class SMSCommand(Base):
     """Comandos automáticos para resposta a SMS"""
     __tablename__ = "sms_commands"
@@ -0,0 +1,244 @@
+"""
+Arquivo de SMS e de itens processados da fila
+Linhas frias saem das tabelas quentes (sms, sms_queue) para tabelas de arquivo
+mensais, em lotes pequenos (um commit por lote, sem bloquear a tabela inteira):
+- PostgreSQL: sms_archive / sms_queue_archive particionadas por mês (RANGE), com uma
+  partição sms_archive_AAAA_MM por mês criada a pedido;
+- SQLite: tabelas mensais sms_archive_AAAA_MM independentes, lidas em conjunto com UNION ALL.
+Apagar um mês inteiro do arquivo (retenção) é um DROP TABLE, não um DELETE.
+"""
+import re
+import threading
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional
+
+from sqlalchemy import Column, Index, MetaData, Table, delete, exists, inspect, select, union_all
+
+from app.core.config import settings
+from app.db.database import Base, SessionLocal, engine
+from app.db.models import SMS, SMSQueue, SMSStatus
+
+logger = logging.getLogger(__name__)
+
+# Estados finais: SMS pendentes nunca saem da tabela quente
+ARCHIVABLE_STATUSES = (SMSStatus.SENT, SMSStatus.DELIVERED, SMSStatus.FAILED, SMSStatus.RECEIVED)
+
+
+def _month_start(value: datetime) -> datetime:
+    """Primeiro instante (UTC, sem fuso) do mês de value"""
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def _next_month(month: datetime) -> datetime:
+    return (month + timedelta(days=32)).replace(day=1)
+
+
+class ArchiveTarget:
+    """Par tabela quente → arquivo mensal, particionado pela coluna de data indicada"""
+
+    def __init__(self, source: Table, name: str, date_column: str):
+        self.source = source
+        self.name = name
+        self.date_column = date_column
+        self.metadata = MetaData()
+        self._month_pattern = re.compile(rf"^{name}_(\d{{4}})_(\d{{2}})$")
+        self._tables: Dict[str, Table] = {}
+        self.parent = self._table(name, partitioned=True) if engine.dialect.name == "postgresql" else None
+
+    def _table(self, table_name: str, partitioned: bool = False) -> Table:
+        """Cópia das colunas da tabela quente, sem chaves nem restrições (o arquivo só recebe cópias)"""
+        columns = [Column(column.name, column.type.copy()) for column in self.source.columns]
+        kwargs = {"postgresql_partition_by": f"RANGE ({self.date_column})"} if partitioned else {}
+        table = Table(table_name, self.metadata, *columns, **kwargs)
+        # No PostgreSQL os índices da tabela-mãe passam para cada partição
+        Index(f"ix_{table_name}_id", table.c.id)
+        Index(f"ix_{table_name}_{self.date_column}", table.c[self.date_column])
+        return table
+
+    def month_table_name(self, month: datetime) -> str:
+        return f"{self.name}_{month:%Y_%m}"
+
+    def month_tables(self, connection) -> List[str]:
+        """Tabelas (ou partições) mensais existentes, da mais antiga para a mais recente"""
+        names = [name for name in inspect(connection).get_table_names() if self._month_pattern.match(name)]
+        return sorted(names)
+
+    def ensure_month(self, connection, month: datetime) -> Table:
+        """Criar (se preciso) a tabela/partição do mês e devolver a tabela onde inserir"""
+        table_name = self.month_table_name(month)
+        if self.parent is not None:
+            self.parent.create(connection, checkfirst=True)
+            start, end = month, _next_month(month)
+            connection.exec_driver_sql(
+                f"CREATE TABLE IF NOT EXISTS {table_name} PARTITION OF {self.name} "
+                f"FOR VALUES FROM ('{start:%Y-%m-%d} 00:00:00+00') TO ('{end:%Y-%m-%d} 00:00:00+00')"
+            )
+            return self.parent
+
+        table = self._tables.get(table_name)
+        if table is None:
+            table = self._tables[table_name] = self._table(table_name)
+        table.create(connection, checkfirst=True)
+        return table
+
+    def readable(self, connection):
+        """Selectable com todas as linhas arquivadas (None se o arquivo estiver vazio)"""
+        names = self.month_tables(connection)
+        if not names:
+            return None
+        if self.parent is not None:
+            return self.parent
+        selects = []
+        for table_name in names:
+            table = self._tables.get(table_name)
+            if table is None:
+                table = self._tables[table_name] = self._table(table_name)
+            selects.append(select(*table.columns))
+        return selects[0].subquery() if len(selects) == 1 else union_all(*selects).subquery()
+
+    def month_of_table(self, table_name: str) -> Optional[datetime]:
+        match = self._month_pattern.match(table_name)
+        return datetime(int(match.group(1)), int(match.group(2)), 1) if match else None
+
+
+class ArchiveService:
+    """Arquivo periódico, em lotes, das linhas frias de sms e sms_queue"""
+
+    def __init__(self, batch_size: Optional[int] = None):
+        self.batch_size = batch_size or settings.ARCHIVE_BATCH_SIZE
+        self.sms = ArchiveTarget(SMS.__table__, "sms_archive", "created_at")
+        self.queue = ArchiveTarget(SMSQueue.__table__, "sms_queue_archive", "processed_at")
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def archive_queue(self, older_than_days: Optional[int] = None) -> int:
+        """Mover itens processados da fila há mais de X dias"""
+        days = settings.ARCHIVE_QUEUE_AFTER_DAYS if older_than_days is None else older_than_days
+        cutoff = datetime.utcnow() - timedelta(days=days)
+        return self._move(self.queue, (
+            SMSQueue.processed == True,
+            SMSQueue.processed_at.isnot(None),
+            SMSQueue.processed_at < cutoff,
+        ))
+
+    def archive_sms(self, older_than_days: Optional[int] = None) -> int:
+        """Mover SMS em estado final criados há mais de X dias e sem referências de outras tabelas"""
+        days = settings.ARCHIVE_SMS_AFTER_DAYS if older_than_days is None else older_than_days
+        cutoff = datetime.utcnow() - timedelta(days=days)
+        conditions = [
+            SMS.status.in_(ARCHIVABLE_STATUSES),
+            SMS.created_at.isnot(None),
+            SMS.created_at < cutoff,
+        ]
+        # Respostas, reencaminhamentos, fila e segmentos apontam para sms.id: essas linhas ficam
+        for table in Base.metadata.sorted_tables:
+            for foreign_key in table.foreign_keys:
+                if foreign_key.column is SMS.__table__.c.id:
+                    conditions.append(~exists().where(foreign_key.parent == SMS.id))
+        return self._move(self.sms, conditions)
+
+    def _move(self, target: ArchiveTarget, conditions) -> int:
+        """Copiar e apagar em lotes de batch_size (cada lote é uma transação curta)"""
+        source = target.source
+        date_column = source.c[target.date_column]
+        moved = 0
+        while not self._stop.is_set():
+            db = SessionLocal()
+            try:
+                batch = db.execute(
+                    select(source.c.id, date_column).where(*conditions).order_by(source.c.id).limit(self.batch_size)
+                ).all()
+                if not batch:
+                    break
+
+                by_month: Dict[datetime, List[int]] = {}
+                for row_id, date_value in batch:
+                    by_month.setdefault(_month_start(date_value), []).append(row_id)
+
+                connection = db.connection()
+                for month, ids in by_month.items():
+                    archive = target.ensure_month(connection, month)
+                    db.execute(archive.insert().from_select(
+                        [column.name for column in source.columns],
+                        select(*source.columns).where(source.c.id.in_(ids))
+                    ))
+                db.execute(delete(source).where(source.c.id.in_([row_id for row_id, _ in batch])))
+                db.commit()
+                moved += len(batch)
+
+                if len(batch) < self.batch_size:
+                    break
+            except Exception as e:
+                logger.error(f"Erro ao arquivar {source.name}: {str(e)}")
+                db.rollback()
+                break
+            finally:
+                db.close()
+
+        if moved:
+            logger.info(f"🗄️ {moved} linhas de {source.name} movidas para {target.name}")
+        return moved
+
+    def drop_expired(self, retention_months: Optional[int] = None) -> List[str]:
+        """Apagar meses do arquivo além da retenção (0 = guardar tudo)"""
+        months = settings.ARCHIVE_RETENTION_MONTHS if retention_months is None else retention_months
+        if not months:
+            return []
+        oldest_kept = _month_start(datetime.utcnow())
+        for _ in range(months - 1):
+            oldest_kept = (oldest_kept - timedelta(days=1)).replace(day=1)
+
+        dropped = []
+        try:
+            with engine.begin() as connection:
+                for target in (self.sms, self.queue):
+                    for table_name in target.month_tables(connection):
+                        if target.month_of_table(table_name) < oldest_kept:
+                            connection.exec_driver_sql(f"DROP TABLE {table_name}")
+                            target._tables.pop(table_name, None)
+                            dropped.append(table_name)
+        except Exception as e:
+            logger.error(f"Erro ao aplicar a retenção do arquivo: {str(e)}")
+        if dropped:
+            logger.info(f"🗑️ Meses apagados do arquivo: {', '.join(dropped)}")
+        return dropped
+
+    def run_once(self) -> Dict[str, int]:
+        """Um ciclo completo: fila primeiro (liberta referências a sms), depois SMS e retenção"""
+        result = {"sms_queue": self.archive_queue(), "sms": self.archive_sms()}
+        result["dropped_months"] = len(self.drop_expired())
+        return result
+
+    def sms_archive(self, db):
+        """Selectable das SMS arquivadas (mesmas colunas que sms) ou None"""
+        return self.sms.readable(db.connection())
+
+    def start(self, interval: Optional[int] = None):
+        """Arquivar periodicamente numa thread própria"""
+        if self._thread and self._thread.is_alive():
+            return
+        interval = interval or settings.ARCHIVE_INTERVAL
+        self._stop.clear()
+
+        def run():
+            while not self._stop.wait(interval):
+                try:
+                    self.run_once()
+                except Exception as e:
+                    logger.error(f"Erro no ciclo de arquivo: {str(e)}")
+
+        self._thread = threading.Thread(target=run, name="archive", daemon=True)
+        self._thread.start()
+        logger.info(f"🗄️ Arquivo de SMS ativo (a cada {interval}s)")
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+
+archive_service = ArchiveService()
@@ -0,0 +1,230 @@
+"""
+Inserção em massa na fila de SMS
+Os destinatários são normalizados e inseridos por blocos com um único INSERT
+(executemany) por bloco, sem criar um objeto ORM por número. Ficheiros CSV/NDJSON
+são lidos linha a linha: nunca se carrega o ficheiro inteiro em memória.
+"""
+import csv
+import json
+import os
+import threading
+import logging
+from datetime import datetime
+from typing import Iterable, Iterator, Optional, TextIO, Tuple
+
+from sqlalchemy import insert
+
+from app.db.database import SessionLocal
+from app.db.models import Campaign, CampaignStatus, SMSQueue
+from app.services.campaign_service import CampaignService
+from app.services.operator_routing import normalize_number
+from app.services.stats_service import QUEUE_METRIC, QUEUE_PENDING, QUEUE_PENDING_SEGMENTS, StatsService
+from app.utils.pdu import count_segments
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 1000  # Linhas por INSERT
+
+# Colunas aceites como número de telefone num CSV com cabeçalho
+PHONE_COLUMNS = ("phone", "phone_to", "telefone", "numero", "número", "number", "msisdn")
+
+
+def normalize_recipient(raw) -> Optional[str]:
+    """Número em formato internacional ou None se inválido (8 a 15 dígitos)"""
+    if raw is None:
+        return None
+    phone = normalize_number(str(raw).strip())
+    digits = phone.lstrip("+")
+    if not digits.isdigit() or not 8 <= len(digits) <= 15:
+        return None
+    return phone
+
+
+def iter_csv_recipients(lines: Iterable[str]) -> Iterator[str]:
+    """Números de um CSV: coluna de telefone do cabeçalho ou, sem cabeçalho, a primeira coluna"""
+    reader = csv.reader(lines)
+    column = 0
+    for row_number, row in enumerate(reader):
+        if not row:
+            continue
+        if row_number == 0:
+            header = [cell.strip().lower() for cell in row]
+            match = next((name for name in PHONE_COLUMNS if name in header), None)
+            if match is not None:
+                column = header.index(match)
+                continue
+            if normalize_recipient(row[0]) is None:
+                continue  # Cabeçalho sem nome conhecido
+        if column < len(row):
+            yield row[column]
+
+
+def iter_ndjson_recipients(lines: Iterable[str]) -> Iterator[str]:
+    """Números de NDJSON: uma string ou um objeto com campo de telefone por linha"""
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            value = json.loads(line)
+        except ValueError:
+            yield line  # Linha sem JSON: contará como rejeitada se não for um número
+            continue
+        if isinstance(value, dict):
+            value = next((value[name] for name in PHONE_COLUMNS if name in value), None)
+        yield value
+
+
+# Campanhas a ser importadas neste processo (as restantes em IMPORTING podem ter parado)
+_active_imports = set()
+_active_lock = threading.Lock()
+
+
+class BulkEnqueueService:
+    """Criação de campanhas e inserção dos destinatários na fila"""
+
+    def __init__(self, chunk_size: int = CHUNK_SIZE):
+        self.chunk_size = chunk_size
+
+    def create_campaign(self, db, message: str, priority: int = 0,
+                        scheduled_for: Optional[datetime] = None, name: Optional[str] = None) -> Campaign:
+        campaign = Campaign(
+            name=name,
+            message=message,
+            priority=priority or 0,
+            scheduled_for=scheduled_for,
+            status=CampaignStatus.IMPORTING
+        )
+        db.add(campaign)
+        db.commit()
+        db.refresh(campaign)
+        return campaign
+
+    def enqueue(self, campaign_id: int, phones: Iterable) -> Tuple[int, int]:
+        """
+        Inserir os destinatários da campanha na fila, bloco a bloco.
+        Cada bloco é confirmado (e o processador acordado) assim que inserido,
+        para o envio começar enquanto a importação continua.
+
+        Returns:
+            (inseridos, rejeitados)
+        """
+        from app.services.queue_processor import queue_processor
+
+        with _active_lock:
+            _active_imports.add(campaign_id)
+        db = SessionLocal()
+        inserted = rejected = 0
+        try:
+            campaign = db.query(Campaign).filter(Campaign.id == campaign_id).first()
+            if campaign is None:
+                logger.error(f"Campanha {campaign_id} não encontrada")
+                return 0, 0
+
+            template = {
+                "message": campaign.message,
+                "priority": campaign.priority or 0,
+                "scheduled_for": campaign.scheduled_for,
+                "campaign_id": campaign.id,
+                "processed": False,
+            }
+            segments = count_segments(campaign.message or "")
+            seen = set()
+            chunk = []
+
+            def flush():
+                db.execute(insert(SMSQueue), chunk)
+                # INSERT em massa não passa pelos eventos do ORM: contadores atualizados aqui
+                StatsService.increment(db, {
+                    (QUEUE_METRIC, QUEUE_PENDING): len(chunk),
+                    (QUEUE_METRIC, QUEUE_PENDING_SEGMENTS): len(chunk) * segments,
+                })
+                campaign.recipients_total = inserted
+                campaign.rejected = rejected
+                db.commit()
+                chunk.clear()
+                queue_processor.notify(campaign.scheduled_for)
+
+            for raw in phones:
+                phone = normalize_recipient(raw)
+                if phone is None or phone in seen:
+                    rejected += 1
+                    continue
+                seen.add(phone)
+                chunk.append(dict(template, phone_to=phone))
+                inserted += 1
+                if len(chunk) >= self.chunk_size:
+                    flush()
+
+            if chunk:
+                flush()
+            campaign.recipients_total = inserted
+            campaign.rejected = rejected
+            CampaignService.mark_imported(db, campaign)
+            db.commit()
+
+            logger.info(f"📥 Campanha {campaign_id}: {inserted} SMS na fila, {rejected} números rejeitados")
+            return inserted, rejected
+
+        except Exception as e:
+            logger.error(f"Erro ao inserir destinatários da campanha {campaign_id}: {str(e)}")
+            db.rollback()
+            self._mark_failed(db, campaign_id, str(e))
+            return inserted, rejected
+        finally:
+            db.close()
+            with _active_lock:
+                _active_imports.discard(campaign_id)
+
+    @staticmethod
+    def active_imports() -> set:
+        """Ids das campanhas com importação em curso neste processo"""
+        with _active_lock:
+            return set(_active_imports)
+
+    def enqueue_in_background(self, campaign_id: int, phones: Iterable) -> threading.Thread:
+        """Inserir os destinatários numa thread (o pedido devolve logo o id da campanha)"""
+        thread = threading.Thread(
+            target=self.enqueue, args=(campaign_id, phones), name=f"campaign-import-{campaign_id}", daemon=True
+        )
+        thread.start()
+        return thread
+
+    def enqueue_file_in_background(self, campaign_id: int, path: str, file_format: str) -> threading.Thread:
+        """Importar um ficheiro temporário (CSV ou NDJSON) numa thread; o ficheiro é apagado no fim"""
+        def run():
+            try:
+                with open(path, "r", encoding="utf-8-sig", newline="") as f:
+                    self.enqueue(campaign_id, self.iter_file(f, file_format))
+            except Exception as e:
+                logger.error(f"Erro ao importar ficheiro da campanha {campaign_id}: {str(e)}")
+                db = SessionLocal()
+                try:
+                    self._mark_failed(db, campaign_id, str(e))
+                finally:
+                    db.close()
+            finally:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+        thread = threading.Thread(target=run, name=f"campaign-import-{campaign_id}", daemon=True)
+        thread.start()
+        return thread
+
+    @staticmethod
+    def iter_file(f: TextIO, file_format: str) -> Iterator[str]:
+        if file_format == "ndjson":
+            return iter_ndjson_recipients(f)
+        return iter_csv_recipients(f)
+
+    @staticmethod
+    def _mark_failed(db, campaign_id: int, error: str):
+        """Falhar a campanha e retirar da fila o que ainda não foi enviado (os blocos já confirmados)"""
+        try:
+            CampaignService.fail(db, campaign_id, error)
+            db.commit()
+        except Exception as e:
+            logger.error(f"Erro ao marcar campanha {campaign_id} como falhada: {str(e)}")
+            db.rollback()
@@ -0,0 +1,141 @@
+"""
+Progresso das campanhas de envio em massa
+Os contadores vivem na linha da campanha e são incrementados atomicamente pelo
+processador da fila, na mesma transação que marca o item como processado:
+consultar o progresso é uma leitura por chave primária, sem contagens sobre a fila.
+"""
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Collection, Dict, Optional
+
+from sqlalchemy import func
+
+from app.db.models import Campaign, CampaignStatus, SMSQueue
+from app.utils.pdu import count_segments
+
+logger = logging.getLogger(__name__)
+
+
+class CampaignService:
+    """Atualização e leitura dos contadores de campanha"""
+
+    @staticmethod
+    def record_result(db, campaign_id: int, success: bool):
+        """Contar um item processado (o commit fica a cargo de quem chama)"""
+        now = datetime.utcnow()
+        counter = Campaign.sent if success else Campaign.failed
+        db.query(Campaign).filter(Campaign.id == campaign_id).update({
+            counter: counter + 1,
+            Campaign.started_at: func.coalesce(Campaign.started_at, now),
+        }, synchronize_session=False)
+        db.query(Campaign).filter(
+            Campaign.id == campaign_id,
+            Campaign.status == CampaignStatus.QUEUED
+        ).update({Campaign.status: CampaignStatus.RUNNING}, synchronize_session=False)
+        CampaignService.finish_if_done(db, campaign_id, now)
+
+    @staticmethod
+    def mark_imported(db, campaign: Campaign):
+        """Fim da importação: a fila tem todos os destinatários (o envio pode já ir a meio)"""
+        campaign.status = CampaignStatus.RUNNING if campaign.started_at else CampaignStatus.QUEUED
+        db.flush()
+        CampaignService.finish_if_done(db, campaign.id)
+
+    @staticmethod
+    def finish_if_done(db, campaign_id: int, now: Optional[datetime] = None):
+        """Concluir a campanha quando todos os itens estiverem processados"""
+        db.query(Campaign).filter(
+            Campaign.id == campaign_id,
+            Campaign.status.in_([CampaignStatus.QUEUED, CampaignStatus.RUNNING]),
+            Campaign.sent + Campaign.failed >= Campaign.recipients_total
+        ).update({
+            Campaign.status: CampaignStatus.COMPLETED,
+            Campaign.finished_at: now or datetime.utcnow()
+        }, synchronize_session=False)
+
+    @staticmethod
+    def fail(db, campaign_id: int, error: str) -> int:
+        """
+        Marcar a campanha como falhada e retirar da fila os itens que ainda não foram tentados.
+        Itens com concessão válida (a ser enviados) ou já tentados (novas tentativas agendadas)
+        seguem o seu curso e continuam a contar em sent/failed; recipients_total passa a ser
+        o que ficou na fila. O commit fica a cargo de quem chama.
+
+        Returns:
+            Número de itens retirados da fila
+        """
+        from app.services.stats_service import QUEUE_METRIC, QUEUE_PENDING, QUEUE_PENDING_SEGMENTS, StatsService
+
+        campaign = db.query(Campaign).filter(Campaign.id == campaign_id).first()
+        if campaign is None:
+            return 0
+        now = datetime.utcnow()
+        cancelled = db.query(SMSQueue).filter(
+            SMSQueue.campaign_id == campaign_id,
+            SMSQueue.processed == False,
+            SMSQueue.sms_id.is_(None),
+            (SMSQueue.lease_owner.is_(None)) | (SMSQueue.lease_expires_at < now)
+        ).delete(synchronize_session=False)
+        if cancelled:
+            # DELETE em massa não passa pelos eventos do ORM: contadores atualizados aqui
+            StatsService.increment(db, {
+                (QUEUE_METRIC, QUEUE_PENDING): -cancelled,
+                (QUEUE_METRIC, QUEUE_PENDING_SEGMENTS): -cancelled * count_segments(campaign.message or ""),
+            })
+        campaign.status = CampaignStatus.FAILED
+        campaign.error_message = error
+        campaign.recipients_total = max(0, (campaign.recipients_total or 0) - cancelled)
+        logger.warning(f"⛔ Campanha {campaign_id} falhada ({error}): {cancelled} SMS retirados da fila")
+        return cancelled
+
+    @staticmethod
+    def fail_stalled_imports(db, stall_seconds: float, active: Collection[int] = ()) -> int:
+        """
+        Falhar as campanhas presas em IMPORTING: a thread de importação morreu (reinício ou
+        deploy a meio) e o ficheiro temporário já não existe. Uma importação viva insere um
+        bloco a cada instante; sem campanha nova nem itens inseridos há stall_seconds, parou.
+        active: campanhas a importar neste processo (nunca falhadas aqui).
+        """
+        threshold = datetime.utcnow() - timedelta(seconds=stall_seconds)
+        failed = 0
+        for campaign in db.query(Campaign).filter(Campaign.status == CampaignStatus.IMPORTING).all():
+            if campaign.id in active:
+                continue
+            last_insert = db.query(func.max(SMSQueue.created_at)).filter(
+                SMSQueue.campaign_id == campaign.id
+            ).scalar()
+            last_activity = max(
+                (_naive_utc(moment) for moment in (campaign.created_at, last_insert) if moment is not None),
+                default=None
+            )
+            if last_activity is not None and last_activity > threshold:
+                continue
+            CampaignService.fail(db, campaign.id, "Importação interrompida (processo reiniciado a meio)")
+            failed += 1
+        if failed:
+            db.commit()
+        return failed
+
+    @staticmethod
+    def throughput(campaign: Campaign) -> Dict[str, Optional[float]]:
+        """Débito (SMS/minuto) desde o primeiro envio e tempo estimado até ao fim"""
+        done = (campaign.sent or 0) + (campaign.failed or 0)
+        if not campaign.started_at or not done:
+            return {"sms_per_minute": None, "eta_seconds": None}
+
+        started_at = campaign.started_at
+        now = datetime.now(timezone.utc) if started_at.tzinfo else datetime.utcnow()
+        elapsed = ((campaign.finished_at or now) - started_at).total_seconds()
+        sms_per_minute = done * 60 / max(elapsed, 1)
+
+        eta_seconds = None
+        if campaign.status != CampaignStatus.COMPLETED:
+            eta_seconds = int(campaign.pending * 60 / sms_per_minute)
+        return {"sms_per_minute": round(sms_per_minute, 2), "eta_seconds": eta_seconds}
+
+
+def _naive_utc(moment: datetime) -> datetime:
+    """Datas com fuso (PostgreSQL) em UTC sem fuso, como as do SQLite"""
+    if moment.tzinfo is not None:
+        return moment.astimezone(timezone.utc).replace(tzinfo=None)
+    return moment
@@ -1,19 +1,38 @@
 import serial
 import time
 import re
+import queue
+import random
 import threading
-from typing import List, Dict, Optional, Tuple
+from typing import Callable, Collection, List, Dict, Optional, Tuple
 from datetime import datetime
 import logging
 from app.core.config import settings
 from app.services.modem_detector import ModemDetector
+from app.services.send_pacing import SendPacer, parse_cms_error
+from app.services.serial_reader import SerialReader
+from app.services.urc_dispatcher import URCDispatcher
+from app.utils.pdu import (
+    ENCODING_GSM7, PDUError, PDU_STATUS, build_concat_udh, decode_pdu,
+    detect_encoding, encode_submit, split_message
+)
+from shared.constants import MAX_SMS_PARTS
+from shared.sms import message_too_long
+
+# Modos de SMS (AT+CMGF)
+SMS_MODE_TEXT = "TEXT"
+SMS_MODE_PDU = "PDU"
 
 logger = logging.getLogger(__name__)
 
 class GSMModem:
     """Classe para comunicação com modem GSM via comandos AT"""
     
-    def __init__(self, port=None):
+    def __init__(self, port=None, sms_mode: Optional[str] = None, auto_detect: bool = True,
+                 excluded_ports: Optional[Callable[[], Collection[str]]] = None):
+        # Portas que a redeteção nunca pode tomar (as dos outros modems do pool)
+        self.excluded_ports: Callable[[], Collection[str]] = excluded_ports or (lambda: ())
+        
         # Usar porta especificada ou detectar automaticamente
         if port:
             self.port = port
@@ -24,7 +43,7 @@ class GSMModem:
         else:
             # Detecção automática robusta
             detector = ModemDetector()
-            result = detector.detect_gsm_modem_robust()
+            result = detector.detect_gsm_modem_robust(exclude=self.excluded_ports())
             modem_info = result['found']
             self.port = modem_info['port'] if modem_info else None
             if self.port:
@@ -39,22 +58,42 @@ class GSMModem:
                 except Exception as e:
                     logger.error(f"Erro ao disparar alerta de falha de modem: {e}")
         
+        # Modems do pool ficam presos à sua porta (sem redeteção para outra porta)
+        self.auto_detect = auto_detect
         self.baudrate = settings.GSM_BAUDRATE
         self.timeout = settings.GSM_TIMEOUT
         self.pin = settings.GSM_PIN
         self.connection = None
         self.is_connected = False
         self.phone_number = None
+        self.operator_name: Optional[str] = None
         self.smsc = settings.GSM_SMSC
+        self.sms_mode = (sms_mode or settings.GSM_SMS_MODE).upper()
+        self._cmgf_mode = self.sms_mode  # AT+CMGF em vigor no modem (muda durante envios PDU em modo texto)
+        self.network_registered: Optional[bool] = None
+        self.sms_notifications_enabled = False  # +CMTI/+CMT ativos (AT+CNMI com <mt> != 0)
+        self._supports_delete_flags: Optional[bool] = None  # AT+CMGD=<i>,<delflag> (detetado sob pedido)
+        self._concat_reference = random.randint(0, 255)  # Referência do próximo SMS concatenado
+        self.pacer = SendPacer()  # Ritmo de envio adaptado à resposta da operadora
+        self._reader: Optional[SerialReader] = None
+        
+        # URCs (+CMTI, +CDS, +CUSD, +CREG) publicados para os subscritores
+        self.urc = URCDispatcher(context=lambda: {"sms_mode": self._cmgf_mode})
+        self._ussd_responses: queue.Queue = queue.Queue()
+        self.urc.subscribe("CUSD", self._ussd_responses.put)
+        self.urc.subscribe("CREG", self._on_network_registration)
         
     def connect(self) -> bool:
         """Conectar ao modem GSM com detecção automática"""
         try:
             # Se a porta não foi detectada, tentar detecção novamente
+            if not self.port and not self.auto_detect:
+                logger.error("❌ Modem sem porta definida")
+                return False
             if not self.port:
                 logger.info("🔍 [ROBUST] Tentando detecção automática do modem...")
                 detector = ModemDetector()
-                result = detector.detect_gsm_modem_robust()
+                result = detector.detect_gsm_modem_robust(exclude=self.excluded_ports())
                 modem_info = result['found']
                 if modem_info:
                     self.port = modem_info['port']
@@ -69,11 +108,14 @@ class GSMModem:
             import serial.tools.list_ports
             available_ports = [port.device for port in serial.tools.list_ports.comports()]
             
+            if self.port not in available_ports and not self.auto_detect:
+                logger.error(f"❌ Porta {self.port} não encontrada")
+                return False
             if self.port not in available_ports:
                 logger.warning(f"⚠️ Porta {self.port} não encontrada. Tentando nova detecção robusta...")
                 # Tentar detectar novamente (robusto)
                 detector = ModemDetector()
-                result = detector.detect_gsm_modem_robust()
+                result = detector.detect_gsm_modem_robust(exclude=self.excluded_ports())
                 modem_info = result['found']
                 if modem_info:
                     self.port = modem_info['port']
@@ -82,18 +124,26 @@ class GSMModem:
                     logger.error(f"❌ [ROBUST] Porta {self.port} não encontrada. Portas disponíveis: {available_ports}")
                     return False
             
+            # Libertar leitor/porta de uma ligação anterior
+            self._stop_reader()
+            
+            # Acesso exclusivo: nenhuma sonda ou outro GSMModem abre a mesma porta em paralelo
             self.connection = serial.Serial(
                 port=self.port,
                 baudrate=self.baudrate,
                 timeout=self.timeout,
                 bytesize=serial.EIGHTBITS,
                 parity=serial.PARITY_NONE,
-                stopbits=serial.STOPBITS_ONE
+                stopbits=serial.STOPBITS_ONE,
+                exclusive=True
             )
             
             # Aguardar um pouco para o modem inicializar
             time.sleep(2)
             
+            # Leitor dedicado: as respostas chegam por evento, sem polling
+            self._start_reader()
+            
             # Testar comunicação básica
             if self._send_command("AT"):
                 logger.info("Comunicação com modem estabelecida")
@@ -120,52 +170,97 @@ class GSMModem:
     def disconnect(self):
         """Desconectar do modem GSM"""
         if self.connection and self.connection.is_open:
+            self._stop_reader()
             self.connection.close()
             self.is_connected = False
             logger.info("Conexão com modem GSM encerrada")
     
+    def mark_offline(self):
+        """Porta removida (hot-plug): libertar o leitor e marcar offline sem esperar pelo health check"""
+        try:
+            self._stop_reader()
+            if self.connection and self.connection.is_open:
+                self.connection.close()
+        except Exception as e:
+            logger.debug(f"Erro ao fechar porta removida {self.port}: {e}")
+        self.is_connected = False
+        logger.warning(f"🔌 Modem {self.port} removido - marcado como offline")
+    
+    def _start_reader(self):
+        """Iniciar thread de leitura dedicada para a porta atual"""
+        self._stop_reader()
+        self._reader = SerialReader(
+            self.connection,
+            on_unsolicited=self.urc.feed,
+            is_unsolicited=self.urc.claims,
+            on_result=self._on_command_result
+        )
+        self._reader.start()
+    
+    def _stop_reader(self):
+        """Parar thread de leitura (fecha a porta para desbloquear a leitura)"""
+        if self._reader:
+            reader = self._reader
+            self._reader = None
+            if reader.connection and reader.connection.is_open:
+                reader.connection.close()
+            reader.stop()
+    
+    def _drain_ussd_responses(self):
+        """Descartar respostas +CUSD pendentes de sessões anteriores"""
+        while True:
+            try:
+                self._ussd_responses.get_nowait()
+            except queue.Empty:
+                return
+    
+    def _on_network_registration(self, event: dict):
+        """Acompanhar registo na rede (+CREG: <stat>[,<lac>,<ci>])"""
+        params = event["params"]
+        # Com AT+CREG=1 o URC traz apenas <stat>; a resposta a AT+CREG? traz <n>,<stat>
+        stat = params[0] if params else ""
+        registered = stat in ("1", "5")  # 1 = rede própria, 5 = roaming
+        if registered != self.network_registered:
+            if registered:
+                logger.info(f"📶 Modem registado na rede ({'roaming' if stat == '5' else 'rede própria'})")
+            else:
+                logger.warning(f"📵 Modem sem registo na rede (estado {stat})")
+        self.network_registered = registered
+    
+    def _on_command_result(self, command: Optional[str], final: str):
+        """Acompanhar o AT+CMGF aceite pelo modem (thread de leitura, antes dos URCs seguintes)"""
+        match = re.fullmatch(r"AT\+CMGF=([01])", (command or "").strip(), re.IGNORECASE)
+        if match and final == "OK":
+            self._cmgf_mode = SMS_MODE_PDU if match.group(1) == "0" else SMS_MODE_TEXT
+    
+    def _reader_ready(self) -> bool:
+        return bool(self.connection and self.connection.is_open and self._reader and self._reader.is_running)
+    
     def _send_command(self, command: str, wait_for: str = "OK", timeout: int = None) -> bool:
         """Enviar comando AT para o modem"""
-        if not self.connection or not self.connection.is_open:
+        if not self._reader_ready():
             return False
         
         timeout = timeout or self.timeout
         
         try:
-            # Limpar buffer de entrada
-            self.connection.reset_input_buffer()
-            
-            # Enviar comando
-            full_command = command + "\r\n"
-            self.connection.write(full_command.encode())
+            response = self._reader.execute(command, timeout, expect_prompt=(wait_for == ">"))
             
-            # Aguardar resposta
-            start_time = time.time()
-            response = ""
+            if response.timed_out:
+                logger.warning(f"Timeout no comando '{command}'. Resposta: {response.text}")
+                return False
             
-            while time.time() - start_time < timeout:
-                if self.connection.in_waiting > 0:
-                    response += self.connection.read(self.connection.in_waiting).decode('utf-8', errors='ignore')
-                    
-                    if wait_for in response:
-                        logger.debug(f"✅ Comando '{command}' executado com sucesso")
-                        return True
-                    elif "ERROR" in response:
-                        # Extrair código de erro específico se possível
-                        error_info = response.strip()
-                        if "+CMS ERROR:" in error_info:
-                            error_code = error_info.split("+CMS ERROR:")[-1].strip()
-                            logger.warning(f"⚠️ Comando '{command}' retornou CMS ERROR {error_code}")
-                        elif "+CME ERROR:" in error_info:
-                            error_code = error_info.split("+CME ERROR:")[-1].strip()
-                            logger.warning(f"⚠️ Comando '{command}' retornou CME ERROR {error_code}")
-                        else:
-                            logger.warning(f"⚠️ Comando '{command}' retornou erro: {error_info}")
-                        return False
-                
-                time.sleep(0.1)
+            if response.success and (response.is_prompt or wait_for in response.text):
+                logger.debug(f"✅ Comando '{command}' executado com sucesso")
+                return True
             
-            logger.warning(f"Timeout no comando '{command}'. Resposta: {response}")
+            # Extrair código de erro específico se possível
+            if response.final.startswith("+CMS ERROR:"):
+                logger.warning(f"⚠️ Comando '{command}' retornou CMS ERROR {response.error_code}")
+            elif response.final.startswith("+CME ERROR:"):
+                logger.warning(f"⚠️ Comando '{command}' retornou CME ERROR {response.error_code}")
+            else:
+                logger.warning(f"⚠️ Comando '{command}' retornou erro: {response.text}")
             return False
             
         except Exception as e:
@@ -174,33 +269,13 @@ class GSMModem:
     
     def _get_command_response(self, command: str, timeout: int = None) -> str:
         """Enviar comando e retornar resposta completa"""
-        if not self.connection or not self.connection.is_open:
+        if not self._reader_ready():
             return ""
         
         timeout = timeout or self.timeout
         
         try:
-            # Limpar buffer
-            self.connection.reset_input_buffer()
-            
-            # Enviar comando
-            full_command = command + "\r\n"
-            self.connection.write(full_command.encode())
-            
-            # Coletar resposta
-            start_time = time.time()
-            response = ""
-            
-            while time.time() - start_time < timeout:
-                if self.connection.in_waiting > 0:
-                    response += self.connection.read(self.connection.in_waiting).decode('utf-8', errors='ignore')
-                
-                if "OK" in response or "ERROR" in response:
-                    break
-                    
-                time.sleep(0.1)
-            
-            return response.strip()
+            return self._reader.execute(command, timeout).text.strip()
             
         except Exception as e:
             logger.error(f"Erro ao obter resposta do comando '{command}': {str(e)}")
@@ -212,6 +287,7 @@ class GSMModem:
             logger.info("🔄 Tentando reconexão automática do modem...")
             
             # Fechar conexão atual se existir
+            self._stop_reader()
             if self.connection and self.connection.is_open:
                 self.connection.close()
             
@@ -219,7 +295,7 @@ class GSMModem:
             
             # Detectar nova porta do modem (robusto)
             detector = ModemDetector()
-            result = detector.detect_gsm_modem_robust()
+            result = detector.detect_gsm_modem_robust(exclude=self.excluded_ports())
             modem_info = result['found']
             if modem_info:
                 old_port = self.port
@@ -243,7 +319,7 @@ class GSMModem:
     def check_connection_health(self) -> bool:
         """Verifica se a conexão com o modem está saudável"""
         try:
-            if not self.connection or not self.connection.is_open:
+            if not self._reader_ready():
                 return False
             
             # Enviar comando AT simples
@@ -257,11 +333,13 @@ class GSMModem:
         """Configurar modem para operação SMS com compatibilidade melhorada"""
         try:
             logger.info("🔧 Inicializando configurações do modem...")
+            self.sms_notifications_enabled = False
+            self._supports_delete_flags = None
             
             # Comandos básicos essenciais
             essential_commands = [
                 ("ATE0", "Desabilitar eco"),
-                ("AT+CMGF=1", "Modo texto para SMS"),
+                ("AT+CMGF=0", "Modo PDU para SMS") if self.pdu_mode else ("AT+CMGF=1", "Modo texto para SMS"),
             ]
             
             # Comandos opcionais (podem falhar em alguns modems)
@@ -269,6 +347,7 @@ class GSMModem:
                 ("AT+CMEE=1", "Habilitar códigos de erro detalhados"),
                 ("AT+CSCS=\"GSM\"", "Conjunto de caracteres GSM"),
                 ("AT+CPMS=\"SM\",\"SM\",\"SM\"", "Armazenamento SMS no SIM"),
+                ("AT+CREG=1", "Notificação de registo na rede"),
                 ("AT+CNMI=2,1,0,1,0", "Notificação de SMS recebidos (modo 1)"),
                 ("AT+CNMI=1,1,0,1,0", "Notificação de SMS recebidos (modo 2)"),
                 ("AT+CNMI=2,2,0,1,0", "Notificação de SMS recebidos (modo 3)"),
@@ -290,13 +369,14 @@ class GSMModem:
                     # Se CNMI funcionou, parar de tentar outros modos
                     if "CNMI" in cmd:
                         logger.info(f"📨 Notificações SMS configuradas: {cmd}")
+                        self.sms_notifications_enabled = self._cnmi_notifies(cmd)
                         break
                 else:
                     logger.warning(f"⚠️ Comando opcional falhou (ignorado): {cmd}")
                 time.sleep(0.5)
             
             # Tentar configuração alternativa de notificações se nenhuma funcionou
-            if not self._configure_sms_notifications():
+            if not self.sms_notifications_enabled and not self._configure_sms_notifications():
                 logger.warning("⚠️ Notificações SMS não puderam ser configuradas - modo polling será usado")
             
             # Verificar PIN se necessário
@@ -305,6 +385,7 @@ class GSMModem:
             
             # Obter informações do modem
             self._get_modem_info()
+            self._get_operator()
             
             # Obter centro de mensagens se não configurado
             if not self.smsc:
@@ -317,6 +398,10 @@ class GSMModem:
             logger.error(f"Erro na inicialização do modem: {str(e)}")
             return False
     
+    @property
+    def pdu_mode(self) -> bool:
+        return self.sms_mode == SMS_MODE_PDU
+    
     def _configure_sms_notifications(self) -> bool:
         """Configurar notificações SMS com múltiplas tentativas"""
         logger.info("📨 Tentando configurar notificações SMS...")
@@ -333,12 +418,19 @@ class GSMModem:
             logger.debug(f"Tentando: {cnmi_cmd}")
             if self._send_command(cnmi_cmd):
                 logger.info(f"✅ Notificações SMS configuradas com: {cnmi_cmd}")
+                self.sms_notifications_enabled = self._cnmi_notifies(cnmi_cmd)
                 return True
             time.sleep(0.5)
         
         logger.warning("⚠️ Nenhuma configuração de notificação SMS funcionou")
         return False
     
+    @staticmethod
+    def _cnmi_notifies(cnmi_cmd: str) -> bool:
+        """Verificar se o AT+CNMI ativa indicação de novas mensagens (<mt> = 1 ou 2)"""
+        params = cnmi_cmd.split("=", 1)[1].split(",")
+        return len(params) > 1 and params[1] in ("1", "2")
+    
     def _check_pin(self) -> bool:
         """Verificar e inserir PIN se necessário"""
         try:
@@ -384,6 +476,17 @@ class GSMModem:
         except Exception as e:
             logger.error(f"Erro ao obter informações do modem: {str(e)}")
     
+    def _get_operator(self):
+        """Obter operadora da rede registada (AT+COPS?, formato alfanumérico)"""
+        try:
+            response = self._get_command_response("AT+COPS?")
+            match = re.search(r'\+COPS:\s*\d+,\d+,"([^"]+)"', response)
+            if match:
+                self.operator_name = match.group(1)
+                logger.info(f"📶 Operadora: {self.operator_name}")
+        except Exception as e:
+            logger.error(f"Erro ao obter operadora: {str(e)}")
+    
     def _get_smsc(self):
         """Obter centro de mensagens SMS"""
         try:
@@ -399,8 +502,8 @@ class GSMModem:
             logger.error(f"Erro ao obter SMSC: {str(e)}")
     
     def send_sms(self, phone_number: str, message: str) -> Dict[str, any]:
-        """Enviar SMS"""
-        if not self.is_connected:
+        """Enviar SMS (mensagens longas seguem como SMS concatenado com UDH)"""
+        if not self.is_connected or not self._reader_ready():
             return {"success": False, "error": "Modem não conectado"}
         
         try:
@@ -409,84 +512,317 @@ class GSMModem:
             # Formatar número se necessário
             formatted_number = self._format_phone_number(phone_number)
             
-            # Comando para iniciar envio de SMS
-            if not self._send_command(f'AT+CMGS="{formatted_number}"', wait_for=">", timeout=10):
-                return {"success": False, "error": "Falha ao iniciar envio de SMS"}
+            encoding = detect_encoding(message)
+            segments = split_message(message, encoding)
             
-            # Enviar mensagem seguida de Ctrl+Z (ASCII 26)
-            message_with_end = message + chr(26)
-            self.connection.write(message_with_end.encode('utf-8', errors='ignore'))
+            # Limite em partes na codificação real (todos os envios passam por aqui: v1, fila, pool)
+            if len(segments) > MAX_SMS_PARTS:
+                too_long = message_too_long(message)
+                logger.error(f"SMS para {phone_number} recusado: {too_long}")
+                return {"success": False, "error": too_long, "permanent": True}
             
-            # Aguardar confirmação (pode demorar mais)
-            start_time = time.time()
-            response = ""
+            # Modo texto só serve para mensagens simples no alfabeto GSM
+            needs_pdu = len(segments) > 1 or encoding != ENCODING_GSM7
             
-            while time.time() - start_time < 30:  # 30 segundos para envio
-                if self.connection.in_waiting > 0:
-                    response += self.connection.read(self.connection.in_waiting).decode('utf-8', errors='ignore')
+            # Todos os segmentos formam uma única transação na porta
+            with self._reader.lock:
+                if not self.pdu_mode and needs_pdu:
+                    # Mudar temporariamente para PDU (acentos fora do GSM, emoji, concatenação)
+                    if not self._send_command("AT+CMGF=0"):
+                        return {"success": False, "error": "Modem não aceita modo PDU (AT+CMGF=0)"}
+                    try:
+                        return self._send_pdu_segments(formatted_number, segments, encoding)
+                    finally:
+                        self._send_command("AT+CMGF=1")
                 
-                if "+CMGS:" in response:
-                    # Extrair ID da mensagem
-                    match = re.search(r'\+CMGS:\s*(\d+)', response)
-                    message_id = match.group(1) if match else None
-                    
-                    logger.info(f"SMS enviado com sucesso. ID: {message_id}")
-                    return {
-                        "success": True, 
-                        "message_id": message_id,
-                        "status": "sent"
-                    }
-                elif "ERROR" in response:
-                    logger.error(f"Erro ao enviar SMS: {response}")
-                    return {"success": False, "error": response}
+                if self.pdu_mode:
+                    return self._send_pdu_segments(formatted_number, segments, encoding)
                 
-                time.sleep(0.1)
-            
-            logger.error("Timeout ao enviar SMS")
-            return {"success": False, "error": "Timeout no envio"}
+                return self._submit(f'AT+CMGS="{formatted_number}"', message)
             
+        except PDUError as e:
+            logger.error(f"Mensagem não pode ser codificada em PDU: {str(e)}")
+            return {"success": False, "error": str(e), "permanent": True}
         except Exception as e:
             logger.error(f"Erro ao enviar SMS: {str(e)}")
             return {"success": False, "error": str(e)}
     
+    def _send_pdu_segments(self, number: str, segments: List[str], encoding: str) -> Dict[str, any]:
+        """Enviar segmentos em PDU, com UDH de concatenação quando há mais do que um"""
+        total = len(segments)
+        reference = self._next_concat_reference() if total > 1 else None
+        message_ids = []
+        
+        for sequence, segment in enumerate(segments, start=1):
+            udh = build_concat_udh(reference, total, sequence) if reference is not None else b""
+            # AT+CMGS=<comprimento do TPDU> seguido do PDU em hexadecimal (com relatório de entrega)
+            pdu_hex, tpdu_length = encode_submit(number, segment, encoding, udh=udh, status_report=True)
+            result = self._submit(f"AT+CMGS={tpdu_length}", pdu_hex)
+            if not result["success"]:
+                if total > 1:
+                    result["error"] = f"Segmento {sequence}/{total}: {result['error']}"
+                    result["segments_sent"] = sequence - 1
+                return result
+            message_ids.append(result["message_id"])
+        
+        if total > 1:
+            logger.info(f"📨 SMS concatenado enviado em {total} segmentos (referência {reference})")
+        
+        return {
+            "success": True,
+            "message_id": message_ids[0],
+            "message_ids": message_ids,
+            "segments": total,
+            "status": "sent"
+        }
+    
+    def _next_concat_reference(self) -> int:
+        """Referência de 8 bits partilhada pelos segmentos de um SMS concatenado"""
+        self._concat_reference = (self._concat_reference + 1) % 256
+        return self._concat_reference
+    
+    def _submit(self, cmgs_command: str, body: str) -> Dict[str, any]:
+        """AT+CMGS + corpo terminado em Ctrl+Z; devolve o resultado do envio"""
+        with self._reader.lock:
+            # Comando para iniciar envio de SMS
+            if not self._send_command(cmgs_command, wait_for=">", timeout=10):
+                return {"success": False, "error": "Falha ao iniciar envio de SMS"}
+            
+            # Enviar mensagem seguida de Ctrl+Z (ASCII 26) e aguardar confirmação (pode demorar mais)
+            message_with_end = body + chr(26)
+            started = time.monotonic()
+            response = self._reader.transact(message_with_end.encode('utf-8', errors='ignore'), timeout=30)
+            latency = time.monotonic() - started
+        
+        success = response.success and "+CMGS:" in response.text
+        cms_error = None if success else parse_cms_error(response.text)
+        self.pacer.record(latency, success, cms_error, timed_out=response.timed_out)
+        
+        if response.timed_out:
+            logger.error("Timeout ao enviar SMS")
+            return {"success": False, "error": "Timeout no envio"}
+        
+        if success:
+            # Extrair ID da mensagem
+            match = re.search(r'\+CMGS:\s*(\d+)', response.text)
+            message_id = match.group(1) if match else None
+            
+            logger.info(f"SMS enviado com sucesso. ID: {message_id}")
+            return {
+                "success": True, 
+                "message_id": message_id,
+                "segments": 1,
+                "status": "sent"
+            }
+        
+        logger.error(f"Erro ao enviar SMS: {response.text}")
+        return {"success": False, "error": response.text, "cms_error": cms_error}
+    
     def read_sms(self, delete_after_read: bool = True) -> List[Dict[str, any]]:
         """Ler SMS recebidos"""
+        sms_list, listed = self.list_sms()
+        
+        # Apagar o lote após leitura se solicitado (preferir list_sms() + delete_sms()
+        # depois de persistir); AT+CMGD=1,1 só se nenhuma entrada listada ficou por converter
+        if sms_list and delete_after_read:
+            self.delete_sms([sms["index"] for sms in sms_list], all_read=listed == len(sms_list))
+        
+        return sms_list
+    
+    def list_sms(self) -> Tuple[List[Dict[str, any]], int]:
+        """
+        Listar as mensagens do SIM (AT+CMGL), sem apagar.
+        
+        Returns:
+            (mensagens convertidas, número de entradas +CMGL listadas). As entradas
+            ilegíveis ou que não são SMS-DELIVER ficam de fora da lista mas contam no
+            total: o AT+CMGL marcou-as como lidas e um AT+CMGD=1,1 apagá-las-ia.
+        """
         if not self.is_connected:
-            return []
+            return [], 0
         
         try:
-            # Listar todas as mensagens
-            response = self._get_command_response("AT+CMGL=\"ALL\"", timeout=15)
-            
             sms_list = []
-            messages = re.findall(r'\+CMGL:\s*(\d+),"([^"]+)","([^"]+)",[^,]*,"([^"]+)"\r?\n([^\r\n]+)', response)
-            
-            for match in messages:
-                index, status, sender, timestamp, content = match
-                
-                sms_data = {
-                    "index": int(index),
-                    "status": status,
-                    "sender": sender,
-                    "timestamp": timestamp,
-                    "content": content.strip(),
-                    "received_at": datetime.now()
-                }
-                
-                sms_list.append(sms_data)
+            if self.pdu_mode:
+                # Listar todas as mensagens: +CMGL: <index>,<stat>,[<alpha>],<length> + PDU
+                response = self._get_command_response("AT+CMGL=4", timeout=15)
+                messages = re.findall(r'\+CMGL:\s*(\d+),(\d+),[^,\r\n]*,\d+\r?\n([0-9A-Fa-f]+)', response)
+                for index, status, pdu_hex in messages:
+                    sms_data = self._sms_from_pdu(int(index), int(status), pdu_hex)
+                    if sms_data:
+                        sms_list.append(sms_data)
+            else:
+                # Listar todas as mensagens
+                response = self._get_command_response("AT+CMGL=\"ALL\"", timeout=15)
+                messages = re.findall(r'\+CMGL:\s*(\d+),"([^"]+)","([^"]+)",[^,]*,"([^"]+)"\r?\n([^\r\n]+)', response)
                 
-                # Deletar mensagem após leitura se solicitado
-                if delete_after_read:
-                    self._send_command(f"AT+CMGD={index}")
+                for match in messages:
+                    index, status, sender, timestamp, content = match
+                    
+                    sms_data = {
+                        "index": int(index),
+                        "status": status,
+                        "sender": sender,
+                        "timestamp": timestamp,
+                        "content": content.strip(),
+                        "received_at": datetime.now()
+                    }
+                    
+                    sms_list.append(sms_data)
             
+            listed = len(re.findall(r'\+CMGL:', response))
             if sms_list:
                 logger.info(f"Lidas {len(sms_list)} mensagens SMS")
+            if listed != len(sms_list):
+                logger.warning(f"⚠️ {listed - len(sms_list)} entrada(s) do AT+CMGL não convertidas ficam no SIM")
             
-            return sms_list
+            return sms_list, listed
             
         except Exception as e:
             logger.error(f"Erro ao ler SMS: {str(e)}")
-            return []
+            return [], 0
+    
+    def delete_sms(self, indices: List[int], all_read: bool = False) -> bool:
+        """
+        Apagar do SIM mensagens já persistidas (por posição).
+        
+        Args:
+            indices: Posições a apagar
+            all_read: True só se o chamador garante que todas as mensagens lidas do SIM
+                      estão em indices: uma varredura AT+CMGL completa em que todas as
+                      entradas listadas foram convertidas e guardadas na BD. O AT+CMGD=1,1
+                      apaga todas as lidas, incluindo as que nunca foram guardadas.
+        """
+        if not indices:
+            return True
+        
+        # Um único AT+CMGD=1,1 apaga todas as lidas; as que chegarem entretanto ficam "REC UNREAD"
+        if all_read and len(indices) > 1 and self.supports_delete_flags():
+            if self.purge_sms(1):
+                logger.info(f"🗑️ {len(indices)} SMS apagados do SIM (AT+CMGD=1,1)")
+                return True
+            logger.warning("⚠️ Apagamento em lote falhou, apagando por posição")
+        
+        success = True
+        for index in indices:
+            if not self._send_command(f"AT+CMGD={index}"):
+                logger.warning(f"⚠️ Falha ao apagar SMS na posição {index}")
+                success = False
+        return success
+    
+    def purge_sms(self, delete_flag: int) -> bool:
+        """
+        Apagar mensagens do SIM por categoria (AT+CMGD=<i>,<delflag>):
+        1 = lidas, 2 = lidas e enviadas, 3 = lidas, enviadas e não enviadas, 4 = todas
+        """
+        if delete_flag not in (1, 2, 3, 4):
+            raise ValueError(f"delflag inválido: {delete_flag}")
+        return self._send_command(f"AT+CMGD=1,{delete_flag}", timeout=max(self.timeout, 25))
+    
+    def supports_delete_flags(self) -> bool:
+        """Verificar (uma vez por ligação) se o modem aceita AT+CMGD com <delflag>"""
+        if self._supports_delete_flags is None:
+            # Ex: +CMGD: (0-29),(0-4)
+            response = self._get_command_response("AT+CMGD=?", timeout=5)
+            match = re.search(r'\+CMGD:\s*\([^)]*\)\s*,\s*\(([^)]*)\)', response)
+            flags = set()
+            if match:
+                for part in match.group(1).split(","):
+                    bounds = part.strip().split("-")
+                    if all(bound.isdigit() for bound in bounds):
+                        flags.update(range(int(bounds[0]), int(bounds[-1]) + 1))
+            self._supports_delete_flags = 1 in flags
+            logger.debug(f"Suporte a AT+CMGD com delflag: {self._supports_delete_flags}")
+        return self._supports_delete_flags
+    
+    def read_sms_at(self, index: int, delete_after_read: bool = True) -> Optional[Dict[str, any]]:
+        """Ler um SMS específico do SIM (AT+CMGR), usado após notificação +CMTI"""
+        if not self.is_connected:
+            return None
+        
+        try:
+            response = self._get_command_response(f"AT+CMGR={index}", timeout=5)
+            
+            if self.pdu_mode:
+                # +CMGR: <stat>,[<alpha>],<length> + PDU
+                match = re.search(r'\+CMGR:\s*(\d+),[^,\r\n]*,\d+\r?\n([0-9A-Fa-f]+)', response)
+                sms_data = self._sms_from_pdu(index, int(match.group(1)), match.group(2)) if match else None
+                if not sms_data:
+                    logger.debug(f"Posição {index} vazia ou ilegível: {response}")
+                    return None
+                if delete_after_read:
+                    self._send_command(f"AT+CMGD={index}")
+                return sms_data
+            
+            match = re.search(
+                r'\+CMGR:\s*"([^"]+)","([^"]+)",[^,]*,"([^"]+)"\r?\n(.*?)(?:\r?\nOK)?$',
+                response,
+                re.DOTALL
+            )
+            if not match:
+                logger.debug(f"Posição {index} vazia ou ilegível: {response}")
+                return None
+            
+            status, sender, timestamp, content = match.groups()
+            sms_data = {
+                "index": index,
+                "status": status,
+                "sender": sender,
+                "timestamp": timestamp,
+                "content": content.strip(),
+                "received_at": datetime.now()
+            }
+            
+            if delete_after_read:
+                self._send_command(f"AT+CMGD={index}")
+            
+            return sms_data
+            
+        except Exception as e:
+            logger.error(f"Erro ao ler SMS na posição {index}: {str(e)}")
+            return None
+    
+    def sms_from_cmt(self, event: dict) -> Optional[Dict[str, any]]:
+        """SMS entregue diretamente por +CMT (não fica guardado no SIM)"""
+        # Formato do AT+CMGF em vigor quando o URC chegou (um envio PDU em modo texto muda-o)
+        if event.get("sms_mode", self.sms_mode) == SMS_MODE_PDU:
+            # +CMT: [<alpha>],<length> seguido do PDU
+            return self._sms_from_pdu(None, 0, event["body"] or "", event["received_at"])
+        
+        # +CMT: <oa>,[<alpha>],<scts> seguido do texto
+        params = event["params"]
+        return {
+            "index": None,
+            "status": "REC UNREAD",
+            "sender": params[0] if params else "",
+            "timestamp": params[2] if len(params) > 2 else "",
+            "content": (event["body"] or "").strip(),
+            "received_at": event["received_at"]
+        }
+    
+    def _sms_from_pdu(self, index: Optional[int], status: int, pdu_hex: str,
+                      received_at: Optional[datetime] = None) -> Optional[Dict[str, any]]:
+        """Converter PDU SMS-DELIVER no mesmo dicionário do modo texto"""
+        try:
+            decoded = decode_pdu(pdu_hex)
+        except PDUError as e:
+            logger.warning(f"⚠️ PDU ilegível na posição {index}: {str(e)}")
+            return None
+        
+        # Mensagens enviadas guardadas no SIM (SMS-SUBMIT) não são recebidas
+        if decoded["type"] != "DELIVER":
+            return None
+        
+        return {
+            "index": index,
+            "status": PDU_STATUS.get(status, str(status)),
+            "sender": decoded["sender"],
+            "timestamp": decoded["timestamp"],
+            "content": decoded["content"],
+            "encoding": decoded["encoding"],
+            "concat": decoded["concat"],
+            "received_at": received_at or datetime.now()
+        }
     
     def _format_phone_number(self, phone: str) -> str:
         """Formatar número de telefone para envio"""
@@ -581,26 +917,62 @@ class GSMModem:
         Returns:
             Dict com success, response e error
         """
-        if not self.is_connected:
+        if not self.is_connected or not self._reader_ready():
             return {"success": False, "error": translate_modem_error("Modem não conectado"), "response": ""}
         
         try:
             logger.info(f"📞 Enviando código USSD: {ussd_code}")
             
-            # Limpar buffer antes de enviar
-            self.connection.reset_input_buffer()
+            # Descartar respostas antigas antes de enviar
+            self._drain_ussd_responses()
             
             # Primeiro, tentar cancelar qualquer sessão USSD ativa
             self._send_command("AT+CUSD=2", timeout=2)
-            time.sleep(0.5)
             
-            # Limpar buffer novamente
-            self.connection.reset_input_buffer()
+            # Descartar respostas da sessão cancelada
+            self._drain_ussd_responses()
             
             # Enviar comando USSD com diferentes codificações
             def to_ucs2_hex(s: str) -> str:
                 return ''.join(f'{ord(c):04X}' for c in s)
 
+            def parse_cusd(text: str) -> Optional[Dict[str, any]]:
+                # Procurar por resposta USSD com diferentes formatos
+                ussd_patterns = [
+                    r'\+CUSD:\s*(\d+),"([^"]*)"(?:,(\d+))?',  # Formato padrão
+                    r'\+CUSD:\s*(\d+),([^,\r\n]+)(?:,(\d+))?',  # Sem aspas
+                    r'\+CUSD:\s*(\d+)',  # Apenas status
+                ]
+                
+                for pattern in ussd_patterns:
+                    cusd_match = re.search(pattern, text)
+                    if cusd_match:
+                        status = cusd_match.group(1)
+                        
+                        # Tentar extrair mensagem se disponível
+                        if len(cusd_match.groups()) >= 2 and cusd_match.group(2):
+                            message = cusd_match.group(2)
+                            
+                            # Limpar caracteres de controle e decodificar
+                            message = message.strip('\r\n\x00')
+                            
+                            # Tentar diferentes decodificações
+                            try:
+                                # Tentar UTF-8 primeiro
+                                message = message.encode('latin1').decode('utf-8', errors='ignore')
+                            except:
+                                try:
+                                    # Tentar GSM 7-bit
+                                    message = message.encode('utf-8').decode('gsm0338', errors='ignore')
+                                except:
+                                    # Manter original se falhar
+                                    pass
+                        else:
+                            message = "Resposta recebida sem conteúdo"
+                        
+                        return {"status": status, "message": message}
+                return None
+
             ussd_commands = [
                 f'AT+CUSD=1,"{ussd_code}",15',  # GSM 7-bit padrão
                 f'AT+CUSD=1,"{ussd_code}",72',  # UCS2 (texto normal)
@@ -608,107 +980,64 @@ class GSMModem:
                 f'AT+CUSD=1,"{to_ucs2_hex(ussd_code)}",72',  # UCS2 real (hexadecimal)
             ]
             
+            response = ""
+            ussd_response = ""
+            
             for attempt, ussd_command in enumerate(ussd_commands, 1):
                 logger.info(f"🔄 Tentativa {attempt}: {ussd_command}")
                 
-                # Enviar comando
-                full_command = ussd_command + "\r\n"
-                self.connection.write(full_command.encode())
+                # Enviar comando e aguardar resposta inicial (OK)
+                initial = self._reader.execute(ussd_command, timeout=5)
                 
-                # Aguardar resposta inicial (OK)
-                initial_response = ""
-                initial_start = time.time()
-                
-                while time.time() - initial_start < 5:
-                    if self.connection.in_waiting > 0:
-                        data = self.connection.read(self.connection.in_waiting).decode('utf-8', errors='ignore')
-                        initial_response += data
-                        
-                        if "OK" in initial_response:
-                            logger.info("✅ Comando USSD aceito pelo modem")
-                            break
-                        elif "ERROR" in initial_response:
-                            logger.warning(f"⚠️ Erro no comando: {initial_response}")
-                            if attempt < len(ussd_commands):
-                                time.sleep(1)
-                                continue
-                            else:
-                                return {
-                                    "success": False,
-                                    "error": translate_modem_error(f"Comando USSD rejeitado: {initial_response.strip()}"),
-                                    "response": ""
-                                }
-                    time.sleep(0.1)
+                if initial.success:
+                    logger.info("✅ Comando USSD aceito pelo modem")
+                elif not initial.timed_out:
+                    logger.warning(f"⚠️ Erro no comando: {initial.text}")
+                    if attempt < len(ussd_commands):
+                        time.sleep(1)
+                        continue
+                    return {
+                        "success": False,
+                        "error": translate_modem_error(f"Comando USSD rejeitado: {initial.text}"),
+                        "response": ""
+                    }
                 
-                # Aguardar resposta USSD
-                start_time = time.time()
-                response = ""
-                ussd_response = ""
+                # Aguardar resposta USSD (+CUSD chega como URC)
+                deadline = time.time() + timeout
+                response = initial.text
                 
-                while time.time() - start_time < timeout:
-                    if self.connection.in_waiting > 0:
-                        data = self.connection.read(self.connection.in_waiting).decode('utf-8', errors='ignore')
-                        response += data
-                        
-                        # Procurar por resposta USSD com diferentes formatos
-                        ussd_patterns = [
-                            r'\+CUSD:\s*(\d+),"([^"]*)"(?:,(\d+))?',  # Formato padrão
-                            r'\+CUSD:\s*(\d+),([^,\r\n]+)(?:,(\d+))?',  # Sem aspas
-                            r'\+CUSD:\s*(\d+)',  # Apenas status
-                        ]
-                        
-                        for pattern in ussd_patterns:
-                            cusd_match = re.search(pattern, response)
-                            if cusd_match:
-                                status = cusd_match.group(1)
-                                
-                                # Tentar extrair mensagem se disponível
-                                if len(cusd_match.groups()) >= 2 and cusd_match.group(2):
-                                    ussd_response = cusd_match.group(2)
-                                    
-                                    # Limpar caracteres de controle e decodificar
-                                    ussd_response = ussd_response.strip('\r\n\x00')
-                                    
-                                    # Tentar diferentes decodificações
-                                    try:
-                                        # Tentar UTF-8 primeiro
-                                        ussd_response = ussd_response.encode('latin1').decode('utf-8', errors='ignore')
-                                    except:
-                                        try:
-                                            # Tentar GSM 7-bit
-                                            ussd_response = ussd_response.encode('utf-8').decode('gsm0338', errors='ignore')
-                                        except:
-                                            # Manter original se falhar
-                                            pass
-                                else:
-                                    ussd_response = "Resposta recebida sem conteúdo"
-                                
-                                logger.info(f"✅ Resposta USSD recebida (Status {status}): {ussd_response}")
-                                return {
-                                    "success": True,
-                                    "response": ussd_response,
-                                    "status": status,
-                                    "raw_response": response.strip()
-                                }
-                        
-                        # Verificar erro
-                        if "ERROR" in response or "COMMAND NOT SUPPORT" in response:
-                            logger.error(f"❌ Erro USSD: {response}")
-                            if attempt < len(ussd_commands):
-                                time.sleep(1)
-                                break
-                            else:
-                                return {
-                                    "success": False,
-                                    "error": translate_modem_error(f"Erro USSD: {response.strip()}"),
-                                    "response": ""
-                                }
+                while True:
+                    parsed = parse_cusd(response)
+                    if parsed:
+                        ussd_response = parsed["message"]
+                        logger.info(f"✅ Resposta USSD recebida (Status {parsed['status']}): {ussd_response}")
+                        return {
+                            "success": True,
+                            "response": ussd_response,
+                            "status": parsed["status"],
+                            "raw_response": response.strip()
+                        }
                     
-                    time.sleep(0.1)
-                
-                # Se chegou aqui com sucesso, sair do loop de tentativas
-                if ussd_response:
-                    break
+                    # Verificar erro
+                    if "ERROR" in response or "COMMAND NOT SUPPORT" in response:
+                        logger.error(f"❌ Erro USSD: {response}")
+                        if attempt < len(ussd_commands):
+                            time.sleep(1)
+                            break
+                        return {
+                            "success": False,
+                            "error": translate_modem_error(f"Erro USSD: {response.strip()}"),
+                            "response": ""
+                        }
+                    
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        break
+                    try:
+                        event = self._ussd_responses.get(timeout=remaining)
+                    except queue.Empty:
+                        break
+                    response += "\r\n" + event["raw"]
             
             # Timeout ou sem resposta
             if not ussd_response:
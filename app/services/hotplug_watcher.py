@@ -0,0 +1,132 @@
+"""
+Deteção de ligação/remoção de portas seriais (hot-plug) em Linux
+Usa eventos udev por netlink (pyudev, se instalado) e, sem pyudev, compara a
+listagem de /sys/class/tty a cada intervalo curto. Os subscritores recebem
+{'action': 'add'|'remove', 'name': 'ttyUSB0', 'device': '/dev/ttyUSB0'}.
+"""
+import os
+import threading
+import logging
+from typing import Callable, List, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+ACTION_ADD = "add"
+ACTION_REMOVE = "remove"
+
+
+class HotplugWatcher:
+    """Observa /sys/class/tty e publica eventos de ligação/remoção de portas"""
+
+    def __init__(self, sys_root: str = "/sys/class/tty", dev_root: str = "/dev",
+                 interval: float = 0.5, use_udev: bool = True):
+        self.sys_root = sys_root
+        self.dev_root = dev_root
+        self.interval = interval
+        self.use_udev = use_udev
+        self._subscribers: List[Callable[[dict], None]] = []
+        self._known: Set[str] = set()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @staticmethod
+    def is_supported(sys_root: str = "/sys/class/tty") -> bool:
+        return os.path.isdir(sys_root)
+
+    def subscribe(self, callback: Callable[[dict], None]):
+        """Registar callback de eventos (chamado na thread do observador: não deve bloquear)"""
+        self._subscribers.append(callback)
+
+    @property
+    def is_running(self) -> bool:
+        return bool(self._thread and self._thread.is_alive())
+
+    def start(self) -> bool:
+        """Iniciar observação; False se /sys/class/tty não existir (ex: Windows)"""
+        if self.is_running:
+            return True
+        if not self.is_supported(self.sys_root):
+            logger.info(f"ℹ️ {self.sys_root} indisponível - deteção de hot-plug desativada")
+            return False
+
+        self._stop.clear()
+        self._known = self.scan()
+        monitor = self._udev_monitor() if self.use_udev else None
+        target = self._run_udev if monitor else self._run_polling
+        args = (monitor,) if monitor else ()
+        self._thread = threading.Thread(target=target, args=args, name="hotplug-watcher", daemon=True)
+        self._thread.start()
+        logger.info(f"🔌 Deteção de hot-plug ativa ({'udev' if monitor else f'sysfs a cada {self.interval}s'})")
+        return True
+
+    def stop(self, timeout: float = 2):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=timeout)
+            self._thread = None
+
+    def scan(self) -> Set[str]:
+        """Portas com dispositivo físico (entradas de /sys/class/tty com 'device')"""
+        try:
+            return {
+                name for name in os.listdir(self.sys_root)
+                if os.path.exists(os.path.join(self.sys_root, name, "device"))
+            }
+        except OSError as e:
+            logger.debug(f"Erro ao listar {self.sys_root}: {e}")
+            return set(self._known)
+
+    def poll_once(self) -> List[dict]:
+        """Comparar a listagem atual com a anterior e publicar as diferenças"""
+        current = self.scan()
+        events = [self._event(ACTION_REMOVE, name) for name in sorted(self._known - current)]
+        events += [self._event(ACTION_ADD, name) for name in sorted(current - self._known)]
+        self._known = current
+        for event in events:
+            self._emit(event)
+        return events
+
+    def _run_polling(self):
+        while not self._stop.wait(self.interval):
+            self.poll_once()
+
+    def _udev_monitor(self):
+        """Monitor netlink do pyudev (None se o pyudev não estiver instalado)"""
+        try:
+            import pyudev
+            monitor = pyudev.Monitor.from_netlink(pyudev.Context())
+            monitor.filter_by("tty")
+            monitor.start()
+            return monitor
+        except ImportError:
+            return None
+        except Exception as e:
+            logger.warning(f"⚠️ Monitor udev indisponível, a usar sysfs: {e}")
+            return None
+
+    def _run_udev(self, monitor):
+        while not self._stop.is_set():
+            try:
+                device = monitor.poll(timeout=self.interval)
+            except Exception as e:
+                logger.warning(f"⚠️ Erro no monitor udev, a usar sysfs: {e}")
+                self._run_polling()
+                return
+            if device is None or device.action not in (ACTION_ADD, ACTION_REMOVE):
+                continue
+            if device.action == ACTION_ADD:
+                self._known.add(device.sys_name)
+            else:
+                self._known.discard(device.sys_name)
+            self._emit(self._event(device.action, device.sys_name))
+
+    def _event(self, action: str, name: str) -> dict:
+        return {"action": action, "name": name, "device": os.path.join(self.dev_root, name)}
+
+    def _emit(self, event: dict):
+        logger.info(f"🔌 Porta {event['device']} {'ligada' if event['action'] == ACTION_ADD else 'removida'}")
+        for callback in list(self._subscribers):
+            try:
+                callback(event)
+            except Exception as e:
+                logger.error(f"Erro no subscritor de hot-plug: {e}")
@@ -0,0 +1,174 @@
+"""
+Ingestão de SMS recebidos em duas fases
+1) guardar o lote lido do SIM na BD (inserção em lote com chave de deduplicação)
+2) só depois apagar do SIM as posições que ficaram guardadas
+Segmentos de SMS concatenados ficam em sms_parts até a mensagem estar completa.
+"""
+import hashlib
+import logging
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy.exc import IntegrityError
+
+from app.db.database import SessionLocal
+from app.db.models import SMS, SMSPart, SMSStatus, SMSDirection
+
+logger = logging.getLogger(__name__)
+
+
+def inbound_dedupe_key(sms_data: dict) -> str:
+    """Chave de deduplicação: remetente + carimbo SCTS + hash do conteúdo"""
+    content_hash = hashlib.sha256((sms_data.get("content") or "").encode("utf-8")).hexdigest()
+    raw = f"{sms_data.get('sender') or ''}|{sms_data.get('timestamp') or ''}|{content_hash}"
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class InboxService:
+    """Persistência idempotente dos SMS lidos do modem"""
+
+    def __init__(self, phone_to: Optional[str] = None):
+        self.phone_to = phone_to or "Modem GSM"
+
+    def persist_batch(self, batch: List[dict]) -> Tuple[List[int], List[dict]]:
+        """
+        Guardar lote de SMS numa única transação.
+
+        Returns:
+            (posições do SIM que já estão na BD e podem ser apagadas,
+             SMS novos/montados com o 'id' atribuído, para processamento posterior)
+        """
+        if not batch:
+            return [], []
+
+        # Deduplicar dentro do próprio lote (a mesma mensagem pode vir de +CMTI e de CMGL)
+        by_key: Dict[str, dict] = {}
+        for sms_data in batch:
+            by_key.setdefault(inbound_dedupe_key(sms_data), sms_data)
+
+        db = SessionLocal()
+        try:
+            try:
+                new_sms = self._persist(db, by_key)
+                db.commit()
+            except IntegrityError:
+                # Corrida com outra leitura: repetir com os duplicados já visíveis
+                db.rollback()
+                new_sms = self._persist(db, by_key)
+                db.commit()
+
+            # Tudo o que veio no lote está agora na BD (novo ou duplicado): pode sair do SIM
+            persisted = [sms_data["index"] for sms_data in batch if sms_data.get("index") is not None]
+
+            logger.info(f"💾 {len(new_sms)} SMS recebidos guardados na BD ({len(batch)} lidos)")
+            return persisted, new_sms
+
+        except Exception as e:
+            logger.error(f"Erro ao guardar lote de SMS recebidos: {str(e)}")
+            db.rollback()
+            return [], []
+        finally:
+            db.close()
+
+    def _persist(self, db, by_key: Dict[str, dict]) -> List[dict]:
+        """Inserir mensagens simples e segmentos; montar concatenados completos"""
+        singles = {key: sms_data for key, sms_data in by_key.items() if not sms_data.get("concat")}
+        parts = {key: sms_data for key, sms_data in by_key.items() if sms_data.get("concat")}
+
+        existing = set()
+        if singles:
+            existing.update(
+                key for (key,) in db.query(SMS.dedupe_key).filter(SMS.dedupe_key.in_(list(singles))).all()
+            )
+        if parts:
+            existing.update(
+                key for (key,) in db.query(SMSPart.dedupe_key).filter(SMSPart.dedupe_key.in_(list(parts))).all()
+            )
+        if existing:
+            logger.info(f"♻️ {len(existing)} SMS já guardados anteriormente (duplicados ignorados)")
+
+        # Inserção em lote: um único flush e um único commit
+        records = {key: self._build(key, sms_data) for key, sms_data in singles.items() if key not in existing}
+        db.add_all(list(records.values()))
+
+        groups = set()
+        for key, sms_data in parts.items():
+            if key in existing:
+                continue
+            concat = sms_data["concat"]
+            db.add(SMSPart(
+                phone_from=sms_data["sender"],
+                reference=concat["reference"],
+                total=concat["total"],
+                sequence=concat["sequence"],
+                message=sms_data["content"],
+                sent_timestamp=sms_data.get("timestamp"),
+                dedupe_key=key
+            ))
+            groups.add((sms_data["sender"], concat["reference"], concat["total"]))
+        db.flush()
+
+        new_sms = []
+        for key, sms in records.items():
+            sms_data = dict(singles[key])
+            sms_data["id"] = sms.id
+            new_sms.append(sms_data)
+
+        for sender, reference, total in groups:
+            assembled = self._assemble(db, sender, reference, total)
+            if assembled:
+                new_sms.append(assembled)
+
+        return new_sms
+
+    def _assemble(self, db, sender: str, reference: int, total: int) -> Optional[dict]:
+        """Montar a mensagem quando todos os segmentos estão guardados"""
+        pending = db.query(SMSPart).filter(
+            SMSPart.phone_from == sender,
+            SMSPart.reference == reference,
+            SMSPart.total == total,
+            SMSPart.sms_id.is_(None)
+        ).order_by(SMSPart.id.asc()).all()
+
+        # Referências de 8 bits repetem-se: ficar com o segmento mais recente de cada posição
+        by_sequence = {part.sequence: part for part in pending}
+        if len(by_sequence) < total:
+            logger.debug(f"🧩 SMS concatenado de {sender} (ref {reference}): {len(by_sequence)}/{total} segmentos")
+            return None
+
+        ordered = [by_sequence[sequence] for sequence in sorted(by_sequence)]
+        sms_data = {
+            "index": None,
+            "status": "REC UNREAD",
+            "sender": sender,
+            "timestamp": ordered[0].sent_timestamp,
+            "content": "".join(part.message for part in ordered),
+            "parts": total
+        }
+
+        key = inbound_dedupe_key(sms_data)
+        sms = db.query(SMS).filter(SMS.dedupe_key == key).first()
+        is_new = sms is None
+        if is_new:
+            sms = self._build(key, sms_data)
+            db.add(sms)
+            db.flush()
+
+        for part in pending:
+            part.sms_id = sms.id
+
+        if not is_new:
+            return None
+
+        logger.info(f"🧩 SMS concatenado de {sender} montado a partir de {total} segmentos")
+        sms_data["id"] = sms.id
+        return sms_data
+
+    def _build(self, key: str, sms_data: dict) -> SMS:
+        return SMS(
+            phone_from=sms_data["sender"],
+            phone_to=self.phone_to,
+            message=sms_data["content"],
+            status=SMSStatus.RECEIVED,
+            direction=SMSDirection.INBOUND,
+            dedupe_key=key
+        )
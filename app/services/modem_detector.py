@@ -1,136 +1,272 @@
 import serial.tools.list_ports
 import serial
 import time
+import threading
 import logging
-from typing import List, Optional, Tuple, Dict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Collection, List, Optional, Tuple, Dict
+
+from app.services.modem_fingerprint import FingerprintCache
 
 logger = logging.getLogger(__name__)
 
+# Palavras nas descrições de portas que indicam um modem
+MODEM_KEYWORDS = ['modem', 'gsm', 'qualcomm', 'huawei', 'zte']
+
+_fingerprint_cache: Optional[FingerprintCache] = None
+_fingerprint_lock = threading.Lock()
+
+
+def get_fingerprint_cache() -> FingerprintCache:
+    """Cache de impressões digitais partilhado por todos os detetores"""
+    global _fingerprint_cache
+    with _fingerprint_lock:
+        if _fingerprint_cache is None:
+            _fingerprint_cache = FingerprintCache()
+        return _fingerprint_cache
+
+
 class ModemDetector:
-    def detect_gsm_modem_robust(self, max_retries: int = 2, retry_delay: float = 1.0) -> dict:
+    # Tempo máximo à espera de resposta a cada comando de teste (segundos)
+    probe_timeout = 0.7
+    
+    def __init__(self, cache: Optional[FingerprintCache] = None):
+        self.cache = cache or get_fingerprint_cache()
+    
+    def detect_gsm_modem_robust(self, max_retries: int = 2, retry_delay: float = 1.0,
+                                use_cache: bool = True, exclude: Collection[str] = ()) -> dict:
         """
-        Detecção robusta: testa todas as portas, faz logging detalhado e retorna o motivo de aceitação/rejeição de cada porta.
+        Detecção robusta: testa todas as portas em paralelo, faz logging detalhado e retorna o motivo de aceitação/rejeição de cada porta.
+        Termina assim que uma porta responde (as restantes ficam marcadas como não concluídas).
+        Com use_cache, a porta de um modem já conhecido é testada primeiro e a varredura só corre se falhar.
+        Portas em exclude (abertas por outros modems do pool) nunca são testadas.
         Retorna um dicionário com:
             - 'found': info da porta encontrada ou None
             - 'results': lista de dicts com status de cada porta
         """
-        logger.info("🔍 [ROBUST] Iniciando varredura total de portas seriais para modem GSM...")
-        import serial.tools.list_ports
-        ports = list(serial.tools.list_ports.comports())
-        all_results = []
-        found = None
-        for port in ports:
-            for attempt in range(1, max_retries+1):
-                logger.info(f"[ROBUST] Testando porta {port.device} (tentativa {attempt})...")
-                try:
-                    with serial.Serial(port.device, 115200, timeout=2) as ser:
-                        ser.reset_input_buffer()
-                        ser.reset_output_buffer()
-                        time.sleep(0.2)
-                        ser.write(b'AT\r\n')
-                        time.sleep(0.5)
-                        response_at = ser.read_all().decode('utf-8', errors='ignore').strip()
-                        ser.write(b'ATI\r\n')
-                        time.sleep(0.5)
-                        response_ati = ser.read_all().decode('utf-8', errors='ignore').strip()
-                        logger.debug(f"[ROBUST] Porta {port.device} resposta AT: {repr(response_at)} | ATI: {repr(response_ati)}")
-                        if "OK" in response_at or len(response_ati) > 5:
-                            logger.info(f"[ROBUST] Porta {port.device} FUNCIONAL para comandos AT!")
-                            result = {
-                                'port': port.device,
-                                'description': port.description,
-                                'status': '✅ Funcional',
-                                'response_at': repr(response_at),
-                                'response_ati': repr(response_ati),
-                                'error': ''
-                            }
-                            all_results.append(result)
-                            if not found:
-                                found = result
-                            break
-                        else:
-                            result = {
-                                'port': port.device,
-                                'description': port.description,
-                                'status': '⚠️ Sem Resposta AT',
-                                'response_at': repr(response_at),
-                                'response_ati': repr(response_ati),
-                                'error': ''
-                            }
-                            all_results.append(result)
-                    break
-                except serial.SerialException as e:
-                    logger.warning(f"[ROBUST] Porta {port.device} ocupada ou erro: {e}")
-                    if attempt == max_retries:
-                        all_results.append({
-                            'port': port.device,
-                            'description': port.description,
-                            'status': '❌ Ocupada ou Erro',
-                            'response_at': '',
-                            'response_ati': '',
-                            'error': str(e)
-                        })
-                    else:
-                        time.sleep(retry_delay)
-                except Exception as e:
-                    logger.error(f"[ROBUST] Erro inesperado na porta {port.device}: {e}")
-                    all_results.append({
-                        'port': port.device,
-                        'description': port.description,
-                        'status': '💥 Erro Inesperado',
-                        'response_at': '',
-                        'response_ati': '',
-                        'error': str(e)
-                    })
-                    break
+        ports = self._free_ports(exclude)
+        if use_cache:
+            cached = self._probe_cached(ports, exclude)
+            if cached:
+                cached.pop('functional')
+                return {'found': cached, 'results': [cached]}
+        
+        logger.info("🔍 [ROBUST] Iniciando varredura paralela de portas seriais para modem GSM...")
+        results = self._probe_ports(ports, max_retries=max_retries, retry_delay=retry_delay,
+                                    early_exit=True, ordered=False)
+        found = next((result for result in results if result['functional']), None)
+        for result in results:
+            result.pop('functional')
+        if found:
+            self._remember(next(port for port in ports if port.device == found['port']))
         logger.info(f"[ROBUST] Varredura concluída. Porta encontrada: {found['port'] if found else None}")
-        return {'found': found, 'results': all_results}
-    """Classe para detectar automaticamente modems GSM conectados"""
+        return {'found': found, 'results': results}
     
-    def detect_gsm_modem(self) -> Optional[Dict[str, str]]:
+    def detect_gsm_modem(self, use_cache: bool = True, exclude: Collection[str] = ()) -> Optional[Dict[str, str]]:
         """
         Detecta automaticamente um modem GSM conectado (versão otimizada)
+        Primeiro a porta de um modem já conhecido (cache); depois portas preferenciais
+        e portas com descrições de modem, testadas em paralelo; ganha a porta mais
+        prioritária que responder. Portas em exclude (do pool) ficam de fora.
         """
         logger.info("🔍 Procurando modems GSM...")
         
         from app.core.config import settings
-        ports = serial.tools.list_ports.comports()
+        ports = self._free_ports(exclude)
+        if use_cache:
+            cached = self._probe_cached(ports, exclude)
+            if cached:
+                return self._port_info(next(port for port in ports if port.device == cached['port']))
         
-        # Primeiro, testar portas preferenciais na ordem
         preferred_ports = settings.GSM_PREFERRED_PORTS
-        logger.info(f"📋 Testando portas preferenciais: {preferred_ports}")
+        logger.info(f"📋 Portas preferenciais: {preferred_ports}")
         
-        for preferred_port in preferred_ports:
-            for port in ports:
-                if port.device == preferred_port:
-                    logger.info(f"🔍 Testando porta preferencial: {port.device}")
-                    if self._test_modem_communication(port.device):
-                        logger.info(f"✅ Modem GSM encontrado na porta preferencial: {port.device}")
-                        return {
-                            'port': port.device,
-                            'description': port.description,
-                            'hwid': getattr(port, 'hwid', 'N/A'),
-                            'manufacturer': getattr(port, 'manufacturer', 'N/A')
-                        }
+        candidates = self._candidate_ports(ports, preferred_ports)
+        results = self._probe_ports(candidates, max_retries=1, early_exit=True)
         
-        # Se não encontrou nas preferenciais, testar outras portas com descrições de modem
-        logger.info("🔍 Testando outras portas com descrições de modem...")
-        for port in ports:
-            if port.device not in preferred_ports:
-                desc = port.description.lower()
-                if any(word in desc for word in ['modem', 'gsm', 'qualcomm', 'huawei', 'zte']):
-                    logger.info(f"📱 Testando porta suspeita: {port.device} ({port.description})")
-                    if self._test_modem_communication(port.device):
-                        return {
-                            'port': port.device,
-                            'description': port.description,
-                            'hwid': getattr(port, 'hwid', 'N/A'),
-                            'manufacturer': getattr(port, 'manufacturer', 'N/A')
-                        }
+        for port, result in zip(candidates, results):
+            if result['functional']:
+                logger.info(f"✅ Modem GSM encontrado na porta: {port.device}")
+                self._remember(port)
+                return self._port_info(port)
         
         logger.warning("❌ Nenhum modem GSM detectado")
         return None
     
+    def detect_all_gsm_modems(self, exclude: Collection[str] = ()) -> List[Dict[str, str]]:
+        """
+        Detecta todos os modems GSM conectados (para o pool de modems)
+        Testa em paralelo portas preferenciais e portas com descrições de modem
+        (exceto as de exclude, já abertas por modems do pool)
+        """
+        logger.info("🔍 Procurando todos os modems GSM...")
+        
+        from app.core.config import settings
+        candidates = self._candidate_ports(self._free_ports(exclude), settings.GSM_PREFERRED_PORTS)
+        results = self._probe_ports(candidates, max_retries=1, early_exit=False)
+        modems = []
+        for port, result in zip(candidates, results):
+            if result['functional']:
+                self._remember(port)
+                modems.append(self._port_info(port))
+        
+        logger.info(f"📋 {len(modems)} modem(s) GSM encontrados: {[modem['port'] for modem in modems]}")
+        return modems
+    
+    @staticmethod
+    def _free_ports(exclude: Collection[str] = ()) -> list:
+        """Portas seriais atuais menos as que outros modems já têm abertas"""
+        excluded = set(exclude)
+        return [port for port in serial.tools.list_ports.comports() if port.device not in excluded]
+    
+    def _probe_cached(self, ports: list, exclude: Collection[str] = ()) -> Optional[dict]:
+        """
+        Testar só as portas que correspondem a modems do cache (uma sonda por modem)
+        Portas do pool (exclude) nunca são sondadas: uma entrada do cache não leva a porta de outro SIM
+        """
+        for port in self.cache.match(ports, exclude):
+            entry = self.cache.get(port)
+            result = self._probe_port(port, 1, 0, threading.Event())
+            if result['functional']:
+                if entry['port'] != port.device:
+                    logger.info(f"⚡ Modem conhecido (IMEI {entry.get('imei') or 'N/A'}) mudou de porta: {entry['port']} → {port.device}")
+                else:
+                    logger.info(f"⚡ Modem conhecido encontrado pelo cache na porta {port.device}")
+                self.cache.remember(port, entry.get('baudrate') or 115200)
+                return result
+            logger.info(f"⚠️ Porta em cache {port.device} não respondeu, a fazer varredura completa")
+        return None
+    
+    def _remember(self, port):
+        """Guardar a impressão digital do modem (IMEI só na primeira vez)"""
+        try:
+            entry = self.cache.get(port)
+            imei = entry.get('imei') if entry else None
+            if not imei:
+                info = self.get_modem_info(port.device) or {}
+                imei = info.get('imei')
+            self.cache.remember(port, 115200, imei)
+        except Exception as e:
+            logger.warning(f"⚠️ Não foi possível guardar a impressão digital da porta {port.device}: {e}")
+    
+    @staticmethod
+    def _candidate_ports(ports, preferred_ports: List[str]) -> list:
+        """Portas preferenciais (pela ordem configurada) seguidas das portas com descrição de modem"""
+        by_device = {port.device: port for port in ports}
+        candidates = [by_device[device] for device in preferred_ports if device in by_device]
+        candidates += [
+            port for port in ports
+            if port.device not in preferred_ports
+            and any(word in port.description.lower() for word in MODEM_KEYWORDS)
+        ]
+        return candidates
+    
+    @staticmethod
+    def _port_info(port) -> Dict[str, str]:
+        return {
+            'port': port.device,
+            'description': port.description,
+            'hwid': getattr(port, 'hwid', 'N/A'),
+            'manufacturer': getattr(port, 'manufacturer', 'N/A')
+        }
+    
+    def _probe_ports(self, ports: list, max_retries: int = 1, retry_delay: float = 1.0,
+                     early_exit: bool = True, ordered: bool = True) -> List[dict]:
+        """
+        Testar portas em paralelo (uma thread por porta).
+        Com early_exit, termina no primeiro OK ou, se ordered, quando responde a porta
+        mais prioritária (ordem de 'ports') ainda possível; as portas por concluir
+        ficam assinaladas no relatório.
+        Devolve um resultado por porta, na ordem de 'ports'.
+        """
+        if not ports:
+            return []
+        
+        stop = threading.Event()
+        results: List[Optional[dict]] = [None] * len(ports)
+        executor = ThreadPoolExecutor(max_workers=len(ports), thread_name_prefix="modem-probe")
+        futures = {
+            executor.submit(self._probe_port, port, max_retries, retry_delay, stop): index
+            for index, port in enumerate(ports)
+        }
+        try:
+            for future in as_completed(futures):
+                results[futures[future]] = future.result()
+                if not early_exit:
+                    continue
+                if not ordered:
+                    if results[futures[future]]['functional']:
+                        break
+                    continue
+                # Primeira porta funcional sem portas mais prioritárias por concluir
+                for result in results:
+                    if result is None:
+                        break
+                    if result['functional']:
+                        stop.set()
+                        break
+                if stop.is_set():
+                    break
+        finally:
+            stop.set()
+            executor.shutdown(wait=False, cancel_futures=True)
+        
+        for index, port in enumerate(ports):
+            if results[index] is None:
+                results[index] = self._result(port, '⏭️ Não concluída (modem já encontrado)')
+        return results
+    
+    def _probe_port(self, port, max_retries: int, retry_delay: float, stop: threading.Event) -> dict:
+        """Testar uma porta: AT e, sem OK, ATI (com tentativas em caso de porta ocupada)"""
+        for attempt in range(1, max_retries + 1):
+            if stop.is_set():
+                return self._result(port, '⏭️ Não concluída (modem já encontrado)')
+            logger.info(f"[ROBUST] Testando porta {port.device} (tentativa {attempt})...")
+            try:
+                with serial.Serial(port.device, 115200, timeout=0.1, exclusive=True) as ser:
+                    ser.reset_input_buffer()
+                    ser.reset_output_buffer()
+                    response_at = self._exchange(ser, 'AT')
+                    response_ati = '' if "OK" in response_at else self._exchange(ser, 'ATI')
+                logger.debug(f"[ROBUST] Porta {port.device} resposta AT: {repr(response_at)} | ATI: {repr(response_ati)}")
+                if "OK" in response_at or len(response_ati) > 5:
+                    logger.info(f"[ROBUST] Porta {port.device} FUNCIONAL para comandos AT!")
+                    return self._result(port, '✅ Funcional', repr(response_at), repr(response_ati), functional=True)
+                return self._result(port, '⚠️ Sem Resposta AT', repr(response_at), repr(response_ati))
+            except serial.SerialException as e:
+                logger.warning(f"[ROBUST] Porta {port.device} ocupada ou erro: {e}")
+                if attempt == max_retries:
+                    return self._result(port, '❌ Ocupada ou Erro', error=str(e))
+                stop.wait(retry_delay)
+            except Exception as e:
+                logger.error(f"[ROBUST] Erro inesperado na porta {port.device}: {e}")
+                return self._result(port, '💥 Erro Inesperado', error=str(e))
+        return self._result(port, '❌ Ocupada ou Erro')
+    
+    def _exchange(self, ser, command: str) -> str:
+        """Enviar comando e ler até OK/ERROR ou até probe_timeout (sem esperas fixas)"""
+        ser.write(f'{command}\r\n'.encode())
+        deadline = time.monotonic() + self.probe_timeout
+        response = b''
+        while time.monotonic() < deadline:
+            response += ser.read(ser.in_waiting or 1)
+            if b'OK' in response or b'ERROR' in response:
+                break
+        return response.decode('utf-8', errors='ignore').strip()
+    
+    @staticmethod
+    def _result(port, status: str, response_at: str = '', response_ati: str = '',
+                error: str = '', functional: bool = False) -> dict:
+        return {
+            'port': port.device,
+            'description': port.description,
+            'status': status,
+            'response_at': response_at,
+            'response_ati': response_ati,
+            'error': error,
+            'functional': functional
+        }
+    
     def _test_modem_communication(self, port: str, baudrate: int = 115200, timeout: int = 2) -> bool:
         """
         Testa rapidamente se há um modem na porta (melhorado para Qualcomm)
@@ -140,33 +276,24 @@ class ModemDetector:
             
             # Para modems Qualcomm, 115200 é geralmente o padrão.
             # Testar múltiplos baudrates pode ser lento e desnecessário.
-            with serial.Serial(port, baudrate, timeout=timeout) as ser:
+            with serial.Serial(port, baudrate, timeout=0.1, exclusive=True) as ser:
                 # Limpar buffers
                 ser.reset_input_buffer()
                 ser.reset_output_buffer()
-                time.sleep(0.2)
-                
-                # Enviar comando AT e verificar resposta
-                ser.write(b'AT\r\n')
-                time.sleep(0.5) # Dar tempo para o modem responder
-                
-                response = ser.read_all().decode('utf-8', errors='ignore').strip()
                 
+                # Enviar comando AT e esperar pelo OK (sem pausa fixa)
+                response = self._exchange(ser, 'AT')
                 logger.debug(f"Resposta de 'AT' na porta {port}: {repr(response)}")
-                
                 if "OK" in response:
                     logger.info(f"✅ Modem respondeu 'OK' na porta {port}")
                     return True
                 
                 # Se 'OK' não veio, tentar um comando de identificação
-                ser.write(b'ATI\r\n')
-                time.sleep(0.5)
-                response_ati = ser.read_all().decode('utf-8', errors='ignore').strip()
+                response_ati = self._exchange(ser, 'ATI')
                 logger.debug(f"Resposta de 'ATI' na porta {port}: {repr(response_ati)}")
-
                 if "Manufacturer" in response_ati or "Model" in response_ati or len(response_ati) > 5:
-                     logger.info(f"✅ Modem identificado com 'ATI' na porta {port}")
-                     return True
+                    logger.info(f"✅ Modem identificado com 'ATI' na porta {port}")
+                    return True
 
         except serial.SerialException as e:
             logger.warning(f"⚠️ Porta {port} está ocupada ou inacessível: {e}")
@@ -198,7 +325,7 @@ class ModemDetector:
         Obtém informações detalhadas do modem na porta especificada
         """
         try:
-            with serial.Serial(port, baudrate, timeout=3) as ser:
+            with serial.Serial(port, baudrate, timeout=3, exclusive=True) as ser:
                 info = {}
                 
                 # Limpar buffer
@@ -0,0 +1,112 @@
+"""
+Cache persistente de impressões digitais de modems
+Guarda a identificação USB (VID:PID, número de série, interface, hwid), a última
+porta funcional, o baudrate e o IMEI de cada modem detetado. Na deteção seguinte a
+porta que corresponde à impressão digital é testada primeiro (uma única sonda),
+mesmo que o modem tenha mudado de porta após uma re-enumeração USB.
+"""
+import json
+import os
+import threading
+import time
+import logging
+from typing import Collection, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+def port_fingerprint(port) -> str:
+    """
+    Chave estável de uma porta serial.
+    USB com número de série: VID:PID + número de série + interface (o caminho no
+    barramento pode mudar); USB sem número de série: VID:PID + caminho no hub
+    (dongles iguais só se distinguem pela porta USB onde estão); outras portas: hwid.
+    """
+    vid = getattr(port, 'vid', None)
+    pid = getattr(port, 'pid', None)
+    if vid is None or pid is None:
+        return getattr(port, 'hwid', None) or port.device
+    location = getattr(port, 'location', None) or ''
+    serial_number = getattr(port, 'serial_number', None)
+    if not serial_number:
+        return f"{vid:04X}:{pid:04X}|@{location or port.device}"
+    interface = location.rsplit(':', 1)[1] if ':' in location else ''
+    return f"{vid:04X}:{pid:04X}|{serial_number}|{interface}"
+
+
+class FingerprintCache:
+    """Impressões digitais dos modems conhecidos, guardadas num ficheiro JSON"""
+
+    def __init__(self, path: Optional[str] = None):
+        if path is None:
+            from app.core.config import settings
+            path = settings.GSM_FINGERPRINT_CACHE
+        self.path = path
+        self._lock = threading.Lock()
+        self._entries: Dict[str, dict] = self._load()
+
+    def _load(self) -> Dict[str, dict]:
+        if not self.path or not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                entries = json.load(f)
+            return entries if isinstance(entries, dict) else {}
+        except Exception as e:
+            logger.warning(f"⚠️ Cache de modems ilegível ({self.path}), a ignorar: {e}")
+            return {}
+
+    def _save(self):
+        if not self.path:
+            return
+        try:
+            # Escrita atómica: um ficheiro parcial nunca substitui o cache válido
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self._entries, f, indent=2, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+        except Exception as e:
+            logger.warning(f"⚠️ Não foi possível guardar o cache de modems ({self.path}): {e}")
+
+    def entries(self) -> List[dict]:
+        """Entradas do cache, das mais recentes para as mais antigas"""
+        with self._lock:
+            return sorted(self._entries.values(), key=lambda entry: entry.get('last_seen', 0), reverse=True)
+
+    def match(self, ports, exclude: Collection[str] = ()) -> list:
+        """
+        Portas atuais que correspondem a modems conhecidos (mais recente primeiro),
+        sem as portas de exclude (já abertas por modems do pool)
+        """
+        by_key = {port_fingerprint(port): port for port in ports if port.device not in exclude}
+        return [by_key[entry['key']] for entry in self.entries() if entry['key'] in by_key]
+
+    def get(self, port) -> Optional[dict]:
+        with self._lock:
+            entry = self._entries.get(port_fingerprint(port))
+            return dict(entry) if entry else None
+
+    def remember(self, port, baudrate: int, imei: Optional[str] = None) -> dict:
+        """Registar (ou atualizar) a porta como última porta funcional do modem"""
+        key = port_fingerprint(port)
+        vid = getattr(port, 'vid', None)
+        pid = getattr(port, 'pid', None)
+        with self._lock:
+            entry = self._entries.setdefault(key, {'key': key})
+            entry.update({
+                'vid_pid': f"{vid:04X}:{pid:04X}" if vid is not None and pid is not None else None,
+                'serial_number': getattr(port, 'serial_number', None),
+                'hwid': getattr(port, 'hwid', None),
+                'port': port.device,
+                'baudrate': baudrate,
+                'last_seen': time.time(),
+            })
+            if imei:
+                entry['imei'] = imei
+            self._save()
+            return dict(entry)
+
+    def forget(self, port):
+        with self._lock:
+            if self._entries.pop(port_fingerprint(port), None) is not None:
+                self._save()
@@ -0,0 +1,219 @@
+"""
+Pool de modems GSM para envio distribuído
+Um GSMModem por porta; cada SMS de saída é atribuído a um modem livre
+segundo a estratégia configurada (menos carregado, round-robin ou encaminhamento por operadora)
+"""
+import threading
+import time
+import logging
+from typing import Dict, List, Optional
+
+from app.core.config import settings
+from app.services.gsm_service import GSMModem
+from app.services.operator_routing import RoutingTable, ROUTE_OFF_NET, ROUTE_UNKNOWN, normalize_number
+from app.services.rate_limiter import rate_limiter
+from app.utils.pdu import count_segments
+
+logger = logging.getLogger(__name__)
+
+STRATEGY_LEAST_LOADED = "least_loaded"
+STRATEGY_ROUND_ROBIN = "round_robin"
+STRATEGY_OPERATOR = "operator"
+STRATEGIES = (STRATEGY_LEAST_LOADED, STRATEGY_ROUND_ROBIN, STRATEGY_OPERATOR)
+
+class ModemPool:
+    """Conjunto de modems GSM com despacho balanceado de SMS"""
+
+    def __init__(self, strategy: Optional[str] = None):
+        self.strategy = (strategy or settings.GSM_POOL_STRATEGY).lower()
+        if self.strategy not in STRATEGIES:
+            logger.warning(f"⚠️ Estratégia de pool desconhecida '{self.strategy}', usando {STRATEGY_LEAST_LOADED}")
+            self.strategy = STRATEGY_LEAST_LOADED
+
+        self.modems: Dict[str, GSMModem] = {}
+        self._lock = threading.Lock()
+        self._in_flight: Dict[str, int] = {}
+        self._sent: Dict[str, int] = {}
+        self._failed: Dict[str, int] = {}
+        self._round_robin = 0
+        self.routing = RoutingTable()
+
+    def __len__(self):
+        return len(self.modems)
+
+    def add_modem(self, modem: GSMModem) -> GSMModem:
+        """Registar modem (um por porta)"""
+        with self._lock:
+            if self.modems.get(modem.port) is modem:
+                return modem
+            # O modem principal pode ter sido redetetado noutra porta
+            for port, existing in list(self.modems.items()):
+                if existing is modem:
+                    del self.modems[port]
+            duplicate = self.modems.get(modem.port)
+            if duplicate is None:
+                self.modems[modem.port] = modem
+                self._in_flight.setdefault(modem.port, 0)
+                self._sent.setdefault(modem.port, 0)
+                self._failed.setdefault(modem.port, 0)
+        if duplicate is not None:
+            # Dois leitores na mesma porta roubariam as respostas um do outro: fechar o recém-chegado
+            logger.error(f"❌ Porta {modem.port} já pertence a outro modem do pool - ligação duplicada fechada")
+            modem.disconnect()
+            return duplicate
+        logger.info(f"➕ Modem {modem.port} adicionado ao pool ({len(self.modems)} no total)")
+        return modem
+
+    def remove_modem(self, port: str):
+        """Retirar modem do pool e fechar a porta"""
+        with self._lock:
+            modem = self.modems.pop(port, None)
+        if modem:
+            modem.disconnect()
+            logger.info(f"➖ Modem {port} retirado do pool")
+
+    def discover(self) -> List[GSMModem]:
+        """
+        Adicionar ao pool os modems de GSM_POOL_PORTS ou, se vazio, todos os
+        detetados pelo ModemDetector. Devolve os modems novos já ligados.
+        """
+        ports = list(settings.GSM_POOL_PORTS)
+        if not ports:
+            from app.services.modem_detector import ModemDetector
+            ports = [info["port"] for info in ModemDetector().detect_all_gsm_modems(exclude=set(self.modems))]
+
+        added = []
+        for port in ports:
+            if port in self.modems:
+                continue
+            modem = GSMModem(port=port, auto_detect=False)
+            if modem.connect():
+                added.append(self.add_modem(modem))
+            else:
+                logger.warning(f"⚠️ Modem na porta {port} não respondeu, fora do pool")
+        return added
+
+    def healthy_modems(self) -> List[GSMModem]:
+        with self._lock:
+            return [modem for modem in self.modems.values() if modem.is_connected]
+
+    def acquire(self, phone_to: Optional[str] = None, cost: int = 1) -> Optional[GSMModem]:
+        """Escolher modem para o próximo envio e marcá-lo como ocupado (None se nenhum tiver fichas)"""
+        modem, _, _, _ = self._acquire_routed(phone_to, cost)
+        return modem
+
+    def _acquire_routed(self, phone_to: Optional[str], cost: int = 1):
+        """
+        Escolher modem com o ritmo livre e fichas nos limites do SIM e do destinatário.
+
+        Returns:
+            (modem, operadora de destino, tipo de rota, espera): modem None e espera > 0
+            se todos os candidatos estiverem limitados; espera None se não houver modems
+        """
+        with self._lock:
+            candidates = [modem for modem in self.modems.values() if modem.is_connected]
+            if not candidates:
+                return None, ROUTE_UNKNOWN, ROUTE_OFF_NET, None
+
+            destination, route_type = ROUTE_UNKNOWN, ROUTE_OFF_NET
+            if self.strategy == STRATEGY_OPERATOR and phone_to:
+                # On-net sempre que houver SIM da operadora do destinatário; senão qualquer modem
+                candidates, destination, route_type = self.routing.route(phone_to, candidates)
+
+            if self.strategy == STRATEGY_ROUND_ROBIN:
+                start = self._round_robin % len(candidates)
+                candidates = candidates[start:] + candidates[:start]
+                self._round_robin += 1
+            else:
+                candidates = sorted(candidates, key=lambda m: (self._in_flight[m.port], self._sent[m.port]))
+
+            # Primeiro candidato (pela ordem da estratégia) com o ritmo livre e fichas no SIM
+            recipient = normalize_number(phone_to) if phone_to else None
+            wait = None
+            for modem in candidates:
+                modem_wait = modem.pacer.delay() or rate_limiter.check(
+                    {"modem": modem.port, "destination": recipient}, cost
+                )
+                if modem_wait == 0:
+                    modem.pacer.reserve(cost)
+                    self._in_flight[modem.port] += 1
+                    return modem, destination, route_type, 0.0
+                wait = modem_wait if wait is None else min(wait, modem_wait)
+            return None, destination, route_type, wait
+
+    def release(self, modem: GSMModem, success: bool):
+        """Libertar modem após o envio"""
+        with self._lock:
+            self._in_flight[modem.port] = max(0, self._in_flight.get(modem.port, 0) - 1)
+            if success:
+                self._sent[modem.port] = self._sent.get(modem.port, 0) + 1
+            else:
+                self._failed[modem.port] = self._failed.get(modem.port, 0) + 1
+
+    def send_sms(self, phone_to: str, message: str) -> Dict[str, any]:
+        """Enviar SMS pelo modem escolhido; o resultado indica a porta e o número de origem"""
+        cost = count_segments(message)
+        deadline = time.monotonic() + settings.RATE_LIMIT_MAX_WAIT
+        while True:
+            modem, destination, route_type, wait = self._acquire_routed(phone_to, cost)
+            if modem is not None:
+                break
+            if wait is None:
+                return {"success": False, "error": "Nenhum modem GSM conectado"}
+            if time.monotonic() + wait > deadline:
+                logger.warning(f"🚦 Limite de envio atingido para {phone_to} (fichas em {wait:.1f}s)")
+                return {
+                    "success": False,
+                    "error": f"Limite de envio atingido (tentar em {int(wait) + 1}s)",
+                    "rate_limited": True,
+                    "retry_after": wait
+                }
+            time.sleep(wait)
+
+        result = {"success": False, "error": "Erro desconhecido"}
+        started = time.monotonic()
+        try:
+            result = modem.send_sms(phone_to, message)
+        finally:
+            success = result.get("success", False)
+            self.release(modem, success)
+            self.routing.metrics.record(
+                destination, modem.port, route_type, result.get("segments", 1),
+                success, time.monotonic() - started
+            )
+
+        result["port"] = modem.port
+        result["phone_from"] = modem.phone_number or "Modem GSM"
+        result["route"] = route_type
+        return result
+
+    def get_route_metrics(self) -> List[Dict[str, any]]:
+        """Débito por rota (operadora de destino → modem)"""
+        return self.routing.metrics.snapshot()
+
+    def get_status(self) -> List[Dict[str, any]]:
+        """Estado de cada modem do pool (formato de ModemStatusResponse)"""
+        with self._lock:
+            modems = list(self.modems.values())
+            counters = {
+                port: (self._in_flight[port], self._sent[port], self._failed[port])
+                for port in self.modems
+            }
+
+        status = []
+        for modem in modems:
+            in_flight, sent, failed = counters[modem.port]
+            status.append({
+                "id": modem.port,
+                "port": modem.port,
+                "is_connected": modem.is_connected,
+                "network_registered": bool(modem.network_registered),
+                "operator_name": modem.operator_name,
+                "operator": self.routing.operator_for_modem(modem),
+                "phone_number": modem.phone_number,
+                "in_flight": in_flight,
+                "sent": sent,
+                "failed": failed,
+                "pacing": modem.pacer.get_state(),
+            })
+        return status
@@ -0,0 +1,142 @@
+"""
+Encaminhamento de SMS por operadora
+Envia on-net (SIM da mesma operadora do destinatário) sempre que possível e
+recorre a qualquer modem saudável quando não há SIM da operadora de destino.
+A tabela de prefixos é pré-calculada: cada decisão é uma consulta O(1).
+"""
+import re
+import threading
+import time
+import logging
+from collections import deque
+from typing import Dict, List, Optional, Tuple
+
+from shared.constants import MOZAMBICAN_OPERATOR_PLMN, MOZAMBICAN_OPERATOR_PREFIXES
+
+logger = logging.getLogger(__name__)
+
+ROUTE_OFF_NET = "off-net"
+ROUTE_ON_NET = "on-net"
+ROUTE_UNKNOWN = "unknown"
+
+
+def normalize_number(phone: str) -> str:
+    """Número em formato internacional (+258...) para consulta na tabela"""
+    clean = re.sub(r'[^\d+]', '', phone or "")
+    if clean.startswith("00"):
+        clean = "+" + clean[2:]
+    elif not clean.startswith("+"):
+        if len(clean) == 9:  # Número local moçambicano
+            clean = "+258" + clean
+        elif clean.startswith("258"):
+            clean = "+" + clean
+    return clean
+
+
+class RouteMetrics:
+    """Débito e falhas por rota (operadora de destino → modem)"""
+
+    def __init__(self, window: int = 300):
+        self.window = window
+        self._lock = threading.Lock()
+        self._routes: Dict[Tuple[str, str], dict] = {}
+
+    def record(self, destination: str, port: str, route_type: str, segments: int,
+               success: bool, elapsed: float):
+        now = time.time()
+        with self._lock:
+            route = self._routes.setdefault((destination, port), {
+                "route_type": route_type,
+                "sent": 0,
+                "failed": 0,
+                "segments": 0,
+                "total_time": 0.0,
+                "recent": deque(),
+            })
+            route["route_type"] = route_type
+            route["total_time"] += elapsed
+            if success:
+                route["sent"] += 1
+                route["segments"] += segments
+                route["recent"].append((now, segments))
+            else:
+                route["failed"] += 1
+            while route["recent"] and route["recent"][0][0] < now - self.window:
+                route["recent"].popleft()
+
+    def snapshot(self) -> List[dict]:
+        now = time.time()
+        with self._lock:
+            routes = []
+            for (destination, port), route in self._routes.items():
+                recent = sum(segments for sent_at, segments in route["recent"] if sent_at >= now - self.window)
+                attempts = route["sent"] + route["failed"]
+                routes.append({
+                    "destination_operator": destination,
+                    "port": port,
+                    "route_type": route["route_type"],
+                    "sent": route["sent"],
+                    "failed": route["failed"],
+                    "segments": route["segments"],
+                    "segments_per_minute": round(recent * 60 / self.window, 2),
+                    "avg_send_seconds": round(route["total_time"] / attempts, 2) if attempts else None,
+                })
+            return routes
+
+
+class RoutingTable:
+    """Tabela de encaminhamento pré-calculada a partir do mapa de prefixos"""
+
+    def __init__(self, prefixes: Optional[Dict[str, str]] = None):
+        prefixes = prefixes or MOZAMBICAN_OPERATOR_PREFIXES
+        # Um dicionário por comprimento de prefixo (normalmente um só: "+258XX")
+        self._by_length: Dict[int, Dict[str, str]] = {}
+        for prefix, operator in prefixes.items():
+            self._by_length.setdefault(len(prefix), {})[prefix] = operator
+        self._lengths = sorted(self._by_length, reverse=True)
+        self._operators = sorted(set(prefixes.values()), key=len, reverse=True)
+        self._modem_operators: Dict[Tuple[str, Optional[str]], Optional[str]] = {}
+        self.metrics = RouteMetrics()
+
+    def operator_for_number(self, phone: str) -> Optional[str]:
+        """Operadora do destinatário (None se o prefixo não for conhecido)"""
+        number = normalize_number(phone)
+        for length in self._lengths:
+            operator = self._by_length[length].get(number[:length])
+            if operator:
+                return operator
+        return None
+
+    def operator_for_modem(self, modem) -> Optional[str]:
+        """Operadora do SIM do modem a partir do nome/PLMN de AT+COPS (em cache)"""
+        key = (modem.port, modem.operator_name)
+        if key not in self._modem_operators:
+            self._modem_operators[key] = self._match_operator(modem.operator_name)
+        return self._modem_operators[key]
+
+    def _match_operator(self, operator_name: Optional[str]) -> Optional[str]:
+        if not operator_name:
+            return None
+        if operator_name in MOZAMBICAN_OPERATOR_PLMN:
+            return MOZAMBICAN_OPERATOR_PLMN[operator_name]
+        lowered = operator_name.lower()
+        for operator in self._operators:
+            if operator.lower() in lowered:
+                return operator
+        return None
+
+    def route(self, phone: str, modems: list) -> Tuple[list, str, str]:
+        """
+        Candidatos para o envio: modems on-net se existirem, senão todos.
+
+        Returns:
+            (modems candidatos, operadora de destino, tipo de rota)
+        """
+        destination = self.operator_for_number(phone)
+        if destination is None:
+            return modems, ROUTE_UNKNOWN, ROUTE_OFF_NET
+
+        on_net = [modem for modem in modems if self.operator_for_modem(modem) == destination]
+        if on_net:
+            return on_net, destination, ROUTE_ON_NET
+        return modems, destination, ROUTE_OFF_NET
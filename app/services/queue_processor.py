@@ -1,19 +1,36 @@
 """
 Serviço para processar fila de SMS em massa
 """
-import asyncio
+import heapq
+import os
+import socket
 import threading
 import time
 import logging
-from datetime import datetime, timedelta
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
 from typing import Optional
+from sqlalchemy import select, union_all, update
 from sqlalchemy.orm import Session
+from app.core.config import settings
 from app.db.database import SessionLocal
 from app.db.models import SMSQueue, SMS, SMSStatus, SMSDirection
 from app.services.sms_service import SMSService
+from app.services.campaign_service import CampaignService
+from app.services.rate_limiter import rate_limiter
+from app.services.retry_policy import retry_policy
+from app.services.stats_service import StatsService
+from app.utils.pdu import count_segments
 
 logger = logging.getLogger(__name__)
 
+# Ordem de envio: coincide com o índice ix_sms_queue_due_unscheduled
+DUE_ORDER = (SMSQueue.priority.desc(), SMSQueue.created_at.asc(), SMSQueue.id.asc())
+
+# Pior caso de um segmento no modem: prompt '>' do AT+CMGS (10 s) + resposta +CMGS (30 s)
+SEGMENT_SEND_SECONDS = 40
+
 class SMSQueueProcessor:
     """Processador de fila de SMS para envios em massa"""
     
@@ -21,12 +38,23 @@ class SMSQueueProcessor:
         self.is_running = False
         self.processor_thread: Optional[threading.Thread] = None
         self.sms_service = SMSService()
-        self.processing_interval = 2  # Processar a cada 2 segundos
+        # Identificação deste worker nas concessões (vários processos/hosts drenam a mesma fila)
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"[-64:]
+        self.lease_margin = 60  # Folga da concessão sobre o pior caso calculado (segundos)
+        self.idle_interval = 60  # Verificação de segurança sem notificações (itens inseridos por outro processo)
+        self.segments_per_cycle = 10  # Orçamento de segmentos por ciclo (SMS longos contam por partes)
+        self.throughput_window = 300  # Janela para medir segmentos/minuto (segundos)
+        self._sent_segments = deque()  # (timestamp, segmentos) dos envios recentes
+        self._wakeup = threading.Event()  # Sinalizado pelos endpoints que adicionam itens à fila
+        self._schedule = []  # Heap com os instantes (epoch) dos SMS agendados ainda por vencer
+        self._schedule_lock = threading.Lock()
+        self._imports_checked_at: Optional[float] = None  # Última verificação de importações interrompidas (time.monotonic())
         
     def start_processing(self):
         """Iniciar processamento da fila"""
         if not self.is_running:
             self.is_running = True
+            self._load_schedule()
             self.processor_thread = threading.Thread(target=self._process_queue, daemon=True)
             self.processor_thread.start()
             logger.info("🚀 Processador de fila SMS iniciado")
@@ -35,116 +63,347 @@ class SMSQueueProcessor:
         """Parar processamento da fila"""
         if self.is_running:
             self.is_running = False
+            self._wakeup.set()
             if self.processor_thread:
                 self.processor_thread.join(timeout=10)
             logger.info("⏹️ Processador de fila SMS parado")
     
+    def notify(self, scheduled_for: Optional[datetime] = None):
+        """
+        Acordar o processador após adicionar itens à fila.
+        Itens agendados entram no heap para o processador dormir exatamente até ao próximo.
+        """
+        if scheduled_for is not None:
+            due = _epoch(scheduled_for)
+            if due > time.time():
+                with self._schedule_lock:
+                    heapq.heappush(self._schedule, due)
+        self._wakeup.set()
+    
+    def _load_schedule(self):
+        """Carregar os agendamentos pendentes (itens adicionados antes do arranque)"""
+        try:
+            db = SessionLocal()
+            try:
+                rows = db.query(SMSQueue.scheduled_for).filter(
+                    SMSQueue.processed == False,
+                    SMSQueue.scheduled_for > datetime.utcnow()
+                ).distinct().all()
+            finally:
+                db.close()
+            now = time.time()
+            with self._schedule_lock:
+                self._schedule = [due for due in (_epoch(scheduled_for) for (scheduled_for,) in rows) if due > now]
+                heapq.heapify(self._schedule)
+        except Exception as e:
+            logger.error(f"Erro ao carregar agendamentos da fila: {str(e)}")
+    
+    def _seconds_until_next_due(self) -> float:
+        """Tempo até ao próximo SMS agendado (no máximo idle_interval)"""
+        now = time.time()
+        with self._schedule_lock:
+            while self._schedule and self._schedule[0] <= now:
+                heapq.heappop(self._schedule)
+            if self._schedule:
+                return min(self._schedule[0] - now, self.idle_interval)
+        return self.idle_interval
+    
     def _process_queue(self):
-        """Loop principal de processamento da fila"""
+        """Loop principal: drenar a fila e dormir até à próxima notificação ou agendamento"""
         while self.is_running:
             try:
-                db = SessionLocal()
-                
-                # Buscar próximos SMS para processar
-                queue_items = self._get_next_queue_items(db)
+                self._wakeup.clear()
+                self._check_stalled_imports()
                 
-                if queue_items:
-                    logger.info(f"📤 Processando {len(queue_items)} SMS da fila...")
-                    
-                    for queue_item in queue_items:
-                        try:
-                            self._process_queue_item(queue_item, db)
-                        except Exception as e:
-                            logger.error(f"Erro ao processar item {queue_item.id}: {str(e)}")
-                            # Marcar como processado mesmo com erro para não ficar travado
-                            queue_item.processed = True
-                            queue_item.processed_at = datetime.utcnow()
-                            db.commit()
-                    
-                    logger.info(f"✅ {len(queue_items)} SMS processados")
+                # Todos os SIMs sem fichas: não reclamar itens que ficariam à espera com lease
+                throttle = self._throttle_delay()
+                if throttle:
+                    self._wakeup.wait(throttle)
+                    continue
                 
-                db.close()
+                # Enquanto houver itens prontos, continuar sem esperar
+                if self._process_batch():
+                    continue
                 
-                # Aguardar antes da próxima verificação
-                time.sleep(self.processing_interval)
+                self._wakeup.wait(self._seconds_until_next_due())
                 
             except Exception as e:
                 logger.error(f"Erro no processador de fila: {str(e)}")
                 time.sleep(10)  # Aguardar mais tempo em caso de erro
     
-    def _get_next_queue_items(self, db: Session, limit: int = 5) -> list:
-        """Obter próximos itens da fila para processar"""
+    def _check_stalled_imports(self):
+        """Falhar campanhas cuja importação morreu (reinício a meio), no máximo uma vez por idle_interval"""
+        if self._imports_checked_at is not None and time.monotonic() - self._imports_checked_at < self.idle_interval:
+            return
+        self._imports_checked_at = time.monotonic()
+        from app.services.bulk_enqueue import BulkEnqueueService
+        
+        db = SessionLocal()
+        try:
+            CampaignService.fail_stalled_imports(
+                db, settings.CAMPAIGN_IMPORT_STALL_SECONDS, BulkEnqueueService.active_imports()
+            )
+        except Exception as e:
+            logger.error(f"Erro ao verificar importações interrompidas: {str(e)}")
+            db.rollback()
+        finally:
+            db.close()
+    
+    def _throttle_delay(self) -> float:
+        """Segundos até algum modem ter ritmo livre e fichas para um SMS (0 = há capacidade de envio)"""
+        modems = self.sms_service.pool.healthy_modems() or [self.sms_service.gsm_modem]
+        return min(
+            modem.pacer.delay() or rate_limiter.check({"modem": modem.port}, consume=False)
+            for modem in modems
+        )
+    
+    @staticmethod
+    def _send_worst_case(segments: int, sends: int = 1) -> float:
+        """
+        Segundos que sends envios com segments segmentos no total podem demorar no pior caso:
+        espera máxima por fichas em cada envio, ritmo no piso e transmissão de cada segmento
+        """
+        pacing = 60.0 / settings.SMS_PACING_MIN_RATE if settings.SMS_PACING_ENABLED else 0.0
+        return sends * settings.RATE_LIMIT_MAX_WAIT + segments * (pacing + SEGMENT_SEND_SECONDS)
+    
+    def _batch_lease_seconds(self, limit: int, workers: int) -> float:
+        """Concessão de um lote: cada modem envia até limit/workers itens e segments_per_cycle segmentos"""
+        sends = -(-limit // workers)
+        return self._send_worst_case(self.segments_per_cycle, sends) + self.lease_margin
+    
+    def _renew_lease(self, db: Session, queue_item: SMSQueue) -> bool:
+        """
+        Prolongar a concessão do item para cobrir o seu envio, imediatamente antes de enviar.
+        Atómico: só prolonga se o item ainda for deste worker e a concessão não tiver expirado
+        (expirada, outro worker pode já o ter reclamado). False = não enviar o item.
+        """
+        now = datetime.utcnow()
+        expires = now + timedelta(
+            seconds=self._send_worst_case(count_segments(queue_item.message)) + self.lease_margin
+        )
+        try:
+            renewed = db.execute(
+                update(SMSQueue).where(
+                    SMSQueue.id == queue_item.id,
+                    SMSQueue.lease_owner == self.worker_id,
+                    SMSQueue.lease_expires_at > now,
+                    SMSQueue.processed == False
+                ).values(lease_expires_at=expires).execution_options(synchronize_session=False)
+            ).rowcount
+            db.commit()  # Visível aos outros workers antes do envio
+            return renewed == 1
+        except Exception as e:
+            logger.error(f"Erro ao renovar a concessão do item {queue_item.id}: {str(e)}")
+            db.rollback()
+            return False
+    
+    def _process_batch(self) -> int:
+        """Processar o próximo lote de itens prontos; devolve o número de itens processados"""
+        db = SessionLocal()
+        try:
+            # Um envio em paralelo por modem do pool
+            workers = max(1, len(self.sms_service.pool.healthy_modems()))
+            
+            # Buscar próximos SMS para processar
+            queue_items = self._get_next_queue_items(db, limit=5 * workers, workers=workers)
+            
+            if queue_items and workers > 1:
+                logger.info(f"📤 Processando {len(queue_items)} SMS da fila em {workers} modems...")
+                item_ids = [queue_item.id for queue_item in queue_items]
+                db.close()
+                with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="sms-queue") as executor:
+                    list(executor.map(self._process_queue_item_isolated, item_ids))
+                logger.info(f"✅ {len(item_ids)} SMS processados")
+            
+            elif queue_items:
+                logger.info(f"📤 Processando {len(queue_items)} SMS da fila...")
+                
+                for queue_item in queue_items:
+                    try:
+                        self._process_queue_item(queue_item, db)
+                    except Exception as e:
+                        logger.error(f"Erro ao processar item {queue_item.id}: {str(e)}")
+                        self._mark_item_failed(queue_item, db)
+                
+                logger.info(f"✅ {len(queue_items)} SMS processados")
+            
+            return len(queue_items)
+        finally:
+            db.close()
+    
+    def _process_queue_item_isolated(self, item_id: int):
+        """Processar item numa sessão própria (envio paralelo por vários modems)"""
+        db = SessionLocal()
+        try:
+            queue_item = db.query(SMSQueue).filter(SMSQueue.id == item_id).first()
+            # Verificação rápida; a validade da concessão é confirmada (e prolongada) antes do envio
+            if queue_item is None or queue_item.processed or queue_item.lease_owner != self.worker_id:
+                return
+            try:
+                self._process_queue_item(queue_item, db)
+            except Exception as e:
+                logger.error(f"Erro ao processar item {item_id}: {str(e)}")
+                self._mark_item_failed(queue_item, db)
+        finally:
+            db.close()
+    
+    def _mark_item_failed(self, queue_item: SMSQueue, db: Session):
+        """Marcar como processado mesmo com erro para não ficar travado"""
+        queue_item.processed = True
+        queue_item.processed_at = datetime.utcnow()
+        if queue_item.campaign_id:
+            CampaignService.record_result(db, queue_item.campaign_id, False)
+        db.commit()
+    
+    def _claimable(self, now: datetime) -> tuple:
+        """Itens prontos a enviar e sem concessão válida"""
+        return (
+            SMSQueue.processed == False,
+            # SMS não agendados OU SMS agendados que já chegaram na hora
+            (SMSQueue.scheduled_for.is_(None)) | (SMSQueue.scheduled_for <= now),
+            # Livres OU com concessão expirada (worker que caiu a meio)
+            (SMSQueue.lease_owner.is_(None)) | (SMSQueue.lease_expires_at < now),
+        )
+    
+    @staticmethod
+    def _due_ids(now: datetime, limit: int):
+        """
+        Ids dos primeiros itens prontos, sem ordenar a fila inteira.
+        O OR sobre scheduled_for é dividido em dois ramos, cada um servido pelo seu índice
+        parcial: sem agendamento (lido já na ordem de envio) e agendados vencidos (por hora).
+        """
+        lease_free = (SMSQueue.lease_owner.is_(None)) | (SMSQueue.lease_expires_at < now)
+        unscheduled = select(SMSQueue.id).where(
+            SMSQueue.processed == False,
+            SMSQueue.scheduled_for.is_(None),
+            lease_free
+        ).order_by(*DUE_ORDER).limit(limit)
+        scheduled = select(SMSQueue.id).where(
+            SMSQueue.processed == False,
+            SMSQueue.scheduled_for.isnot(None),
+            SMSQueue.scheduled_for <= now,
+            lease_free
+        ).order_by(*DUE_ORDER).limit(limit)
+        return union_all(unscheduled.subquery().select(), scheduled.subquery().select())
+    
+    def _get_next_queue_items(self, db: Session, limit: int = 5, workers: int = 1) -> list:
+        """
+        Reclamar atomicamente os próximos itens da fila para este worker.
+        Vários workers obtêm lotes disjuntos; os itens ficam concedidos a worker_id
+        até lease_expires_at.
+        """
         try:
-            # Buscar itens não processados, ordenados por prioridade e data de criação
-            # Verificar se já é hora de enviar (para SMS agendados)
             now = datetime.utcnow()
+            expires = now + timedelta(seconds=self._batch_lease_seconds(limit, workers))
             
-            query = db.query(SMSQueue).filter(
-                SMSQueue.processed == False
-            ).filter(
-                # SMS não agendados OU SMS agendados que já chegaram na hora
-                (SMSQueue.scheduled_for.is_(None)) | 
-                (SMSQueue.scheduled_for <= now)
-            ).order_by(
-                SMSQueue.priority.desc(),  # Prioridade maior primeiro
-                SMSQueue.created_at.asc()  # Mais antigos primeiro
-            ).limit(limit)
+            # Prioridade maior primeiro, mais antigos primeiro.
+            # PostgreSQL: FOR UPDATE SKIP LOCKED (workers concorrentes saltam as linhas já reclamadas);
+            # SQLite ignora a cláusula: a escrita é serializada e o UPDATE é atómico
+            # (margem de candidatos para as linhas que outros workers tenham bloqueado)
+            candidates = select(SMSQueue.id).where(
+                SMSQueue.id.in_(self._due_ids(now, limit * 4)),
+                *self._claimable(now)
+            ).order_by(*DUE_ORDER).limit(limit).with_for_update(skip_locked=True)
             
-            return query.all()
+            claim = update(SMSQueue).where(
+                SMSQueue.id.in_(candidates.scalar_subquery()),
+                *self._claimable(now)
+            ).values(
+                lease_owner=self.worker_id,
+                lease_expires_at=expires
+            ).execution_options(synchronize_session=False)
+            
+            if db.get_bind().dialect.update_returning:
+                # UPDATE ... RETURNING: reclamar e saber o que foi reclamado numa só instrução
+                ids = list(db.execute(claim.returning(SMSQueue.id)).scalars())
+            else:
+                db.execute(claim)
+                ids = list(db.execute(select(SMSQueue.id).where(
+                    SMSQueue.lease_owner == self.worker_id,
+                    SMSQueue.lease_expires_at == expires,
+                    SMSQueue.processed == False
+                )).scalars())
+            db.commit()
+            
+            if not ids:
+                return []
+            
+            claimed = db.query(SMSQueue).filter(SMSQueue.id.in_(ids)).order_by(*DUE_ORDER).all()
+            
+            # Cortar o lote pelo número de segmentos, não de mensagens (pelo menos uma)
+            items = []
+            budget = self.segments_per_cycle * workers
+            for item in claimed:
+                segments = count_segments(item.message)
+                if items and segments > budget:
+                    break
+                items.append(item)
+                budget -= segments
+            
+            # Devolver à fila o que ficou fora do orçamento
+            released = [item.id for item in claimed[len(items):]]
+            if released:
+                db.query(SMSQueue).filter(
+                    SMSQueue.id.in_(released),
+                    SMSQueue.lease_owner == self.worker_id
+                ).update({"lease_owner": None, "lease_expires_at": None}, synchronize_session=False)
+                db.commit()
+            
+            return items
             
         except Exception as e:
-            logger.error(f"Erro ao buscar itens da fila: {str(e)}")
+            logger.error(f"Erro ao reclamar itens da fila: {str(e)}")
+            db.rollback()
             return []
     
     def _process_queue_item(self, queue_item: SMSQueue, db: Session):
         """Processar um item individual da fila"""
         try:
+            # Concessão perdida (expirou à espera da vez): o item pertence a outro worker
+            if not self._renew_lease(db, queue_item):
+                logger.warning(f"⏭️ Item {queue_item.id} da fila ignorado: concessão expirada ou reclamada por outro worker")
+                return
+            
             logger.info(f"📱 Processando SMS para {queue_item.phone_to}: {queue_item.message[:50]}...")
             
-            # Criar registro SMS na tabela principal
-            sms = SMS(
-                phone_from="",  # Será preenchido pelo serviço
-                phone_to=queue_item.phone_to,
-                message=queue_item.message,
-                status=SMSStatus.PENDING,
-                direction=SMSDirection.OUTBOUND
-            )
-            db.add(sms)
-            db.flush()  # Para obter o ID
+            # Nova tentativa: reutilizar o registo SMS da tentativa anterior
+            sms = None
+            if queue_item.sms_id:
+                sms = db.query(SMS).filter(SMS.id == queue_item.sms_id).first()
             
-            # Associar com item da fila
-            queue_item.sms_id = sms.id
+            if sms is None:
+                # Criar registro SMS na tabela principal
+                sms = SMS(
+                    phone_from="",  # Será preenchido pelo serviço
+                    phone_to=queue_item.phone_to,
+                    message=queue_item.message,
+                    status=SMSStatus.PENDING,
+                    direction=SMSDirection.OUTBOUND
+                )
+                db.add(sms)
+                db.flush()  # Para obter o ID
+                
+                # Associar com item da fila
+                queue_item.sms_id = sms.id
             
-            # Enviar SMS (criar loop de eventos se necessário)
-            import asyncio
-            try:
-                # Tentar usar loop existente
-                loop = asyncio.get_event_loop()
-                if loop.is_running():
-                    # Se o loop já estiver a correr, usar thread pool
-                    future = asyncio.run_coroutine_threadsafe(
-                        self.sms_service.send_sms(sms.id, db), 
-                        loop
-                    )
-                    success = future.result(timeout=30)
-                else:
-                    # Se não houver loop, criar um
-                    success = asyncio.run(self.sms_service.send_sms(sms.id, db))
-            except RuntimeError:
-                # Se não conseguir usar async, criar novo loop
-                loop = asyncio.new_event_loop()
-                asyncio.set_event_loop(loop)
-                try:
-                    success = loop.run_until_complete(self.sms_service.send_sms(sms.id, db))
-                finally:
-                    loop.close()
-            
-            # Marcar item da fila como processado
+            # Envio síncrono nesta thread (sem criar um event loop por mensagem)
+            result = self.sms_service.send_result(sms.id, db)
+            success = result["success"]
+            
+            # Falha transitória com tentativas disponíveis: o item volta à fila, agendado
+            if not success and self.schedule_retry(db, sms.id, result, queue_item):
+                return
+            
+            # Marcar item da fila como processado (e contar na campanha, na mesma transação)
             queue_item.processed = True
             queue_item.processed_at = datetime.utcnow()
+            if queue_item.campaign_id:
+                CampaignService.record_result(db, queue_item.campaign_id, success)
             
             db.commit()
             
+            self._record_segments(count_segments(queue_item.message))
+            
             if success:
                 logger.info(f"✅ SMS {sms.id} enviado com sucesso para {queue_item.phone_to}")
             else:
@@ -155,13 +414,75 @@ class SMSQueueProcessor:
             db.rollback()
             raise
     
+    def schedule_retry(self, db: Session, sms_id: int, result: dict,
+                       queue_item: Optional[SMSQueue] = None) -> Optional[datetime]:
+        """
+        Reagendar um envio falhado segundo a política de novas tentativas.
+        Sem queue_item (envio avulso) cria um item na fila ligado ao SMS.
+        
+        Returns:
+            Hora da próxima tentativa ou None (falha permanente ou tentativas esgotadas)
+        """
+        try:
+            sms = db.query(SMS).filter(SMS.id == sms_id).first()
+            if sms is None:
+                return None
+            
+            retry_at = retry_policy.next_attempt_at(sms.retry_count or 0, result)
+            if retry_at is None:
+                logger.warning(
+                    f"⛔ SMS {sms_id} sem nova tentativa ({retry_policy.classify(result)}, "
+                    f"{sms.retry_count or 0} tentativa(s)): {result.get('error')}"
+                )
+                return None
+            
+            if queue_item is None:
+                queue_item = SMSQueue(
+                    phone_to=sms.phone_to,
+                    message=sms.message,
+                    sms_id=sms.id,
+                    processed=False
+                )
+                db.add(queue_item)
+            
+            queue_item.scheduled_for = retry_at
+            queue_item.lease_owner = None
+            queue_item.lease_expires_at = None
+            sms.status = SMSStatus.PENDING
+            db.commit()
+            
+            logger.info(f"🔁 SMS {sms_id} reagendado para {retry_at:%H:%M:%S} (tentativa {(sms.retry_count or 0) + 1}): {result.get('error')}")
+            self.notify(retry_at)
+            return retry_at
+            
+        except Exception as e:
+            logger.error(f"Erro ao reagendar SMS {sms_id}: {str(e)}")
+            db.rollback()
+            return None
+    
+    def _record_segments(self, segments: int):
+        """Registar segmentos transmitidos para o cálculo de débito"""
+        now = time.time()
+        self._sent_segments.append((now, segments))
+        while self._sent_segments and self._sent_segments[0][0] < now - self.throughput_window:
+            self._sent_segments.popleft()
+    
+    def get_segments_per_minute(self) -> float:
+        """Débito recente em segmentos por minuto"""
+        now = time.time()
+        recent = [segments for sent_at, segments in self._sent_segments if sent_at >= now - self.throughput_window]
+        if not recent:
+            return 0.0
+        return sum(recent) * 60 / self.throughput_window
+    
     def get_queue_status(self) -> dict:
         """Obter status da fila de processamento"""
         try:
             db = SessionLocal()
             
-            total_pending = db.query(SMSQueue).filter(SMSQueue.processed == False).count()
-            total_processed = db.query(SMSQueue).filter(SMSQueue.processed == True).count()
+            totals = StatsService.queue_totals(db)
+            total_pending = totals["pending"]
+            total_processed = totals["processed"]
             
             # Próximo SMS agendado
             next_scheduled = db.query(SMSQueue.scheduled_for).filter(
@@ -169,12 +490,21 @@ class SMSQueueProcessor:
                 SMSQueue.scheduled_for.isnot(None)
             ).order_by(SMSQueue.scheduled_for.asc()).first()
             
+            # Segmentos pendentes (o modem transmite segmentos, não mensagens)
+            pending_segments = totals["pending_segments"]
+            
             db.close()
             
+            segments_per_minute = self.get_segments_per_minute()
+            eta_seconds = int(pending_segments * 60 / segments_per_minute) if segments_per_minute else None
+            
             return {
                 "is_running": self.is_running,
                 "total_pending": total_pending,
                 "total_processed": total_processed,
+                "pending_segments": pending_segments,
+                "segments_per_minute": round(segments_per_minute, 2),
+                "eta_seconds": eta_seconds,
                 "next_scheduled": next_scheduled[0].isoformat() if next_scheduled and next_scheduled[0] else None
             }
             
@@ -189,26 +519,18 @@ class SMSQueueProcessor:
             }
     
     def clear_processed_items(self, older_than_days: int = 7):
-        """Limpar itens processados mais antigos que X dias"""
-        try:
-            db = SessionLocal()
-            
-            cutoff_date = datetime.utcnow() - timedelta(days=older_than_days)
-            
-            deleted = db.query(SMSQueue).filter(
-                SMSQueue.processed == True,
-                SMSQueue.processed_at < cutoff_date
-            ).delete()
-            
-            db.commit()
-            db.close()
-            
-            logger.info(f"🧹 Removidos {deleted} itens antigos da fila")
-            return deleted
-            
-        except Exception as e:
-            logger.error(f"Erro ao limpar fila: {str(e)}")
-            return 0
+        """Tirar da fila os itens processados mais antigos que X dias (movidos para o arquivo, em lotes)"""
+        from app.services.archive_service import archive_service
+        
+        moved = archive_service.archive_queue(older_than_days)
+        logger.info(f"🧹 Arquivados {moved} itens antigos da fila")
+        return moved
+
+def _epoch(value: datetime) -> float:
+    """Instante em segundos; datas sem fuso são UTC (como datetime.utcnow() na fila)"""
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.timestamp()
 
 # Instância global do processador
 queue_processor = SMSQueueProcessor()
@@ -0,0 +1,39 @@
+"""
+Limitador de taxa da aplicação
+Instância única configurada a partir das settings (memória ou Redis)
+"""
+import logging
+
+from fastapi import HTTPException, Request, status
+
+from app.core.config import settings
+from shared.rate_limit import RateLimiter
+
+logger = logging.getLogger(__name__)
+
+rate_limiter = RateLimiter(
+    redis_url=settings.REDIS_URL if settings.RATE_LIMIT_BACKEND.lower() == "redis" else None,
+    enabled=settings.RATE_LIMIT_ENABLED
+)
+
+
+def enforce_rate_limit(scopes: dict, cost: float = 1):
+    """Rejeitar o pedido com 429 (e Retry-After) se algum âmbito estiver esgotado"""
+    wait = rate_limiter.check(scopes, cost)
+    if wait:
+        logger.warning(f"🚦 Limite de taxa atingido para {scopes} (tentar em {wait:.1f}s)")
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail=f"Limite de envio atingido. Tente novamente em {int(wait) + 1}s",
+            headers={"Retry-After": str(int(wait) + 1)}
+        )
+
+
+def api_rate_limit(request: Request):
+    """Dependência FastAPI: RATE_LIMIT_API_CALLS_PER_MINUTE por cliente"""
+    enforce_rate_limit({"api": request.client.host if request.client else "anonymous"})
+
+
+def ussd_rate_limit():
+    """Dependência FastAPI: RATE_LIMIT_USSD_PER_MINUTE no modem principal (único que envia USSD)"""
+    enforce_rate_limit({"ussd": "primary"})
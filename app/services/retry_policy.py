@@ -0,0 +1,80 @@
+"""
+Política de novas tentativas de envio de SMS
+Classifica cada falha como permanente (número inválido, assinante desconhecido,
+mensagem impossível de codificar) ou transitória (rede, timeout, modem ausente,
+limite de taxa) e calcula quando tentar de novo: atraso exponencial a partir de
+SMS_RETRY_DELAY, com jitter, até SMS_MAX_RETRIES tentativas.
+"""
+import random
+import logging
+from datetime import datetime, timedelta
+from typing import Optional
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+FAILURE_PERMANENT = "permanent"
+FAILURE_TRANSIENT = "transient"
+
+# +CMS ERROR em que repetir não muda o resultado (3GPP TS 24.011 / 27.005)
+PERMANENT_CMS_ERRORS = {
+    1: "Número não atribuído",
+    8: "Barrado pela operadora",
+    10: "Chamada barrada",
+    21: "Mensagem rejeitada",
+    28: "Assinante não identificado",
+    29: "Serviço rejeitado",
+    30: "Assinante desconhecido",
+    50: "Serviço não subscrito",
+    69: "Serviço não implementado",
+    96: "Informação obrigatória inválida",
+    304: "Parâmetro inválido (modo PDU)",
+    305: "Parâmetro inválido (modo texto)",
+}
+
+
+class RetryPolicy:
+    """Decide se e quando um envio falhado volta à fila"""
+
+    def __init__(self, max_retries: Optional[int] = None, base_delay: Optional[float] = None,
+                 max_delay: Optional[float] = None):
+        self.max_retries = max_retries if max_retries is not None else settings.SMS_MAX_RETRIES
+        self.base_delay = base_delay if base_delay is not None else settings.SMS_RETRY_DELAY
+        self.max_delay = max_delay if max_delay is not None else settings.SMS_RETRY_MAX_DELAY
+
+    @staticmethod
+    def classify(result: dict) -> str:
+        """Permanente ou transitória, a partir do resultado do envio"""
+        if result.get("permanent") or result.get("cms_error") in PERMANENT_CMS_ERRORS:
+            return FAILURE_PERMANENT
+        return FAILURE_TRANSIENT
+
+    def backoff(self, attempts: int) -> float:
+        """Atraso antes da tentativa seguinte: base * 2^(tentativas-1), limitado, com jitter (metade fixa)"""
+        delay = min(self.max_delay, self.base_delay * 2 ** max(0, attempts - 1))
+        return delay / 2 + random.uniform(0, delay / 2)
+
+    def next_attempt_at(self, attempts: int, result: dict) -> Optional[datetime]:
+        """
+        Hora da próxima tentativa ou None se não houver (falha permanente ou tentativas esgotadas).
+
+        Args:
+            attempts: tentativas falhadas até agora (SMS.retry_count)
+            result: resultado do envio que falhou
+        """
+        if self.classify(result) == FAILURE_PERMANENT:
+            return None
+
+        if result.get("rate_limited"):
+            # Limite de taxa não é uma tentativa: voltar quando houver fichas
+            delay = float(result.get("retry_after") or self.base_delay) + random.uniform(0, 1)
+        elif attempts >= self.max_retries:
+            return None
+        else:
+            delay = self.backoff(attempts)
+
+        return datetime.utcnow() + timedelta(seconds=delay)
+
+
+retry_policy = RetryPolicy()
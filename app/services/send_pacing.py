@@ -0,0 +1,110 @@
+"""
+Ritmo de envio adaptativo por modem (AIMD)
+Cada modem tem um ritmo (SMS/minuto) que sobe aos poucos enquanto os envios correm
+bem e cai para metade quando a operadora sinaliza congestionamento
+(+CMS ERROR 38/41/42/47, timeout) ou o tempo até +CMGS passa o alvo.
+O próximo envio só pode começar um intervalo (60/ritmo) por segmento depois do anterior.
+"""
+import re
+import threading
+import time
+import logging
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# +CMS ERROR que indicam rede/SMSC sobrecarregados (3GPP TS 27.005 / 24.011)
+CONGESTION_CMS_ERRORS = {
+    38: "Rede fora de serviço",
+    41: "Falha temporária",
+    42: "Congestionamento",
+    47: "Recursos indisponíveis",
+}
+
+_CMS_ERROR_RE = re.compile(r'\+CMS ERROR:\s*(\d+)')
+
+
+def parse_cms_error(text: Optional[str]) -> Optional[int]:
+    """Código de '+CMS ERROR: <n>' numa resposta do modem (None se não houver)"""
+    match = _CMS_ERROR_RE.search(text or "")
+    return int(match.group(1)) if match else None
+
+
+class SendPacer:
+    """Controlador AIMD do intervalo entre envios de um modem"""
+
+    def __init__(self, initial_rate: Optional[float] = None, min_rate: Optional[float] = None,
+                 max_rate: Optional[float] = None, increase: Optional[float] = None,
+                 decrease: Optional[float] = None, latency_target: Optional[float] = None,
+                 enabled: Optional[bool] = None):
+        from app.core.config import settings
+        self.min_rate = min_rate if min_rate is not None else settings.SMS_PACING_MIN_RATE
+        self.max_rate = max_rate if max_rate is not None else settings.SMS_PACING_MAX_RATE
+        self.increase = increase if increase is not None else settings.SMS_PACING_INCREASE
+        self.decrease = decrease if decrease is not None else settings.SMS_PACING_DECREASE
+        self.latency_target = latency_target if latency_target is not None else settings.SMS_PACING_LATENCY_TARGET
+        self.enabled = enabled if enabled is not None else settings.SMS_PACING_ENABLED
+        rate = initial_rate if initial_rate is not None else settings.SMS_PACING_INITIAL_RATE
+        self.rate = min(self.max_rate, max(self.min_rate, rate))
+        self._lock = threading.Lock()
+        self._next_at = 0.0  # time.monotonic() a partir do qual o próximo envio pode começar
+        self.latency: Optional[float] = None  # Média móvel exponencial do tempo até +CMGS
+        self.sent = 0
+        self.congestion_events = 0
+        self.last_cms_error: Optional[int] = None
+
+    @property
+    def interval(self) -> float:
+        return 60.0 / self.rate
+
+    def delay(self) -> float:
+        """Segundos até o modem poder iniciar outro envio (0 = já)"""
+        if not self.enabled:
+            return 0.0
+        with self._lock:
+            return max(0.0, self._next_at - time.monotonic())
+
+    def reserve(self, segments: int = 1):
+        """Marcar o início de um envio: o seguinte fica para daqui a um intervalo por segmento"""
+        if not self.enabled:
+            return
+        with self._lock:
+            self._next_at = max(self._next_at, time.monotonic()) + self.interval * segments
+
+    def record(self, latency: Optional[float], success: bool, cms_error: Optional[int] = None,
+               timed_out: bool = False):
+        """Ajustar o ritmo com o resultado de um AT+CMGS"""
+        with self._lock:
+            if latency is not None and not timed_out:
+                self.latency = latency if self.latency is None else 0.8 * self.latency + 0.2 * latency
+
+            if cms_error is not None:
+                self.last_cms_error = cms_error
+
+            congested = timed_out or cms_error in CONGESTION_CMS_ERRORS or (
+                success and latency is not None and latency > self.latency_target
+            )
+            if congested:
+                # Diminuição multiplicativa: aliviar a operadora de imediato
+                previous = self.rate
+                self.rate = max(self.min_rate, self.rate * self.decrease)
+                self.congestion_events += 1
+                self._next_at = max(self._next_at, time.monotonic() + self.interval)
+                reason = CONGESTION_CMS_ERRORS.get(cms_error) or ("timeout" if timed_out else f"latência {latency:.1f}s")
+                logger.warning(f"🐢 Sinal de congestionamento ({reason}): ritmo {previous:.1f} → {self.rate:.1f} SMS/min")
+            elif success:
+                # Aumento aditivo enquanto a rede aceita os envios a tempo
+                self.sent += 1
+                self.rate = min(self.max_rate, self.rate + self.increase)
+            # Outras falhas (número inválido, etc.) não dizem nada sobre a carga da rede
+
+    def get_state(self) -> Dict[str, Optional[float]]:
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "rate_per_minute": round(self.rate, 2),
+                "interval_seconds": round(self.interval, 2),
+                "latency_seconds": round(self.latency, 2) if self.latency is not None else None,
+                "congestion_events": self.congestion_events,
+                "last_cms_error": self.last_cms_error,
+            }
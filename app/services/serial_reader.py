@@ -0,0 +1,235 @@
+"""
+Leitor dedicado da porta serial do modem GSM
+Bloqueia na porta, divide o fluxo em linhas e entrega os códigos finais
+(OK, ERROR, +CMS ERROR, +CME ERROR, prompt ">") ao chamador via futures
+"""
+import threading
+import logging
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from typing import Callable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Linhas que terminam um comando AT
+FINAL_SUCCESS = ("OK",)
+FINAL_ERROR_PREFIXES = ("ERROR", "+CMS ERROR:", "+CME ERROR:", "NO CARRIER", "COMMAND NOT SUPPORT")
+
+
+def is_final_result(line: str) -> bool:
+    """Verificar se a linha é um código final de resultado"""
+    return line in FINAL_SUCCESS or line.startswith(FINAL_ERROR_PREFIXES)
+
+
+class ATResponse:
+    """Resposta completa de um comando AT"""
+
+    def __init__(self, command: Optional[str], lines: List[str], final: Optional[str]):
+        self.command = command
+        self.lines = lines
+        self.final = final  # None em caso de timeout
+
+    @property
+    def timed_out(self) -> bool:
+        return self.final is None
+
+    @property
+    def is_prompt(self) -> bool:
+        return self.final == ">"
+
+    @property
+    def success(self) -> bool:
+        return self.final in FINAL_SUCCESS or self.is_prompt
+
+    @property
+    def error_code(self) -> Optional[str]:
+        """Código numérico de +CMS ERROR / +CME ERROR, se existir"""
+        if self.final and self.final.startswith(("+CMS ERROR:", "+CME ERROR:")):
+            return self.final.split(":", 1)[1].strip()
+        return None
+
+    @property
+    def text(self) -> str:
+        """Resposta em texto, no mesmo formato que o modem enviou"""
+        lines = list(self.lines)
+        if self.final:
+            lines.append(self.final)
+        return "\r\n".join(lines)
+
+    def __repr__(self):
+        return f"<ATResponse(command={self.command!r}, final={self.final!r}, lines={len(self.lines)})>"
+
+
+class _PendingCommand:
+    """Comando em curso à espera do código final"""
+
+    def __init__(self, echo: Optional[str], expect_prompt: bool):
+        self.echo = echo
+        self.expect_prompt = expect_prompt
+        self.lines: List[str] = []
+        self.future: Future = Future()
+
+    def resolve(self, final: Optional[str]):
+        if not self.future.done():
+            self.future.set_result(ATResponse(self.echo, list(self.lines), final))
+
+
+class SerialReader:
+    """Thread de leitura por porta que substitui o polling de in_waiting"""
+
+    def __init__(self, connection, on_unsolicited: Optional[Callable[[str], None]] = None,
+                 is_unsolicited: Optional[Callable[[str, Optional[str]], bool]] = None,
+                 on_result: Optional[Callable[[Optional[str], str], None]] = None):
+        self.connection = connection
+        self.on_unsolicited = on_unsolicited
+        # Observador dos códigos finais (comando, resultado), chamado nesta thread antes
+        # de ler as linhas seguintes: o estado que o comando muda já vale para os URCs a seguir
+        self.on_result = on_result
+        # Classificador de URCs que chegam no meio de um comando (linha, comando em curso)
+        self.is_unsolicited = is_unsolicited
+        # Lock de transação: um comando AT de cada vez (reentrante para CMGS + corpo)
+        self.lock = threading.RLock()
+        self._state_lock = threading.Lock()
+        self._pending: Optional[_PendingCommand] = None
+        self._running = False
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def is_running(self) -> bool:
+        return self._running and self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        """Iniciar thread de leitura"""
+        if self.is_running:
+            return
+        self._running = True
+        self._thread = threading.Thread(
+            target=self._read_loop,
+            name=f"serial-reader-{getattr(self.connection, 'port', '?')}",
+            daemon=True
+        )
+        self._thread.start()
+        logger.debug("📡 Leitor serial iniciado")
+
+    def stop(self, timeout: float = 2):
+        """Parar thread de leitura (a porta deve ser fechada pelo dono)"""
+        self._running = False
+        self._fail_pending()
+        if self._thread and self._thread is not threading.current_thread():
+            self._thread.join(timeout=timeout)
+        self._thread = None
+
+    def execute(self, command: str, timeout: float, expect_prompt: bool = False) -> ATResponse:
+        """Enviar comando AT e aguardar o código final"""
+        return self.transact((command + "\r\n").encode(), timeout, echo=command, expect_prompt=expect_prompt)
+
+    def transact(self, payload: bytes, timeout: float, echo: Optional[str] = None,
+                 expect_prompt: bool = False) -> ATResponse:
+        """Escrever bytes na porta e aguardar o código final (ou prompt)"""
+        with self.lock:
+            pending = _PendingCommand(echo, expect_prompt)
+            with self._state_lock:
+                self._pending = pending
+            try:
+                self.connection.write(payload)
+                return pending.future.result(timeout=timeout)
+            except FutureTimeoutError:
+                return ATResponse(echo, list(pending.lines), None)
+            finally:
+                with self._state_lock:
+                    if self._pending is pending:
+                        self._pending = None
+
+    def _read_loop(self):
+        """Loop bloqueante sobre a porta serial"""
+        buffer = b""
+        while self._running:
+            try:
+                chunk = self.connection.read(self.connection.in_waiting or 1)
+            except Exception as e:
+                if self._running:
+                    logger.warning(f"⚠️ Leitor serial interrompido: {e}")
+                break
+
+            if not chunk:
+                continue
+
+            buffer += chunk
+            buffer = self._consume_buffer(buffer)
+
+        self._running = False
+        self._fail_pending()
+
+    def _consume_buffer(self, buffer: bytes) -> bytes:
+        """Extrair linhas completas (e o prompt '>') do buffer"""
+        while True:
+            pending = self._current_pending()
+
+            # O prompt de SMS ("> ") não termina com fim de linha
+            if pending and pending.expect_prompt:
+                stripped = buffer.lstrip(b"\r\n")
+                if stripped.startswith(b">"):
+                    self._resolve(pending, ">")
+                    buffer = stripped[1:].lstrip(b" ")
+                    continue
+
+            index = buffer.find(b"\n")
+            if index < 0:
+                return buffer
+
+            line = buffer[:index].decode('utf-8', errors='ignore').strip()
+            buffer = buffer[index + 1:]
+            if line:
+                self._handle_line(line, pending)
+
+    def _handle_line(self, line: str, pending: Optional[_PendingCommand]):
+        """Encaminhar linha para o comando em curso ou como não solicitada"""
+        if pending is None:
+            self._emit_unsolicited(line)
+            return
+
+        # Eco do comando (antes de ATE0)
+        if pending.echo and line == pending.echo:
+            return
+
+        # URC intercalado com a resposta (ex: +CMTI durante AT+CSQ)
+        if self.is_unsolicited and self.is_unsolicited(line, pending.echo):
+            self._emit_unsolicited(line)
+            return
+
+        if is_final_result(line):
+            self._resolve(pending, line)
+        else:
+            pending.lines.append(line)
+
+    def _current_pending(self) -> Optional[_PendingCommand]:
+        with self._state_lock:
+            if self._pending and self._pending.future.done():
+                return None
+            return self._pending
+
+    def _resolve(self, pending: _PendingCommand, final: Optional[str]):
+        """Entregar resultado e libertar o slot para as linhas seguintes"""
+        if self.on_result and final is not None:
+            try:
+                self.on_result(pending.echo, final)
+            except Exception as e:
+                logger.error(f"Erro ao processar resultado de '{pending.echo}': {e}")
+        pending.resolve(final)
+        with self._state_lock:
+            if self._pending is pending:
+                self._pending = None
+
+    def _emit_unsolicited(self, line: str):
+        logger.debug(f"📥 Linha não solicitada: {line}")
+        if self.on_unsolicited:
+            try:
+                self.on_unsolicited(line)
+            except Exception as e:
+                logger.error(f"Erro ao processar linha não solicitada: {e}")
+
+    def _fail_pending(self):
+        """Libertar chamador à espera quando a leitura termina"""
+        with self._state_lock:
+            pending = self._pending
+        if pending:
+            pending.resolve(None)
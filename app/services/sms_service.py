@@ -1,12 +1,23 @@
 from app.services.gsm_service import GSMModem
+from app.services.hotplug_watcher import HotplugWatcher, ACTION_ADD
+from app.services.modem_pool import ModemPool
+from app.services.operator_routing import normalize_number
+from app.services.rate_limiter import rate_limiter
+from app.utils.pdu import count_segments
 from app.core.config import settings
-from app.db.models import SMS, SMSStatus
+from app.db.models import SMS, SMSStatus, SMSDirection
+from app.db.database import SessionLocal
 from sqlalchemy.orm import Session
 from datetime import datetime
 import logging
 import asyncio
+import functools
+import os
+import queue
 import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
 
 logger = logging.getLogger(__name__)
 
@@ -27,11 +38,96 @@ class SMSService:
         if hasattr(self, '_initialized') and self._initialized:
             return
         self.gsm_modem = GSMModem()
+        # Pool de envio: o modem principal e, se ativo, os restantes modems detetados
+        self.pool = ModemPool()
+        # A redeteção do modem principal nunca toma a porta de um modem do pool
+        self.gsm_modem.excluded_ports = functools.partial(self._pool_ports, exclude=self.gsm_modem)
         self.is_monitoring = False
         self.monitoring_thread = None
+        # Sinalizado por +CMTI para acordar o monitoramento sem esperar o intervalo
+        self._new_sms_event = threading.Event()
+        self._notified_sms: queue.Queue = queue.Queue()  # (modem, evento) indicados por +CMTI/+CMT
+        # Envios bloqueantes (I/O serial) fora do event loop dos handlers assíncronos
+        self._send_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="sms-send")
+        # Reconexões (health check ou hot-plug) uma de cada vez
+        self._reconnect_lock = threading.Lock()
+        self.hotplug: HotplugWatcher = None
+        self._attach_modem(self.gsm_modem)
+        self._start_hotplug()
         self._initialize_modem()
         self._initialized = True
     
+    def _pool_ports(self, exclude: Optional[GSMModem] = None) -> set:
+        """Portas abertas pelos modems do pool (exceto o modem indicado)"""
+        return {port for port, modem in list(self.pool.modems.items()) if modem is not exclude}
+    
+    def _attach_modem(self, modem: GSMModem):
+        """Subscrever os URCs de receção e relatórios de entrega de um modem"""
+        on_new_sms = functools.partial(self._on_new_sms_notification, modem=modem)
+        modem.urc.subscribe("CMTI", on_new_sms)
+        modem.urc.subscribe("CMT", on_new_sms)
+        modem.urc.subscribe("CDS", self._handle_delivery_report)
+    
+    def _start_pool(self):
+        """Adicionar o modem principal ao pool e descobrir os restantes"""
+        self.pool.add_modem(self.gsm_modem)
+        if not settings.GSM_POOL_ENABLED:
+            return
+        for modem in self.pool.discover():
+            self._attach_modem(modem)
+        logger.info(f"📡 Pool de modems ativo: {len(self.pool)} modem(s), estratégia {self.pool.strategy}")
+    
+    def _start_hotplug(self):
+        """Observar ligação/remoção de portas para reagir sem esperar pelo health check"""
+        if not settings.GSM_HOTPLUG_ENABLED:
+            return
+        self.hotplug = HotplugWatcher(interval=settings.GSM_HOTPLUG_INTERVAL)
+        self.hotplug.subscribe(self._on_hotplug)
+        if not self.hotplug.start():
+            self.hotplug = None
+    
+    def _on_hotplug(self, event: dict):
+        """Porta removida: modem offline de imediato. Porta ligada: reconectar modems em falta"""
+        modems = list(self.pool.modems.values()) or [self.gsm_modem]
+        if event['action'] != ACTION_ADD:
+            for modem in modems:
+                if modem.port == event['device'] and modem.is_connected:
+                    modem.mark_offline()
+            return
+        
+        if self.is_monitoring and all(modem.is_connected for modem in modems):
+            return
+        # Não bloquear o observador: a reconexão abre portas e envia comandos AT
+        threading.Thread(target=self._reconnect_after_hotplug, args=(event['device'],), daemon=True).start()
+    
+    def _reconnect_after_hotplug(self, device: str):
+        """Reconectar assim que a porta ligada estiver pronta (o udev cria /dev/ttyX logo a seguir ao sysfs)"""
+        deadline = time.monotonic() + 5
+        while not os.path.exists(device) and time.monotonic() < deadline:
+            time.sleep(0.1)
+        
+        with self._reconnect_lock:
+            # Modem ausente no arranque: inicialização completa (pool e monitoramento)
+            if not self.is_monitoring:
+                logger.info(f"🔌 Porta {device} ligada - a inicializar o modem")
+                self._initialize_modem()
+                return
+            
+            for modem in list(self.pool.modems.values()) or [self.gsm_modem]:
+                if modem.is_connected:
+                    continue
+                # Modems do pool estão presos à porta; o principal redeteta (cache: uma só sonda)
+                if modem.auto_detect:
+                    reconnected = modem.reconnect_automatically()
+                elif modem.port == device:
+                    reconnected = modem.connect()
+                else:
+                    continue
+                if reconnected:
+                    logger.info(f"✅ Modem {modem.port} reconectado após hot-plug")
+            if self.gsm_modem.is_connected:
+                self.pool.add_modem(self.gsm_modem)
+    
     def _initialize_modem(self):
         """Inicializar modem GSM com detecção automática de porta"""
         try:
@@ -41,7 +137,7 @@ class SMSService:
             if settings.GSM_PORT == "AUTO":
                 from app.services.modem_detector import ModemDetector
                 detector = ModemDetector()
-                modem_info = detector.detect_gsm_modem()
+                modem_info = detector.detect_gsm_modem(exclude=self._pool_ports(exclude=self.gsm_modem))
                 
                 if modem_info:
                     logger.info(f"🔍 Modem detectado automaticamente: {modem_info['port']}")
@@ -56,6 +152,7 @@ class SMSService:
             
             if self.gsm_modem.connect():
                 logger.info(f"✅ Modem GSM conectado na porta: {self.gsm_modem.port}")
+                self._start_pool()
                 self._start_monitoring()
                 return True
             else:
@@ -78,84 +175,233 @@ class SMSService:
         """Monitorar SMS recebidos em background com reconexão automática"""
         connection_check_interval = 30  # Verificar conexão a cada 30 segundos
         last_connection_check = 0
+        last_sweep = 0
         
         while self.is_monitoring:
             try:
+                self._new_sms_event.clear()
                 current_time = time.time()
                 
+                modems = list(self.pool.modems.values()) or [self.gsm_modem]
+                
                 # Verificar saúde da conexão periodicamente
                 if current_time - last_connection_check > connection_check_interval:
-                    if not self.gsm_modem.check_connection_health():
-                        logger.warning("🔄 Conexão com modem perdida, tentando reconectar...")
-                        if self.gsm_modem.reconnect_automatically():
-                            logger.info("✅ Reconexão bem-sucedida!")
-                        else:
-                            logger.error("❌ Falha na reconexão - tentando novamente em 30s")
+                    with self._reconnect_lock:
+                        for modem in modems:
+                            if not modem.check_connection_health():
+                                logger.warning(f"🔄 Conexão com modem {modem.port} perdida, tentando reconectar...")
+                                if modem.reconnect_automatically():
+                                    logger.info("✅ Reconexão bem-sucedida!")
+                                else:
+                                    logger.error("❌ Falha na reconexão - tentando novamente em 30s")
+                        if self.gsm_modem.is_connected:
+                            self.pool.add_modem(self.gsm_modem)
                     last_connection_check = current_time
                 
-                if self.gsm_modem.is_connected:
-                    # Ler SMS recebidos
-                    incoming_sms = self.gsm_modem.read_sms(delete_after_read=True)
-                    
-                    if incoming_sms:
-                        logger.info(f"Recebidos {len(incoming_sms)} SMS")
+                # Leitura dirigida dos SMS notificados (sem esperar pela varredura)
+                self._read_notified_sms()
+                
+                # Varredura completa: polling normal sem notificações, reconciliação lenta com elas
+                sweep_interval = (
+                    settings.SMS_RECONCILE_INTERVAL
+                    if all(modem.sms_notifications_enabled for modem in modems)
+                    else settings.SMS_CHECK_INTERVAL
+                )
+                if current_time - last_sweep >= sweep_interval:
+                    last_sweep = current_time
+                    for modem in modems:
+                        if not modem.is_connected:
+                            continue
+                        # Ler sem apagar: só sai do SIM o que ficou guardado na BD
+                        incoming_sms, listed = modem.list_sms()
                         
-                        # Processar cada SMS (isso será feito via callback para a aplicação principal)
-                        for sms_data in incoming_sms:
-                            self._process_incoming_sms(sms_data)
+                        if incoming_sms:
+                            logger.info(f"Recebidos {len(incoming_sms)} SMS ({modem.port})")
+                            self._ingest_batch(incoming_sms, modem, listed=listed)
                 
-                # Aguardar antes da próxima verificação
-                time.sleep(settings.SMS_CHECK_INTERVAL)
+                # Aguardar notificação +CMTI ou o intervalo de verificação
+                self._new_sms_event.wait(settings.SMS_CHECK_INTERVAL)
                 
             except Exception as e:
                 logger.error(f"Erro no monitoramento de SMS: {str(e)}")
                 time.sleep(10)  # Aguardar mais tempo em caso de erro
     
+    def _on_new_sms_notification(self, event: dict, modem: GSMModem = None):
+        """Nova mensagem: +CMTI: <mem>,<index> (no SIM) ou +CMT (entrega direta)"""
+        logger.info(f"📨 Notificação de novo SMS: {event['raw']}")
+        self._notified_sms.put((modem or self.gsm_modem, event))
+        self._new_sms_event.set()
+    
+    def _read_notified_sms(self):
+        """Ler com AT+CMGR apenas as posições indicadas por +CMTI"""
+        batches = {}
+        while True:
+            try:
+                modem, event = self._notified_sms.get_nowait()
+            except queue.Empty:
+                break
+            
+            params = event["params"]
+            if event["type"] == "CMT":
+                # Entrega direta (não fica guardado no SIM)
+                sms_data = modem.sms_from_cmt(event)
+            else:
+                try:
+                    index = int(params[1])
+                except (IndexError, ValueError):
+                    logger.warning(f"Notificação +CMTI inválida: {event['raw']}")
+                    continue
+                sms_data = modem.read_sms_at(index, delete_after_read=False)
+            
+            if sms_data:
+                batches.setdefault(modem, []).append(sms_data)
+        
+        for modem, batch in batches.items():
+            self._ingest_batch(batch, modem)
+    
+    def _ingest_batch(self, incoming_sms: list, modem: GSMModem = None, listed: Optional[int] = None):
+        """
+        Guardar o lote na BD, só depois apagar do SIM, e por fim processar os novos.
+        listed: entradas do AT+CMGL que originou o lote (None = leituras avulsas por +CMTI)
+        """
+        from app.services.inbox_service import InboxService
+        
+        modem = modem or self.gsm_modem
+        inbox = InboxService(phone_to=modem.phone_number)
+        persisted, new_sms = inbox.persist_batch(incoming_sms)
+        
+        # Apagar o que foi persistido; AT+CMGD=1,1 só quando a varredura inteira do SIM
+        # (incluindo as entradas ilegíveis) ficou guardada
+        if persisted:
+            modem.delete_sms(persisted, all_read=listed is not None and listed == len(persisted))
+        
+        # Comandos automáticos, reencaminhamento, etc. (o SMS já está guardado)
+        for sms_data in new_sms:
+            self._process_incoming_sms(sms_data)
+    
+    def _handle_delivery_report(self, event: dict):
+        """Atualizar estado do SMS a partir do relatório de entrega (+CDS)"""
+        params = event["params"]
+        
+        if event["body"] is not None:
+            # Modo PDU: +CDS: <length> seguido do PDU SMS-STATUS-REPORT
+            from app.utils.pdu import PDUError, decode_pdu
+            try:
+                report = decode_pdu(event["body"])
+            except PDUError as e:
+                logger.debug(f"Relatório de entrega ilegível: {str(e)}")
+                return
+            if report["type"] != "STATUS_REPORT":
+                return
+            reference = str(report["reference"])
+            delivery_status = report["status"]
+        else:
+            # Modo texto: +CDS: <fo>,<mr>,[<ra>],[<tora>],<scts>,<dt>,<st>
+            if len(params) < 3:
+                logger.debug(f"Relatório de entrega em formato não suportado: {event['raw']}")
+                return
+            
+            reference = params[1]
+            try:
+                delivery_status = int(params[-1])
+            except ValueError:
+                return
+        
+        db = SessionLocal()
+        try:
+            sms = db.query(SMS).filter(
+                SMS.external_id == reference,
+                SMS.direction == SMSDirection.OUTBOUND
+            ).first()
+            if not sms:
+                logger.debug(f"Relatório de entrega sem SMS correspondente (referência {reference})")
+                return
+            
+            # <st>: 0-31 concluído, 32-63 ainda em tentativa, 64+ falha permanente
+            if delivery_status < 32:
+                sms.status = SMSStatus.DELIVERED
+                sms.delivered_at = datetime.utcnow()
+            elif delivery_status >= 64:
+                sms.status = SMSStatus.FAILED
+                sms.error_message = f"Relatório de entrega: estado {delivery_status}"
+            else:
+                return
+            
+            db.commit()
+            logger.info(f"📬 SMS {sms.id} atualizado por relatório de entrega: {sms.status.value}")
+        except Exception as e:
+            logger.error(f"Erro ao processar relatório de entrega: {str(e)}")
+            db.rollback()
+        finally:
+            db.close()
+    
     def _process_incoming_sms(self, sms_data: dict):
         """Processar SMS recebido (será chamado via callback)"""
         # Esta função será sobrescrita ou chamará um callback da aplicação principal
         logger.info(f"SMS recebido de {sms_data['sender']}: {sms_data['content'][:50]}...")
     
-    async def send_sms(self, sms_id: int, db: Session):
-        """Enviar SMS usando modem GSM"""
+    async def send_sms(self, sms_id: int, db: Session) -> bool:
+        """Enviar SMS usando modem GSM (fachada assíncrona: o envio corre no executor dedicado)"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._send_executor, self._send_or_requeue, sms_id, db)
+    
+    def _send_or_requeue(self, sms_id: int, db: Session) -> bool:
+        """Envio avulso: uma falha transitória volta à fila para nova tentativa"""
+        result = self.send_result(sms_id, db)
+        if not result["success"]:
+            from app.services.queue_processor import queue_processor
+            queue_processor.schedule_retry(db, sms_id, result)
+        return result["success"]
+    
+    def send(self, sms_id: int, db: Session) -> bool:
+        """
+        Enviar SMS da BD (síncrono e thread-safe: para threads de trabalho como o processador da fila)
+        A sessão db pertence à thread que chama.
+        """
+        return self.send_result(sms_id, db)["success"]
+    
+    def send_result(self, sms_id: int, db: Session) -> dict:
+        """Como send(), mas devolve o resultado do envio (error, cms_error, rate_limited...)"""
         try:
             # Buscar SMS na base de dados
             sms = db.query(SMS).filter(SMS.id == sms_id).first()
             if not sms:
                 logger.error(f"SMS {sms_id} não encontrado")
-                return False
+                return {"success": False, "error": "SMS não encontrado", "permanent": True}
             
-            # Verificar se modem está conectado
-            if not self.gsm_modem.is_connected:
+            # Verificar se há modem conectado
+            if not self.gsm_modem.is_connected and not self.pool.healthy_modems():
                 logger.error("Modem GSM não está conectado")
                 sms.status = SMSStatus.FAILED
                 sms.error_message = "Modem GSM não conectado"
+                sms.retry_count = (sms.retry_count or 0) + 1
                 db.commit()
-                return False
+                return {"success": False, "error": "Modem GSM não conectado"}
             
-            # Enviar SMS via modem GSM
-            result = self.gsm_modem.send_sms(sms.phone_to, sms.message)
+            # Enviar SMS pelo modem escolhido no pool
+            result = self._dispatch(sms.phone_to, sms.message)
             
             if result["success"]:
                 # Atualizar SMS na base de dados
                 sms.external_id = result.get("message_id")
-                sms.phone_from = self.gsm_modem.phone_number or "Modem GSM"
+                sms.phone_from = result.get("phone_from") or self.gsm_modem.phone_number or "Modem GSM"
                 sms.status = SMSStatus.SENT
                 sms.sent_at = datetime.utcnow()
                 
                 db.commit()
                 
                 logger.info(f"SMS {sms_id} enviado com sucesso. ID: {result.get('message_id')}")
-                return True
+                return result
             else:
-                # Atualizar status como falhou
+                # Atualizar status como falhou (limite de taxa não conta como tentativa)
                 sms.status = SMSStatus.FAILED
                 sms.error_message = result.get("error", "Erro desconhecido")
-                sms.retry_count += 1
+                if not result.get("rate_limited"):
+                    sms.retry_count = (sms.retry_count or 0) + 1
                 db.commit()
                 
                 logger.error(f"Falha ao enviar SMS {sms_id}: {result.get('error')}")
-                return False
+                return result
             
         except Exception as e:
             logger.error(f"Erro ao enviar SMS {sms_id}: {str(e)}")
@@ -165,22 +411,46 @@ class SMSService:
             if sms:
                 sms.status = SMSStatus.FAILED
                 sms.error_message = str(e)
-                sms.retry_count += 1
+                sms.retry_count = (sms.retry_count or 0) + 1
                 db.commit()
             
-            return False
+            return {"success": False, "error": str(e)}
+    
+    def _dispatch(self, phone_to: str, message: str) -> dict:
+        """Enviar pelo pool; sem pool (modem principal fora do pool) usar o modem principal"""
+        if len(self.pool):
+            return self.pool.send_sms(phone_to, message)
+        segments = count_segments(message)
+        scopes = {"modem": self.gsm_modem.port, "destination": normalize_number(phone_to)}
+        wait = rate_limiter.acquire(scopes, segments, timeout=settings.RATE_LIMIT_MAX_WAIT)
+        if wait:
+            # Como no pool: a nova tentativa fica para quando houver fichas
+            return {
+                "success": False,
+                "error": f"Limite de envio atingido (tentar em {int(wait) + 1}s)",
+                "rate_limited": True,
+                "retry_after": wait
+            }
+        time.sleep(self.gsm_modem.pacer.delay())
+        self.gsm_modem.pacer.reserve(segments)
+        return self.gsm_modem.send_sms(phone_to, message)
     
     async def send_sms_direct(self, phone_to: str, message: str) -> dict:
-        """Enviar SMS diretamente (para respostas automáticas)"""
+        """Enviar SMS diretamente (para respostas automáticas), sem bloquear o event loop"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._send_executor, self.send_direct, phone_to, message)
+    
+    def send_direct(self, phone_to: str, message: str) -> dict:
+        """Enviar SMS diretamente (síncrono e thread-safe)"""
         try:
-            if not self.gsm_modem.is_connected:
+            if not self.gsm_modem.is_connected and not self.pool.healthy_modems():
                 return {
                     "success": False,
                     "error": "Modem GSM não conectado"
                 }
             
             # Enviar SMS
-            result = self.gsm_modem.send_sms(phone_to, message)
+            result = self._dispatch(phone_to, message)
             
             if result["success"]:
                 return {
@@ -232,6 +502,10 @@ class SMSService:
         # Retorna como está se não conseguir determinar
         return phone
     
+    def get_pool_status(self) -> list:
+        """Estado de todos os modems do pool"""
+        return self.pool.get_status()
+    
     def get_modem_status(self) -> dict:
         """Obter status do modem GSM"""
         if not self.gsm_modem.is_connected:
@@ -266,6 +540,7 @@ class SMSService:
             
             # Parar monitoramento
             self.is_monitoring = False
+            self._new_sms_event.set()
             if self.monitoring_thread:
                 self.monitoring_thread.join(timeout=5)
             
@@ -289,11 +564,18 @@ class SMSService:
         """Parar serviço de SMS"""
         logger.info("Parando serviço de SMS...")
         self.is_monitoring = False
+        self._new_sms_event.set()
+        if self.hotplug:
+            self.hotplug.stop()
         
         if self.monitoring_thread:
             self.monitoring_thread.join(timeout=5)
         
+        for modem in list(self.pool.modems.values()):
+            if modem is not self.gsm_modem:
+                modem.disconnect()
         self.gsm_modem.disconnect()
+        self._send_executor.shutdown(wait=False)
         logger.info("Serviço de SMS parado")
     
     def set_incoming_sms_callback(self, callback_func):
@@ -301,7 +583,7 @@ class SMSService:
         self._incoming_sms_callback = callback_func
     
     def _process_incoming_sms(self, sms_data: dict):
-        """Processar SMS recebido"""
+        """Processar SMS recebido já guardado na BD (sms_data['id'])"""
         try:
             # Chamar callback se definido
             if hasattr(self, '_incoming_sms_callback') and self._incoming_sms_callback:
@@ -0,0 +1,228 @@
+"""
+Estatísticas de SMS e da fila
+Os totais de sempre vivem na tabela stat_counters, atualizada na mesma transação que
+cria, muda de estado ou apaga SMS e itens da fila: os flushes acumulam os deltas e
+estes só são escritos no commit (o lock das linhas de contador dura o commit, nunca
+um envio pelo modem). O dashboard lê uma dúzia de linhas em vez de contar as tabelas.
+Intervalos de datas arbitrários usam uma única consulta GROUP BY status, direction.
+"""
+import logging
+from collections import Counter
+from datetime import datetime
+from typing import Dict, Optional, Tuple
+
+from sqlalchemy import event, func, inspect, select
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session
+
+from app.db.models import SMS, SMSDirection, SMSQueue, SMSStatus, StatCounter
+from app.utils.pdu import count_segments
+
+logger = logging.getLogger(__name__)
+
+SMS_METRIC = "sms"
+QUEUE_METRIC = "sms_queue"
+QUEUE_PENDING = "pending"
+QUEUE_PROCESSED = "processed"
+QUEUE_PENDING_SEGMENTS = "pending_segments"
+
+CounterKey = Tuple[str, str]
+
+
+def sms_key(direction, status) -> str:
+    """Chave do contador de SMS: '<direção>:<estado>'"""
+    direction = direction.value if isinstance(direction, SMSDirection) else direction
+    status = status.value if isinstance(status, SMSStatus) else status
+    return f"{direction}:{status}"
+
+
+class StatsService:
+    """Leitura e manutenção dos contadores de estatísticas"""
+
+    @staticmethod
+    def increment(db, deltas: Dict[CounterKey, int]):
+        """
+        Somar deltas aos contadores (na transação de quem chama).
+        INSERT ... ON CONFLICT DO UPDATE: duas transações a criar a mesma chave não colidem.
+        """
+        connection = db.connection() if isinstance(db, Session) else db
+        insert = postgresql_insert if connection.dialect.name == "postgresql" else sqlite_insert
+        # Ordem fixa das chaves: transações concorrentes bloqueiam as linhas pela mesma ordem
+        for (metric, key), delta in sorted(deltas.items()):
+            if not delta:
+                continue
+            statement = insert(StatCounter).values(metric=metric, key=key, value=delta)
+            connection.execute(statement.on_conflict_do_update(
+                index_elements=[StatCounter.metric, StatCounter.key],
+                set_={"value": StatCounter.value + statement.excluded.value}
+            ))
+
+    @staticmethod
+    def counters(db) -> Dict[CounterKey, int]:
+        return {(row.metric, row.key): row.value for row in db.query(StatCounter).all()}
+
+    @staticmethod
+    def sms_totals(db, date_from: Optional[datetime] = None, date_to: Optional[datetime] = None) -> Counter:
+        """
+        Totais por '<direção>:<estado>'.
+        Sem intervalo: contadores (O(1)); com intervalo: um único GROUP BY sobre sms.
+        """
+        if date_from is None and date_to is None:
+            return Counter({
+                key: value for (metric, key), value in StatsService.counters(db).items() if metric == SMS_METRIC
+            })
+
+        query = db.query(SMS.direction, SMS.status, func.count(SMS.id))
+        if date_from is not None:
+            query = query.filter(SMS.created_at >= date_from)
+        if date_to is not None:
+            query = query.filter(SMS.created_at <= date_to)
+        return Counter({
+            sms_key(direction, status): total
+            for direction, status, total in query.group_by(SMS.direction, SMS.status)
+        })
+
+    @staticmethod
+    def dashboard(db, date_from: Optional[datetime] = None, date_to: Optional[datetime] = None) -> Dict[str, float]:
+        """Totais do dashboard (enviados, recebidos, pendentes, falhados, taxa de sucesso)"""
+        totals = StatsService.sms_totals(db, date_from, date_to)
+        outbound = sum(value for key, value in totals.items() if key.startswith(f"{SMSDirection.OUTBOUND.value}:"))
+        sent = (
+            totals[sms_key(SMSDirection.OUTBOUND, SMSStatus.SENT)]
+            + totals[sms_key(SMSDirection.OUTBOUND, SMSStatus.DELIVERED)]
+        )
+        return {
+            "total": sum(totals.values()),
+            "sent": sent,
+            "received": sum(value for key, value in totals.items() if key.startswith(f"{SMSDirection.INBOUND.value}:")),
+            "pending": sum(value for key, value in totals.items() if key.endswith(f":{SMSStatus.PENDING.value}")),
+            "failed": sum(value for key, value in totals.items() if key.endswith(f":{SMSStatus.FAILED.value}")),
+            "outbound": outbound,
+            "success_rate": round(sent / outbound * 100, 2) if outbound else 0,
+        }
+
+    @staticmethod
+    def queue_totals(db) -> Dict[str, int]:
+        """Itens por enviar, processados (desde sempre) e segmentos por enviar"""
+        counters = StatsService.counters(db)
+        return {
+            key: max(0, counters.get((QUEUE_METRIC, key), 0))
+            for key in (QUEUE_PENDING, QUEUE_PROCESSED, QUEUE_PENDING_SEGMENTS)
+        }
+
+    @staticmethod
+    def rebuild(db):
+        """
+        Recalcular os contadores a partir das tabelas (e do arquivo) numa só passagem por tabela.
+        Corre no arranque quando stat_counters está vazia; depois os eventos mantêm-nos.
+        """
+        from app.services.archive_service import archive_service
+
+        deltas: Counter = Counter()
+        sources = [SMS.__table__]
+        archived = archive_service.sms_archive(db)
+        if archived is not None:
+            sources.append(archived)
+        for source in sources:
+            rows = db.execute(
+                select(source.c.direction, source.c.status, func.count())
+                .group_by(source.c.direction, source.c.status)
+            )
+            for direction, status, total in rows:
+                if direction is not None and status is not None:
+                    deltas[(SMS_METRIC, sms_key(direction, status))] += total
+
+        for processed, total in db.query(SMSQueue.processed, func.count(SMSQueue.id)).group_by(SMSQueue.processed):
+            deltas[(QUEUE_METRIC, QUEUE_PROCESSED if processed else QUEUE_PENDING)] += total
+        archived_queue = archive_service.queue.readable(db.connection())
+        if archived_queue is not None:
+            deltas[(QUEUE_METRIC, QUEUE_PROCESSED)] += db.execute(
+                select(func.count()).select_from(archived_queue)
+            ).scalar() or 0
+        deltas[(QUEUE_METRIC, QUEUE_PENDING_SEGMENTS)] = sum(
+            count_segments(message)
+            for (message,) in db.query(SMSQueue.message).filter(SMSQueue.processed == False).yield_per(1000)
+        )
+
+        db.query(StatCounter).delete(synchronize_session=False)
+        db.add_all([StatCounter(metric=metric, key=key, value=value) for (metric, key), value in deltas.items()])
+        db.commit()
+        logger.info(f"📊 Contadores de estatísticas recalculados ({len(deltas)} contadores)")
+
+    @staticmethod
+    def ensure_counters(db):
+        """Inicializar os contadores numa base de dados que ainda não os tem"""
+        if db.query(StatCounter.metric).first() is None:
+            StatsService.rebuild(db)
+
+
+# Manutenção incremental: cada flush acumula as transições; o commit escreve-as
+
+STAT_DELTAS = "stat_deltas"
+
+
+def _load_previous_value(target, value, oldvalue, initiator):
+    return value
+
+
+# active_history: o valor anterior é carregado ao alterar, para o histórico ver a transição
+event.listen(SMS.status, "set", _load_previous_value, active_history=True, retval=True)
+event.listen(SMSQueue.processed, "set", _load_previous_value, active_history=True, retval=True)
+
+
+def _queue_deltas(deltas: Counter, item: SMSQueue, processed: bool, sign: int):
+    if processed:
+        deltas[(QUEUE_METRIC, QUEUE_PROCESSED)] += sign
+    else:
+        deltas[(QUEUE_METRIC, QUEUE_PENDING)] += sign
+        deltas[(QUEUE_METRIC, QUEUE_PENDING_SEGMENTS)] += sign * count_segments(item.message or "")
+
+
+@event.listens_for(Session, "before_flush")
+def _count_deleted(session, flush_context, instances):
+    """Linhas apagadas: ler o estado antes do DELETE"""
+    deltas = session.info.setdefault(STAT_DELTAS, Counter())
+    for obj in session.deleted:
+        if isinstance(obj, SMS):
+            deltas[(SMS_METRIC, sms_key(obj.direction, obj.status))] -= 1
+        elif isinstance(obj, SMSQueue):
+            _queue_deltas(deltas, obj, bool(obj.processed), -1)
+
+
+@event.listens_for(Session, "after_flush")
+def _count_changes(session, flush_context):
+    """Linhas novas e transições de estado (acumuladas até ao commit)"""
+    deltas = session.info.setdefault(STAT_DELTAS, Counter())
+    for obj in session.new:
+        if isinstance(obj, SMS):
+            deltas[(SMS_METRIC, sms_key(obj.direction, obj.status))] += 1
+        elif isinstance(obj, SMSQueue):
+            _queue_deltas(deltas, obj, bool(obj.processed), 1)
+
+    for obj in session.dirty:
+        if isinstance(obj, SMS):
+            history = inspect(obj).attrs.status.history
+            if history.deleted and history.added and history.deleted[0] != history.added[0]:
+                deltas[(SMS_METRIC, sms_key(obj.direction, history.deleted[0]))] -= 1
+                deltas[(SMS_METRIC, sms_key(obj.direction, history.added[0]))] += 1
+        elif isinstance(obj, SMSQueue):
+            history = inspect(obj).attrs.processed.history
+            if history.deleted and history.added and bool(history.deleted[0]) != bool(history.added[0]):
+                _queue_deltas(deltas, obj, bool(history.deleted[0]), -1)
+                _queue_deltas(deltas, obj, bool(history.added[0]), 1)
+
+
+@event.listens_for(Session, "before_commit")
+def _apply_deltas(session):
+    """Escrever os deltas da transação imediatamente antes do COMMIT"""
+    if session.new or session.dirty or session.deleted:
+        session.flush()  # O flush final do commit vem depois deste evento
+    deltas = session.info.pop(STAT_DELTAS, None)
+    if deltas:
+        StatsService.increment(session, deltas)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_deltas(session):
+    session.info.pop(STAT_DELTAS, None)
@@ -0,0 +1,145 @@
+"""
+Encaminhador de códigos de resultado não solicitados (URC) do modem GSM
+Separa +CMTI, +CDS, +CUSD, +CREG, etc. das respostas aos comandos AT
+e publica-os para os subscritores registados
+"""
+import threading
+import queue
+import csv
+import re
+import logging
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Prefixos de URC reconhecidos
+URC_PREFIXES = ("+CMTI:", "+CMT:", "+CDSI:", "+CDS:", "+CUSD:", "+CREG:", "+CGREG:", "+CBM:", "RING")
+
+# URCs seguidos de uma linha de dados (texto da mensagem ou PDU)
+URC_WITH_BODY = ("+CMT:", "+CBM:")
+
+
+def urc_type(line: str) -> Optional[str]:
+    """Obter o tipo do URC (ex: 'CMTI') ou None se a linha não for um URC"""
+    for prefix in URC_PREFIXES:
+        if line.startswith(prefix):
+            return prefix.lstrip("+").rstrip(":")
+    return None
+
+
+def expects_body(line: str) -> bool:
+    """+CMT/+CBM e +CDS em modo PDU ('+CDS: <length>') trazem uma linha de dados a seguir"""
+    return line.startswith(URC_WITH_BODY) or re.fullmatch(r'\+CDS:\s*\d+', line) is not None
+
+
+def parse_urc_params(line: str) -> List[str]:
+    """Extrair parâmetros separados por vírgula (respeitando aspas)"""
+    if ":" not in line:
+        return []
+    values = line.split(":", 1)[1].strip()
+    if not values:
+        return []
+    return [value.strip() for value in next(csv.reader([values], skipinitialspace=True))]
+
+
+class URCDispatcher:
+    """Publica URCs para subscritores numa thread própria (nunca bloqueia o leitor serial)"""
+
+    def __init__(self, context: Optional[Callable[[], dict]] = None):
+        # Estado do modem no instante em que o URC chega (ex: modo AT+CMGF), juntado ao evento
+        self.context = context
+        self._subscribers: Dict[str, List[Callable[[dict], None]]] = {}
+        self._lock = threading.Lock()
+        self._events: queue.Queue = queue.Queue()
+        self._pending_header: Optional[str] = None
+        self._pending_context: dict = {}
+        self._thread: Optional[threading.Thread] = None
+
+    def subscribe(self, urc: str, callback: Callable[[dict], None]):
+        """Registar callback para um tipo de URC (ex: 'CMTI', '+CMTI' ou '*' para todos)"""
+        key = urc.lstrip("+").rstrip(":").upper()
+        with self._lock:
+            self._subscribers.setdefault(key, []).append(callback)
+        self._ensure_worker()
+
+    def unsubscribe(self, urc: str, callback: Callable[[dict], None]):
+        """Remover callback registado"""
+        key = urc.lstrip("+").rstrip(":").upper()
+        with self._lock:
+            callbacks = self._subscribers.get(key, [])
+            if callback in callbacks:
+                callbacks.remove(callback)
+
+    def claims(self, line: str, command: Optional[str] = None) -> bool:
+        """
+        Verificar se a linha é não solicitada, mesmo com um comando em curso.
+        Linhas com o mesmo prefixo do comando (ex: +CREG: para AT+CREG?) são resposta.
+        """
+        if self._pending_header is not None:
+            return True
+        kind = urc_type(line)
+        if kind is None:
+            return False
+        if command and command.upper().startswith(f"AT+{kind}"):
+            return False
+        return True
+
+    def feed(self, line: str):
+        """Receber linha não solicitada do leitor serial"""
+        if self._pending_header is not None:
+            header, self._pending_header = self._pending_header, None
+            self._publish(header, body=line, context=self._pending_context)
+            return
+
+        if expects_body(line):
+            # Contexto do cabeçalho: o formato do corpo foi decidido pelo modem nesse instante
+            self._pending_header = line
+            self._pending_context = self._snapshot()
+            return
+
+        if urc_type(line) is None:
+            logger.debug(f"📥 Linha não solicitada ignorada: {line}")
+            return
+
+        self._publish(line)
+
+    def _snapshot(self) -> dict:
+        if self.context is None:
+            return {}
+        try:
+            return dict(self.context())
+        except Exception as e:
+            logger.error(f"Erro ao obter o contexto do URC: {e}")
+            return {}
+
+    def _publish(self, line: str, body: Optional[str] = None, context: Optional[dict] = None):
+        event = {
+            **(self._snapshot() if context is None else context),
+            "type": urc_type(line),
+            "raw": line,
+            "params": parse_urc_params(line),
+            "body": body,
+            "received_at": datetime.now()
+        }
+        logger.debug(f"📨 URC {event['type']}: {line}")
+        self._events.put(event)
+        self._ensure_worker()
+
+    def _ensure_worker(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._deliver_loop, name="urc-dispatcher", daemon=True)
+                self._thread.start()
+
+    def _deliver_loop(self):
+        """Entregar eventos aos subscritores"""
+        while True:
+            event = self._events.get()
+            with self._lock:
+                callbacks = list(self._subscribers.get(event["type"], [])) + list(self._subscribers.get("*", []))
+            for callback in callbacks:
+                try:
+                    callback(event)
+                except Exception as e:
+                    logger.error(f"Erro no subscritor de URC {event['type']}: {e}")
@@ -0,0 +1,304 @@
+"""
+Codificação e descodificação de SMS em modo PDU (3GPP TS 23.040 / 23.038)
+- alfabeto GSM 03.38 de 7 bits (com tabela de extensão) e UCS-2
+- SMS-SUBMIT (envio), SMS-DELIVER (receção) e SMS-STATUS-REPORT (+CDS)
+- cabeçalho UDH (mensagens concatenadas)
+"""
+import math
+from typing import Dict, List, Optional, Tuple
+
+from shared.sms import (
+    ENCODING_GSM7, ENCODING_UCS2, GSM7_BASIC, GSM7_ESCAPE, GSM7_EXTENSION, SEGMENT_LIMITS,
+    count_segments, detect_encoding, is_gsm7, message_units, split_message
+)
+from shared.sms import GSM7_INDEX as _GSM7_INDEX
+
+_GSM7_EXTENSION_REVERSE = {value: char for char, value in GSM7_EXTENSION.items()}
+
+# Codificação dos dados (DCS)
+DCS_GSM7 = 0x00
+DCS_8BIT = 0x04
+DCS_UCS2 = 0x08
+
+# Tamanho do campo de dados do utilizador (TP-UD)
+MAX_UD_OCTETS = 140
+
+# Estado (<stat>) do AT+CMGL/AT+CMGR em modo PDU
+PDU_STATUS = {0: "REC UNREAD", 1: "REC READ", 2: "STO UNSENT", 3: "STO SENT"}
+
+
+class PDUError(ValueError):
+    """PDU inválido ou truncado"""
+
+
+# ---------------------------------------------------------------------------
+# Alfabeto e empacotamento
+# ---------------------------------------------------------------------------
+
+def to_septets(text: str) -> List[int]:
+    """Converter texto em septetos GSM 03.38 (caracteres da extensão ocupam 2)"""
+    septets = []
+    for char in text:
+        if char in _GSM7_INDEX:
+            septets.append(_GSM7_INDEX[char])
+        elif char in GSM7_EXTENSION:
+            septets.extend((GSM7_ESCAPE, GSM7_EXTENSION[char]))
+        else:
+            septets.append(_GSM7_INDEX["?"])
+    return septets
+
+
+def from_septets(septets: List[int]) -> str:
+    """Converter septetos GSM 03.38 em texto"""
+    chars = []
+    escape = False
+    for septet in septets:
+        if escape:
+            chars.append(_GSM7_EXTENSION_REVERSE.get(septet, " "))
+            escape = False
+        elif septet == GSM7_ESCAPE:
+            escape = True
+        else:
+            chars.append(GSM7_BASIC[septet])
+    return "".join(chars)
+
+
+def pack_septets(septets: List[int], padding_bits: int = 0) -> bytes:
+    """Empacotar septetos em octetos (LSB primeiro), com bits de enchimento após o UDH"""
+    bits = 0
+    bit_count = padding_bits
+    for septet in septets:
+        bits |= (septet & 0x7F) << bit_count
+        bit_count += 7
+    return bits.to_bytes(math.ceil(bit_count / 8), "little") if bit_count else b""
+
+
+def unpack_septets(data: bytes, count: int, padding_bits: int = 0) -> List[int]:
+    """Desempacotar 'count' septetos a partir do bit 'padding_bits'"""
+    bits = int.from_bytes(data, "little")
+    bits >>= padding_bits
+    return [(bits >> (7 * index)) & 0x7F for index in range(count)]
+
+
+def encode_ucs2(text: str) -> bytes:
+    """UCS-2 (UTF-16 BE; emoji ocupam um par de substitutos)"""
+    return text.encode("utf-16-be")
+
+
+def decode_ucs2(data: bytes) -> str:
+    return data.decode("utf-16-be", errors="replace")
+
+
+# ---------------------------------------------------------------------------
+# Endereços e carimbos temporais
+# ---------------------------------------------------------------------------
+
+def _swap_nibbles(digits: str) -> bytes:
+    if len(digits) % 2:
+        digits += "F"
+    return bytes.fromhex("".join(digits[i + 1] + digits[i] for i in range(0, len(digits), 2)))
+
+
+def _unswap_nibbles(data: bytes) -> str:
+    digits = "".join(f"{byte:02X}"[::-1] for byte in data)
+    return digits.rstrip("F")
+
+
+def encode_address(number: str) -> bytes:
+    """Endereço de destino: <n.º de dígitos><tipo><dígitos em semi-octetos>"""
+    international = number.startswith("+")
+    digits = "".join(char for char in number if char.isdigit())
+    type_of_address = 0x91 if international else 0x81
+    return bytes([len(digits), type_of_address]) + _swap_nibbles(digits)
+
+
+def decode_address(data: bytes, offset: int) -> Tuple[str, int]:
+    """Ler endereço (OA/RA); devolve (número, novo offset)"""
+    length = data[offset]
+    type_of_address = data[offset + 1]
+    octets = math.ceil(length / 2)
+    raw = data[offset + 2:offset + 2 + octets]
+    if len(raw) < octets:
+        raise PDUError("Endereço truncado")
+
+    if type_of_address & 0x70 == 0x50:
+        # Alfanumérico (ex: nome do operador), codificado em GSM7
+        number = from_septets(unpack_septets(raw, length * 4 // 7))
+    else:
+        number = _unswap_nibbles(raw)
+        if type_of_address & 0x70 == 0x10:
+            number = "+" + number
+    return number, offset + 2 + octets
+
+
+def decode_timestamp(data: bytes) -> str:
+    """SCTS em semi-octetos → formato do modo texto ('yy/MM/dd,hh:mm:ss+zz')"""
+    fields = [_unswap_nibbles(bytes([byte])).rjust(2, "0") for byte in data[:6]]
+    tz_byte = int(f"{data[6]:02X}"[::-1], 16)
+    sign = "-" if tz_byte & 0x80 else "+"
+    quarters = int(f"{tz_byte & 0x7F:02X}")
+    return f"{fields[0]}/{fields[1]}/{fields[2]},{fields[3]}:{fields[4]}:{fields[5]}{sign}{quarters:02d}"
+
+
+# ---------------------------------------------------------------------------
+# UDH
+# ---------------------------------------------------------------------------
+
+def build_concat_udh(reference: int, total: int, sequence: int) -> bytes:
+    """UDH de concatenação com referência de 8 bits (IEI 0x00)"""
+    return bytes([0x05, 0x00, 0x03, reference & 0xFF, total, sequence])
+
+
+def parse_udh(udh: bytes) -> Dict[str, int]:
+    """Extrair informação de concatenação do UDH (IEI 0x00 e 0x08)"""
+    info = {}
+    offset = 1  # ignorar UDHL
+    while offset + 1 < len(udh):
+        iei, length = udh[offset], udh[offset + 1]
+        value = udh[offset + 2:offset + 2 + length]
+        if iei == 0x00 and length == 3:
+            info = {"reference": value[0], "total": value[1], "sequence": value[2]}
+        elif iei == 0x08 and length == 4:
+            info = {"reference": (value[0] << 8) | value[1], "total": value[2], "sequence": value[3]}
+        offset += 2 + length
+    return info
+
+
+# ---------------------------------------------------------------------------
+# SMS-SUBMIT
+# ---------------------------------------------------------------------------
+
+def encode_submit(number: str, text: str, encoding: Optional[str] = None, udh: bytes = b"",
+                  status_report: bool = False, validity: int = 0xA7) -> Tuple[str, int]:
+    """
+    Construir PDU SMS-SUBMIT.
+
+    Returns:
+        (PDU em hexadecimal com SCA vazio, comprimento do TPDU para AT+CMGS=<length>)
+    """
+    encoding = encoding or detect_encoding(text)
+
+    first_octet = 0x11  # SMS-SUBMIT com validade relativa
+    if udh:
+        first_octet |= 0x40
+    if status_report:
+        first_octet |= 0x20
+
+    if encoding == ENCODING_GSM7:
+        dcs = DCS_GSM7
+        septets = to_septets(text)
+        udh_septets = math.ceil(len(udh) * 8 / 7)
+        padding = udh_septets * 7 - len(udh) * 8
+        user_data = udh + pack_septets(septets, padding)
+        user_data_length = udh_septets + len(septets)
+    else:
+        dcs = DCS_UCS2
+        user_data = udh + encode_ucs2(text)
+        user_data_length = len(user_data)
+
+    if len(user_data) > MAX_UD_OCTETS:
+        raise PDUError(f"Mensagem excede {MAX_UD_OCTETS} octetos ({len(user_data)})")
+
+    tpdu = (
+        bytes([first_octet, 0x00])  # TP-MR atribuído pelo modem
+        + encode_address(number)
+        + bytes([0x00, dcs, validity, user_data_length])
+        + user_data
+    )
+    return "00" + tpdu.hex().upper(), len(tpdu)
+
+
+# ---------------------------------------------------------------------------
+# SMS-DELIVER / SMS-STATUS-REPORT
+# ---------------------------------------------------------------------------
+
+def _alphabet(dcs: int) -> int:
+    """0 = GSM7, 1 = 8 bits, 2 = UCS-2"""
+    if dcs & 0xC0 == 0x00:
+        return (dcs >> 2) & 0x03
+    if dcs & 0xF0 == 0xF0:
+        return 1 if dcs & 0x04 else 0
+    if dcs & 0xF0 == 0xE0:
+        return 2
+    return 0
+
+
+def _skip_sca(data: bytes) -> int:
+    return data[0] + 1
+
+
+def decode_pdu(pdu_hex: str) -> dict:
+    """Descodificar PDU recebido (com SCA) de AT+CMGL/AT+CMGR/+CMT/+CDS"""
+    try:
+        data = bytes.fromhex(pdu_hex.strip())
+    except ValueError:
+        raise PDUError("PDU não é hexadecimal")
+
+    try:
+        offset = _skip_sca(data)
+        first_octet = data[offset]
+        message_type = first_octet & 0x03
+        if message_type == 0x00:
+            return _decode_deliver(data, offset)
+        if message_type == 0x02:
+            return _decode_status_report(data, offset)
+        return {"type": "SUBMIT"}
+    except IndexError:
+        raise PDUError("PDU truncado")
+
+
+def _decode_deliver(data: bytes, offset: int) -> dict:
+    first_octet = data[offset]
+    sender, offset = decode_address(data, offset + 1)
+    dcs = data[offset + 1]
+    timestamp = decode_timestamp(data[offset + 2:offset + 9])
+    user_data_length = data[offset + 9]
+    user_data = data[offset + 10:]
+
+    udh = b""
+    if first_octet & 0x40:
+        udh = user_data[:user_data[0] + 1]
+
+    alphabet = _alphabet(dcs)
+    if alphabet == 0:
+        udh_septets = math.ceil(len(udh) * 8 / 7)
+        padding = udh_septets * 7 - len(udh) * 8
+        septets = unpack_septets(user_data[len(udh):], user_data_length - udh_septets, padding)
+        content = from_septets(septets)
+    elif alphabet == 2:
+        content = decode_ucs2(user_data[len(udh):user_data_length])
+    else:
+        content = user_data[len(udh):user_data_length].hex().upper()
+
+    return {
+        "type": "DELIVER",
+        "sender": sender,
+        "timestamp": timestamp,
+        "content": content,
+        "encoding": ENCODING_UCS2 if alphabet == 2 else ENCODING_GSM7,
+        "concat": parse_udh(udh) if udh else None,
+    }
+
+
+def _decode_status_report(data: bytes, offset: int) -> dict:
+    reference = data[offset + 1]
+    recipient, offset = decode_address(data, offset + 2)
+    return {
+        "type": "STATUS_REPORT",
+        "reference": reference,
+        "recipient": recipient,
+        "timestamp": decode_timestamp(data[offset:offset + 7]),
+        "discharge_time": decode_timestamp(data[offset + 7:offset + 14]),
+        "status": data[offset + 14],
+    }
+
+
+# Reexportados de shared.sms: gsm_service e os serviços de envio importam a segmentação daqui
+__all__ = [
+    "ENCODING_GSM7", "ENCODING_UCS2", "GSM7_BASIC", "GSM7_ESCAPE", "GSM7_EXTENSION", "SEGMENT_LIMITS",
+    "count_segments", "detect_encoding", "is_gsm7", "message_units", "split_message",
+    "DCS_GSM7", "DCS_8BIT", "DCS_UCS2", "MAX_UD_OCTETS", "PDU_STATUS", "PDUError",
+    "to_septets", "from_septets", "pack_septets", "unpack_septets", "encode_ucs2", "decode_ucs2",
+    "encode_address", "decode_address", "decode_timestamp", "build_concat_udh", "parse_udh",
+    "encode_submit", "decode_pdu",
+]
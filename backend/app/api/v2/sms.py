@@ -4,6 +4,7 @@ Gestão completa de SMS com suporte a envio individual, bulk e agendamento
 """
 
 from fastapi import APIRouter, Depends, HTTPException, status, Query, BackgroundTasks
+from sqlalchemy import func
 from sqlalchemy.orm import Session
 from typing import List, Optional
 from datetime import datetime
@@ -20,18 +21,40 @@ from shared.schemas import (
     PaginationQuery, SearchQuery
 )
 from shared.models import MessageStatus, MessageType
-from shared.constants import MAX_SMS_LENGTH, MAX_BULK_RECIPIENTS
+from shared.constants import MAX_BULK_RECIPIENTS
 from shared.utils import validate_phone_number
+from shared.pagination import CountCache, keyset_page
+from shared.search import full_text_index
+from shared.sms import message_too_long
 
 # Imports locais
 from ...db.database import get_db
 from ...db.models import User, SMS, SMSStatus, SMSDirection
 from ...services.sms_service import SMSService
+from ...services.rate_limiter import rate_limiter
 from .auth import get_current_user
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
 
+# Totais da listagem reaproveitados entre páginas (COUNT caro em históricos grandes)
+list_count_cache = CountCache(ttl=30)
+
+def check_rate_limit(user_id: int, cost: int = 1):
+    """Rejeitar com 429 se o utilizador excedeu os limites de envio ou de chamadas"""
+    # Tudo ou nada: verificar os dois âmbitos sem consumir e só depois consumir
+    # (custos diferentes: uma chamada à API, cost segmentos no limite de envio)
+    wait = max(
+        rate_limiter.check({"api": user_id}, consume=False),
+        rate_limiter.check({"user": user_id}, cost, consume=False)
+    ) or rate_limiter.check({"api": user_id}) or rate_limiter.check({"user": user_id}, cost)
+    if wait:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail=f"Limite de envio atingido. Tente novamente em {int(wait) + 1}s",
+            headers={"Retry-After": str(int(wait) + 1)}
+        )
+
 def get_sms_service() -> SMSService:
     """Factory para obter instância do serviço SMS."""
     return SMSService()
@@ -48,7 +71,7 @@ async def send_sms(
     Envia SMS individual.
     
     - **to**: Número de destino (formato internacional)
-    - **message**: Texto da mensagem (máx. 1600 caracteres)
+    - **message**: Texto da mensagem (máx. 459 caracteres em até 3 partes)
     - **schedule_at**: Data/hora para agendamento (opcional)
     """
     try:
@@ -59,12 +82,17 @@ async def send_sms(
                 detail="Número de telefone inválido"
             )
         
-        if len(sms_data.message) > MAX_SMS_LENGTH:
+        # Mensagens longas seguem como SMS concatenado (até MAX_SMS_PARTS segmentos, contados
+        # na codificação real: 153 caracteres por parte em GSM, 67 em UCS-2)
+        too_long = message_too_long(sms_data.message)
+        if too_long:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
-                detail=f"Mensagem muito longa. Máximo {MAX_SMS_LENGTH} caracteres"
+                detail=too_long
             )
         
+        check_rate_limit(current_user.id)
+        
         # Verificar se é agendamento futuro
         is_scheduled = sms_data.schedule_at and sms_data.schedule_at > datetime.utcnow()
         
@@ -130,7 +158,7 @@ async def send_bulk_sms(
     Envia SMS em lote.
     
     - **recipients**: Lista de números de destino (máx. 100)
-    - **message**: Texto da mensagem (máx. 1600 caracteres)
+    - **message**: Texto da mensagem (máx. 459 caracteres em até 3 partes)
     - **schedule_at**: Data/hora para agendamento (opcional)
     """
     try:
@@ -141,10 +169,13 @@ async def send_bulk_sms(
                 detail=f"Máximo {MAX_BULK_RECIPIENTS} destinatários por envio"
             )
         
-        if len(bulk_data.message) > MAX_SMS_LENGTH:
+        # Mensagens longas seguem como SMS concatenado (até MAX_SMS_PARTS segmentos, contados
+        # na codificação real: 153 caracteres por parte em GSM, 67 em UCS-2)
+        too_long = message_too_long(bulk_data.message)
+        if too_long:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
-                detail=f"Mensagem muito longa. Máximo {MAX_SMS_LENGTH} caracteres"
+                detail=too_long
             )
         
         # Validar todos os números
@@ -162,6 +193,9 @@ async def send_bulk_sms(
         # Remover duplicatas
         unique_recipients = list(set(bulk_data.recipients))
         
+        # Um pedido, um SMS por destinatário
+        check_rate_limit(current_user.id, cost=len(unique_recipients))
+        
         # Verificar se é agendamento futuro
         is_scheduled = bulk_data.schedule_at and bulk_data.schedule_at > datetime.utcnow()
         
@@ -238,14 +272,18 @@ async def list_sms(
     date_from: Optional[datetime] = Query(None, description="Data inicial"),
     date_to: Optional[datetime] = Query(None, description="Data final"),
     search: Optional[str] = Query(None, description="Buscar na mensagem"),
+    cursor: Optional[str] = Query(None, description="Cursor da página seguinte (next_cursor)"),
+    include_total: bool = Query(True, description="Incluir o total (contagem em cache)"),
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
     """
     Lista SMS do usuário com paginação e filtros.
     
-    - **page**: Número da página (inicia em 1)
+    - **page**: Número da página (inicia em 1; ignorado com cursor)
     - **per_page**: Items por página (1-100)
+    - **cursor**: Continuar a partir do next_cursor da resposta anterior (sem OFFSET)
+    - **include_total**: false dispensa a contagem do total
     - **status**: Filtrar por status (pending, sent, delivered, failed)
     - **phone_number**: Filtrar por número de telefone
     - **date_from**: Data inicial (ISO format)
@@ -273,16 +311,23 @@ async def list_sms(
             query = query.filter(Message.created_at <= date_to)
         
         if search:
-            query = query.filter(Message.message.contains(search))
-        
-        # Contar total
-        total = query.count()
-        
-        # Aplicar paginação e ordenação
-        messages = query.order_by(Message.created_at.desc())\
-                       .offset((page - 1) * per_page)\
-                       .limit(per_page)\
-                       .all()
+            # Índice de texto integral (cada palavra como prefixo) em vez de LIKE '%termo%'
+            query = full_text_index(Message.message).filter(query, search, db.get_bind())
+        
+        # Contar total (em cache por utilizador e filtros)
+        total = None
+        if include_total:
+            count_key = (current_user.id, status, phone_number, date_from, date_to, search)
+            total = list_count_cache.get(count_key, query.count)
+        
+        # Aplicar paginação e ordenação (cursor; page só sem cursor, por compatibilidade)
+        try:
+            messages, next_cursor = keyset_page(
+                query, Message.created_at, Message.id, per_page, cursor,
+                db.get_bind().dialect.name, offset=(page - 1) * per_page
+            )
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
         
         # Preparar response
         sms_responses = []
@@ -301,9 +346,12 @@ async def list_sms(
             total=total,
             page=page,
             per_page=per_page,
-            has_next=total > page * per_page
+            has_next=next_cursor is not None,
+            next_cursor=next_cursor
         )
         
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Erro ao listar SMS: {str(e)}")
         raise HTTPException(
@@ -429,19 +477,23 @@ async def get_sms_stats(
         if date_to:
             query = query.filter(Message.created_at <= date_to)
         
-        # Calcular estatísticas
-        total_messages = query.count()
-        sent_messages = query.filter(Message.status == MessageStatus.SENT.value).count()
-        delivered_messages = query.filter(Message.status == MessageStatus.DELIVERED.value).count()
-        failed_messages = query.filter(Message.status == MessageStatus.FAILED.value).count()
-        pending_messages = query.filter(Message.status == MessageStatus.PENDING.value).count()
+        # Uma só passagem: contagem e custo por estado
+        by_status = {
+            status_value: (count, cost)
+            for status_value, count, cost in query.with_entities(
+                Message.status, func.count(Message.id), func.sum(Message.cost)
+            ).group_by(Message.status)
+        }
         
-        # Calcular custo total (se disponível)
-        total_cost = db.query(db.func.sum(Message.cost)).filter(
-            Message.user_id == current_user.id,
-            Message.message_type == MessageType.SMS.value,
-            Message.cost.isnot(None)
-        ).scalar() or 0
+        def count_of(message_status: MessageStatus) -> int:
+            return by_status.get(message_status.value, (0, None))[0]
+        
+        total_messages = sum(count for count, _ in by_status.values())
+        sent_messages = count_of(MessageStatus.SENT)
+        delivered_messages = count_of(MessageStatus.DELIVERED)
+        failed_messages = count_of(MessageStatus.FAILED)
+        pending_messages = count_of(MessageStatus.PENDING)
+        total_cost = sum(cost or 0 for _, cost in by_status.values())
         
         # Taxa de sucesso
         success_rate = 0
@@ -17,7 +17,7 @@ import os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(__file__)))))
 
 from shared.schemas import SystemHealthResponse, ModemStatusResponse
-from shared.constants import SYSTEM_VERSION, API_VERSION
+from shared.constants import SYSTEM_VERSION, API_VERSION, MOZAMBICAN_OPERATOR_PREFIXES
 
 # Imports locais
 from ...db.database import get_db
@@ -197,25 +197,16 @@ async def get_system_stats(
         
         # Top operadores (baseado nos números de telefone)
         operator_stats = db.query(
-            db.func.substr(Message.phone_number, 1, 7).label('prefix'),
+            db.func.substr(Message.phone_number, 1, 6).label('prefix'),
             db.func.count(Message.id).label('count')
         ).filter(
             Message.created_at >= yesterday
         ).group_by('prefix').order_by(db.text('count DESC')).limit(5).all()
         
-        # Mapear prefixos para operadores (exemplo para Moçambique)
-        operator_map = {
-            '+25882': 'mCel',
-            '+25883': 'mCel', 
-            '+25884': 'Vodacom',
-            '+25885': 'Vodacom',
-            '+25886': 'Movitel',
-            '+25887': 'Movitel'
-        }
-        
+        # Mapear prefixos para operadores (Moçambique)
         operator_distribution = {}
         for prefix, count in operator_stats:
-            operator = operator_map.get(prefix, 'Outros')
+            operator = MOZAMBICAN_OPERATOR_PREFIXES.get(prefix, 'Outros')
             operator_distribution[operator] = operator_distribution.get(operator, 0) + count
         
         return {
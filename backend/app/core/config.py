@@ -29,6 +29,10 @@ class Settings(BaseSettings):
     # Redis (Filas)
     REDIS_URL: str = "redis://localhost:6379/0"
     
+    # Limitação de taxa (RATE_LIMIT_* de shared/constants por utilizador e chamadas à API)
+    RATE_LIMIT_ENABLED: bool = True
+    RATE_LIMIT_BACKEND: str = "memory"  # "memory" ou "redis" (REDIS_URL, partilhado entre processos)
+    
     # Segurança
     SECRET_KEY: str = "sua_chave_secreta_muito_forte_aqui_mude_em_producao"
     ALGORITHM: str = "HS256"
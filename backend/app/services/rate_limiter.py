@@ -0,0 +1,11 @@
+"""
+Limitador de taxa da API v2
+Instância única configurada a partir das settings (memória ou Redis)
+"""
+from backend.app.core.config import settings
+from shared.rate_limit import RateLimiter
+
+rate_limiter = RateLimiter(
+    redis_url=settings.REDIS_URL if settings.RATE_LIMIT_BACKEND.lower() == "redis" else None,
+    enabled=settings.RATE_LIMIT_ENABLED
+)
@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+"""
+Benchmark da leitura da fila de SMS (_get_next_queue_items)
+Enche uma base de dados temporária até 1M de itens por enviar e mede, a cada
+ordem de grandeza, a reclamação de um lote com os índices parciais comparada
+com a consulta antiga (OR em scheduled_for + ordenação de toda a fila).
+
+Com os índices o custo não depende do tamanho da fila: os itens sem agendamento
+são lidos já pela ordem de envio e dos agendados só se ordenam os já vencidos
+(em regime normal, os que venceram desde o último ciclo).
+
+Uso: python benchmark_queue_fetch.py [--rows 1000000] [--url postgresql://...]
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.append(os.path.dirname(__file__))
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark da leitura da fila de SMS")
+    parser.add_argument("--rows", type=int, default=1_000_000, help="Itens na fila no último passo")
+    parser.add_argument("--url", default=None, help="Base de dados (por omissão: SQLite temporário)")
+    parser.add_argument("--runs", type=int, default=20, help="Medições por passo")
+    return parser.parse_args()
+
+
+args = parse_args()
+db_path = None
+if args.url is None:
+    db_path = os.path.join(tempfile.mkdtemp(), "benchmark_queue.db")
+    args.url = f"sqlite:///{db_path}"
+
+# Antes de importar a aplicação: base de dados do benchmark e nenhum modem aberto
+os.environ["DATABASE_URL"] = args.url
+os.environ["DEBUG"] = "false"
+os.environ["GSM_PORT"] = "NONE"
+os.environ["GSM_HOTPLUG_ENABLED"] = "false"
+os.environ["GSM_POOL_ENABLED"] = "false"
+
+import logging
+logging.disable(logging.WARNING)
+
+from sqlalchemy import insert, select
+from app.db.database import Base, SessionLocal, engine
+from app.db.models import SMSQueue
+from app.services.queue_processor import SMSQueueProcessor, queue_processor
+
+CHUNK = 50_000
+OVERDUE = 500
+
+
+def fill(db, start: int, end: int):
+    """
+    Itens start..end: ~90% sem agendamento, 8% agendados no futuro, 2% processados e,
+    entre os primeiros, OVERDUE agendados já vencidos (o atraso que se acumula entre ciclos)
+    """
+    now = datetime.utcnow()
+    base_time = now - timedelta(days=1)
+    rows = []
+    for i in range(start, end):
+        kind = random.random()
+        rows.append({
+            "phone_to": f"+25884{i:07d}",
+            "message": "Benchmark",
+            "priority": random.choice((0, 0, 0, 1, 2)),
+            "scheduled_for": (
+                now - timedelta(minutes=5) if i < OVERDUE else
+                now + timedelta(days=1) if kind < 0.08 else None
+            ),
+            "processed": i >= OVERDUE and kind >= 0.98,
+            "created_at": base_time + timedelta(milliseconds=i),
+        })
+        if len(rows) >= CHUNK:
+            db.execute(insert(SMSQueue), rows)
+            rows.clear()
+    if rows:
+        db.execute(insert(SMSQueue), rows)
+    db.commit()
+
+
+def legacy_fetch(db, limit: int = 5) -> list:
+    """Consulta antes dos índices parciais (OR em scheduled_for, ordena toda a fila)"""
+    now = datetime.utcnow()
+    return list(db.execute(
+        select(SMSQueue.id).where(
+            SMSQueue.processed == False,
+            (SMSQueue.scheduled_for.is_(None)) | (SMSQueue.scheduled_for <= now),
+            (SMSQueue.lease_owner.is_(None)) | (SMSQueue.lease_expires_at < now)
+        ).order_by(SMSQueue.priority.desc(), SMSQueue.created_at.asc()).limit(limit)
+    ).scalars())
+
+
+def measure(func, runs: int) -> float:
+    """Tempo médio em milissegundos (sessão nova por medição)"""
+    total = 0.0
+    for _ in range(runs):
+        db = SessionLocal()
+        try:
+            started = time.perf_counter()
+            func(db)
+            total += time.perf_counter() - started
+        finally:
+            db.close()
+    return total * 1000 / runs
+
+
+def print_plan(db):
+    if engine.dialect.name != "sqlite":
+        return
+    now = datetime.utcnow()
+    statement = select(SMSQueue.id).where(SMSQueue.id.in_(SMSQueueProcessor._due_ids(now, 20)))
+    compiled = statement.compile(engine, compile_kwargs={"literal_binds": True})
+    print("\n📋 Plano (SQLite) da seleção de candidatos:")
+    for row in db.connection().exec_driver_sql(f"EXPLAIN QUERY PLAN {compiled}"):
+        print(f"   {row[-1]}")
+
+
+def main():
+    print("📊 Benchmark da fila de SMS")
+    print(f"   Base de dados: {engine.url.render_as_string(hide_password=True)}")
+    print("=" * 64)
+    Base.metadata.create_all(bind=engine)
+
+    steps = [size for size in (10_000, 100_000, 1_000_000, 10_000_000) if size < args.rows] + [args.rows]
+    print(f"{'Itens':>12} | {'Com índices (ms)':>17} | {'Consulta antiga (ms)':>21}")
+    print("-" * 64)
+
+    db = SessionLocal()
+    filled = 0
+    try:
+        for size in steps:
+            fill(db, filled, size)
+            filled = size
+            db.connection().exec_driver_sql("ANALYZE")
+            db.commit()
+
+            claim_ms = measure(lambda session: queue_processor._get_next_queue_items(session, limit=5), args.runs)
+            legacy_ms = measure(legacy_fetch, max(1, args.runs // 4))
+            print(f"{size:>12,} | {claim_ms:>17.2f} | {legacy_ms:>21.2f}")
+
+        print_plan(db)
+    finally:
+        db.close()
+        if db_path:
+            engine.dispose()
+            os.remove(db_path)
+
+
+if __name__ == "__main__":
+    main()
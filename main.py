@@ -8,7 +8,7 @@ from app.db.database import engine, SessionLocal
 from app.db import models
 from app.services.command_service import CommandService
 from app.services.sms_service import SMSService
-from app.db.models import SMS, SMSStatus, SMSDirection
+from app.db.models import SMS
 import logging
 
 # Configurar logging
@@ -35,34 +35,41 @@ def create_default_data():
         command_service = CommandService()
         command_service.create_default_commands(db)
         logger.info("Dados padrão criados")
+        
+        # Contadores do dashboard (recalculados só se a tabela estiver vazia)
+        from app.services.stats_service import StatsService
+        StatsService.ensure_counters(db)
+        
+        # Índice de texto integral das mensagens (criado só na primeira vez)
+        from shared.search import full_text_index
+        full_text_index(SMS.message).ensure(engine)
     except Exception as e:
         logger.error(f"Erro ao criar dados padrão: {e}")
     finally:
         db.close()
 
 def handle_incoming_sms(sms_data: dict):
-    """Callback para processar SMS recebidos do modem"""
+    """Callback para processar SMS recebidos do modem (já guardados na BD pelo InboxService)"""
     db = SessionLocal()
     try:
-        # Criar registro de SMS recebido
-        sms = SMS(
-            phone_from=sms_data['sender'],
-            phone_to="Modem GSM",  # Nosso número (será obtido do modem posteriormente)
-            message=sms_data['content'],
-            status=SMSStatus.RECEIVED,
-            direction=SMSDirection.INBOUND,
-            external_id=str(sms_data.get('index', ''))
-        )
-        db.add(sms)
+        # Regras de reencaminhamento e filtragem (SMS concatenados chegam já montados)
+        from app.services.forwarding_service import ForwardingRuleService
+        sms = db.query(SMS).filter(SMS.id == sms_data['id']).first()
+        forwarding_result = ForwardingRuleService(db).process_sms(sms)
         db.commit()
-        db.refresh(sms)
         
-        # Processar comandos automáticos
+        # Bloqueado/apagado por regra: o registo fica (chave de deduplicação), sem comandos
+        if forwarding_result.get('blocked') or forwarding_result.get('deleted'):
+            logger.info(f"SMS de {sms.phone_from} filtrado por regra de reencaminhamento")
+            return
+        
+        # Processar comandos automáticos de imediato
+        # (callback corre na thread de monitoramento do modem, que não tem event loop)
         command_service = CommandService()
         import asyncio
-        asyncio.create_task(command_service.process_incoming_sms(sms.id, db))
+        asyncio.run(command_service.process_incoming_sms(sms_data['id'], db))
         
-        logger.info(f"SMS recebido processado: ID {sms.id}")
+        logger.info(f"SMS recebido processado: ID {sms_data['id']}")
         
     except Exception as e:
         logger.error(f"Erro ao processar SMS recebido: {str(e)}")
@@ -138,6 +145,14 @@ async def startup_event():
     except Exception as e:
         logger.error(f"Erro ao inicializar processador de fila: {str(e)}")
     
+    # Arquivo periódico das linhas frias de sms e sms_queue
+    if settings.ARCHIVE_ENABLED:
+        try:
+            from app.services.archive_service import archive_service
+            archive_service.start()
+        except Exception as e:
+            logger.error(f"Erro ao iniciar arquivo de SMS: {str(e)}")
+    
     logger.info("AMA MESSAGE iniciado com sucesso!")
 
 @app.on_event("shutdown")
@@ -159,6 +174,10 @@ async def shutdown_event():
     except Exception as e:
         logger.error(f"Erro ao encerrar processador de fila: {str(e)}")
     
+    if settings.ARCHIVE_ENABLED:
+        from app.services.archive_service import archive_service
+        archive_service.stop()
+    
     logger.info("AMA MESSAGE encerrado")
 
 @app.get("/")
@@ -0,0 +1,47 @@
+"""
+Script de migração para adicionar a chave de deduplicação aos SMS recebidos
+Necessário para bases de dados criadas antes da ingestão idempotente
+(bases novas já recebem a coluna via Base.metadata.create_all)
+"""
+
+from sqlalchemy import create_engine, inspect, text
+from app.core.config import settings
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+def run_migration():
+    """Adicionar coluna sms.dedupe_key e índice único"""
+    try:
+        engine = create_engine(settings.DATABASE_URL)
+        
+        logger.info("Conectando ao banco de dados...")
+        inspector = inspect(engine)
+        columns = [column["name"] for column in inspector.get_columns("sms")]
+        unique_columns = [
+            constraint["column_names"]
+            for constraint in inspector.get_unique_constraints("sms") + inspector.get_indexes("sms")
+            if constraint.get("unique", True)
+        ]
+        
+        with engine.begin() as conn:
+            if "dedupe_key" in columns:
+                logger.info("✅ Coluna 'dedupe_key' já existe na tabela SMS")
+            else:
+                logger.info("➕ Adicionando coluna 'dedupe_key'...")
+                conn.execute(text("ALTER TABLE sms ADD COLUMN dedupe_key VARCHAR(64)"))
+            
+            # SQLite não aceita ADD COLUMN ... UNIQUE: usar índice único (NULLs não colidem)
+            if ["dedupe_key"] not in unique_columns:
+                logger.info("➕ Criando índice único 'uq_sms_dedupe_key'...")
+                conn.execute(text("CREATE UNIQUE INDEX uq_sms_dedupe_key ON sms (dedupe_key)"))
+        
+        logger.info("🎉 Migração concluída com sucesso!")
+        
+    except Exception as e:
+        logger.error(f"❌ Erro durante a migração: {str(e)}")
+        raise
+
+if __name__ == "__main__":
+    run_migration()
@@ -0,0 +1,29 @@
+"""
+Script de migração para criar o índice de texto integral das mensagens SMS
+PostgreSQL: índice GIN sobre to_tsvector('portuguese', message), criado com CONCURRENTLY;
+SQLite: tabela FTS5 sms_fts, triggers de sincronização e indexação das SMS existentes.
+(a aplicação também o cria no arranque; correr antes evita esperar por ele num deploy)
+"""
+
+from sqlalchemy import create_engine
+from app.core.config import settings
+from app.db.models import SMS
+from shared.search import full_text_index
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+def run_migration():
+    """Criar o índice de texto integral de sms.message"""
+    engine = create_engine(settings.DATABASE_URL)
+    
+    logger.info("Conectando ao banco de dados...")
+    if not full_text_index(SMS.message).ensure(engine):
+        logger.error("❌ Não foi possível criar o índice de texto integral (a pesquisa usará LIKE)")
+        raise SystemExit(1)
+    
+    logger.info("🎉 Migração concluída com sucesso!")
+
+if __name__ == "__main__":
+    run_migration()
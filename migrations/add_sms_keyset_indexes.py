@@ -0,0 +1,52 @@
+"""
+Script de migração para criar os índices da paginação por cursor da tabela sms
+Sem eles, cada página de /api/sms/list, inbox e outbox ordena todas as SMS
+(bases novas já recebem os índices via Base.metadata.create_all)
+"""
+
+from sqlalchemy import create_engine, inspect
+from app.core.config import settings
+from app.db.models import SMS
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+KEYSET_INDEXES = ("ix_sms_created_at_id", "ix_sms_direction_created_at_id")
+
+def run_migration():
+    """Criar ix_sms_created_at_id e ix_sms_direction_created_at_id"""
+    try:
+        engine = create_engine(settings.DATABASE_URL)
+        
+        logger.info("Conectando ao banco de dados...")
+        inspector = inspect(engine)
+        existing = {index["name"] for index in inspector.get_indexes("sms")}
+        indexes = {index.name: index for index in SMS.__table__.indexes}
+        
+        for name in KEYSET_INDEXES:
+            if name in existing:
+                logger.info(f"✅ Índice '{name}' já existe na tabela sms")
+                continue
+            
+            logger.info(f"➕ Criando índice '{name}'...")
+            if engine.dialect.name == "postgresql":
+                # CONCURRENTLY (fora de transação): a tabela continua a receber SMS durante a criação
+                indexes[name].dialect_options["postgresql"]["concurrently"] = True
+                with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+                    indexes[name].create(conn)
+            else:
+                with engine.begin() as conn:
+                    indexes[name].create(conn)
+        
+        with engine.begin() as conn:
+            conn.exec_driver_sql("ANALYZE sms")
+        
+        logger.info("🎉 Migração concluída com sucesso!")
+        
+    except Exception as e:
+        logger.error(f"❌ Erro durante a migração: {str(e)}")
+        raise
+
+if __name__ == "__main__":
+    run_migration()
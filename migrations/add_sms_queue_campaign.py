@@ -0,0 +1,42 @@
+"""
+Script de migração para ligar a fila de SMS às campanhas
+Necessário para bases de dados criadas antes do envio em massa por campanhas
+(a tabela campaigns e, em bases novas, a coluna são criadas via Base.metadata.create_all)
+"""
+
+from sqlalchemy import create_engine, inspect, text
+from app.core.config import settings
+from app.db.database import Base
+from app.db.models import Campaign
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+def run_migration():
+    """Criar tabela campaigns (com os contadores de progresso) e adicionar coluna sms_queue.campaign_id"""
+    try:
+        engine = create_engine(settings.DATABASE_URL)
+        
+        logger.info("Conectando ao banco de dados...")
+        Base.metadata.create_all(bind=engine, tables=[Campaign.__table__])
+        
+        inspector = inspect(engine)
+        columns = [column["name"] for column in inspector.get_columns("sms_queue")]
+        
+        with engine.begin() as conn:
+            if "campaign_id" in columns:
+                logger.info("✅ Coluna 'campaign_id' já existe na tabela sms_queue")
+            else:
+                logger.info("➕ Adicionando coluna 'campaign_id'...")
+                conn.execute(text("ALTER TABLE sms_queue ADD COLUMN campaign_id INTEGER REFERENCES campaigns (id)"))
+                conn.execute(text("CREATE INDEX ix_sms_queue_campaign_id ON sms_queue (campaign_id)"))
+        
+        logger.info("🎉 Migração concluída com sucesso!")
+        
+    except Exception as e:
+        logger.error(f"❌ Erro durante a migração: {str(e)}")
+        raise
+
+if __name__ == "__main__":
+    run_migration()
@@ -0,0 +1,52 @@
+"""
+Script de migração para criar os índices parciais da fila por enviar
+Sem eles, cada ciclo do processador ordena todos os itens por processar
+(bases novas já recebem os índices via Base.metadata.create_all)
+"""
+
+from sqlalchemy import create_engine, inspect
+from app.core.config import settings
+from app.db.models import SMSQueue
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+DUE_INDEXES = ("ix_sms_queue_due_unscheduled", "ix_sms_queue_due_scheduled")
+
+def run_migration():
+    """Criar ix_sms_queue_due_unscheduled e ix_sms_queue_due_scheduled"""
+    try:
+        engine = create_engine(settings.DATABASE_URL)
+        
+        logger.info("Conectando ao banco de dados...")
+        inspector = inspect(engine)
+        existing = {index["name"] for index in inspector.get_indexes("sms_queue")}
+        indexes = {index.name: index for index in SMSQueue.__table__.indexes}
+        
+        for name in DUE_INDEXES:
+            if name in existing:
+                logger.info(f"✅ Índice '{name}' já existe na tabela sms_queue")
+                continue
+            
+            logger.info(f"➕ Criando índice '{name}'...")
+            if engine.dialect.name == "postgresql":
+                # CONCURRENTLY (fora de transação): a fila continua a receber e a enviar durante a criação
+                indexes[name].dialect_options["postgresql"]["concurrently"] = True
+                with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+                    indexes[name].create(conn)
+            else:
+                with engine.begin() as conn:
+                    indexes[name].create(conn)
+        
+        with engine.begin() as conn:
+            conn.exec_driver_sql("ANALYZE sms_queue")
+        
+        logger.info("🎉 Migração concluída com sucesso!")
+        
+    except Exception as e:
+        logger.error(f"❌ Erro durante a migração: {str(e)}")
+        raise
+
+if __name__ == "__main__":
+    run_migration()
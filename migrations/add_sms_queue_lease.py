@@ -0,0 +1,44 @@
+"""
+Script de migração para adicionar as colunas de concessão (lease) à fila de SMS
+Necessário para bases de dados criadas antes do processamento com vários workers
+(bases novas já recebem as colunas via Base.metadata.create_all)
+"""
+
+from sqlalchemy import create_engine, inspect, text
+from app.core.config import settings
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+def run_migration():
+    """Adicionar colunas sms_queue.lease_owner e sms_queue.lease_expires_at"""
+    try:
+        engine = create_engine(settings.DATABASE_URL)
+        
+        logger.info("Conectando ao banco de dados...")
+        inspector = inspect(engine)
+        columns = [column["name"] for column in inspector.get_columns("sms_queue")]
+        timestamp_type = "TIMESTAMP WITH TIME ZONE" if engine.dialect.name == "postgresql" else "DATETIME"
+        
+        with engine.begin() as conn:
+            if "lease_owner" in columns:
+                logger.info("✅ Coluna 'lease_owner' já existe na tabela sms_queue")
+            else:
+                logger.info("➕ Adicionando coluna 'lease_owner'...")
+                conn.execute(text("ALTER TABLE sms_queue ADD COLUMN lease_owner VARCHAR(64)"))
+            
+            if "lease_expires_at" in columns:
+                logger.info("✅ Coluna 'lease_expires_at' já existe na tabela sms_queue")
+            else:
+                logger.info("➕ Adicionando coluna 'lease_expires_at'...")
+                conn.execute(text(f"ALTER TABLE sms_queue ADD COLUMN lease_expires_at {timestamp_type}"))
+        
+        logger.info("🎉 Migração concluída com sucesso!")
+        
+    except Exception as e:
+        logger.error(f"❌ Erro durante a migração: {str(e)}")
+        raise
+
+if __name__ == "__main__":
+    run_migration()
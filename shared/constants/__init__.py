@@ -10,6 +10,8 @@ API_VERSION = "v2"
 # Limites do sistema
 MAX_SMS_LENGTH = 160
 MAX_SMS_PARTS = 3
+MAX_SMS_SEGMENT_LENGTH = 153  # Caracteres GSM por segmento de SMS concatenado (UDH de 6 octetos)
+MAX_SMS_MESSAGE_LENGTH = MAX_SMS_PARTS * MAX_SMS_SEGMENT_LENGTH  # Mensagem concatenada completa
 MAX_USSD_TIMEOUT = 60
 MAX_USSD_SESSION_DURATION = 300  # 5 minutos para sessões USSD
 MAX_CONTACTS_PER_USER = 1000
@@ -73,6 +75,23 @@ PORTUGUESE_OPERATORS = {
     'VODAFONE': ['92', '93']  # Prefixos Vodafone
 }
 
+# Operadoras moçambicanas por prefixo do número (formato internacional)
+MOZAMBICAN_OPERATOR_PREFIXES = {
+    '+25882': 'mCel',
+    '+25883': 'mCel',
+    '+25884': 'Vodacom',
+    '+25885': 'Vodacom',
+    '+25886': 'Movitel',
+    '+25887': 'Movitel'
+}
+
+# Rede registada em formato numérico (AT+COPS com <format>=2): MCC+MNC
+MOZAMBICAN_OPERATOR_PLMN = {
+    '64301': 'mCel',
+    '64303': 'Movitel',
+    '64304': 'Vodacom'
+}
+
 # Tipos de usuário e permissões
 USER_TYPES = {
     'INDIVIDUAL': {
@@ -289,8 +308,10 @@ MONITORING_CONFIG = {
 
 # Export das constantes principais
 __all__ = [
-    'SYSTEM_VERSION', 'API_VERSION', 'MAX_SMS_LENGTH', 'MAX_BULK_RECIPIENTS', 'MAX_USSD_SESSION_DURATION', 
+    'SYSTEM_VERSION', 'API_VERSION', 'MAX_SMS_LENGTH', 'MAX_SMS_PARTS', 'MAX_SMS_SEGMENT_LENGTH',
+    'MAX_SMS_MESSAGE_LENGTH', 'MAX_BULK_RECIPIENTS', 'MAX_USSD_SESSION_DURATION', 
     'MAX_FORWARDING_RULES_PER_USER', 'SUPPORTED_COUNTRY_CODES',
+    'MOZAMBICAN_OPERATOR_PREFIXES', 'MOZAMBICAN_OPERATOR_PLMN',
     'USER_TYPES', 'AUTH_CONFIG', 'API_CONFIG', 'ERROR_CODES', 'MESSAGE_TEMPLATES',
     'ENVIRONMENT_CONFIGS', 'PLATFORM_CONFIGS', 'JWT_SECRET_KEY', 'JWT_ALGORITHM', 
     'JWT_ACCESS_TOKEN_EXPIRE_MINUTES'
@@ -0,0 +1,127 @@
+"""
+Paginação por cursor (keyset) do AMAMESSAGE
+As listas ordenadas por created_at DESC avançam a partir da última linha devolvida
+(WHERE (created_at, id) < (cursor)) em vez de saltar OFFSET linhas: o custo de uma
+página não depende da profundidade. O cursor é opaco para o cliente (base64 de
+[created_at, id]) e o total, caro em tabelas grandes, é opcional e fica em cache.
+"""
+import base64
+import json
+import threading
+import time
+from datetime import datetime
+from typing import Any, Callable, Dict, Hashable, List, Optional, Tuple
+
+from sqlalchemy import String, and_, case, func, or_, type_coerce
+
+Cursor = Tuple[datetime, Any]
+
+
+def encode_cursor(created_at: datetime, row_id: Any) -> str:
+    """Cursor opaco que aponta para a linha (created_at, id)"""
+    payload = json.dumps([created_at.isoformat(), row_id], separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Cursor:
+    """(created_at, id) de um cursor; ValueError se for inválido"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        created_at, row_id = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        # bool é subclasse de int, mas nunca é um id
+        if not isinstance(row_id, int) or isinstance(row_id, bool):
+            raise ValueError(f"id do cursor não é inteiro: {row_id!r}")
+        return datetime.fromisoformat(created_at), row_id
+    except (TypeError, ValueError, UnicodeDecodeError) as e:
+        raise ValueError(f"Cursor inválido: {cursor}") from e
+
+
+def _sortable_created(created_column, dialect_name: str):
+    """
+    created_at na forma comparada e ordenada pela paginação.
+    O SQLite guarda datas como texto em dois formatos: '... 10:00:00' (DEFAULT CURRENT_TIMESTAMP)
+    e '... 10:00:00.000000' (escritas pelo ORM, sempre com microssegundos). Comparar o texto
+    tal como está separa o mesmo instante; completar o primeiro formato com '.000000' dá uma
+    ordem única, a mesma no ORDER BY e no filtro do cursor (frações curtas, '.5', levam zeros).
+    """
+    if dialect_name != "sqlite":
+        return created_column
+    return case(
+        (func.length(created_column) == 19, created_column.concat(".000000")),
+        else_=func.substr(created_column.concat("000000"), 1, 26)
+    )
+
+
+def _created_at_value(created_at: datetime, dialect_name: str):
+    """Valor do cursor a comparar com _sortable_created (no SQLite, texto com microssegundos)"""
+    if dialect_name != "sqlite":
+        return created_at
+    if created_at.tzinfo is not None:
+        created_at = created_at.replace(tzinfo=None)
+    return type_coerce(created_at.strftime("%Y-%m-%d %H:%M:%S.%f"), String)
+
+
+def keyset_page(query, created_column, id_column, limit: int, cursor: Optional[str] = None,
+                dialect_name: str = "", offset: int = 0) -> Tuple[List[Any], Optional[str]]:
+    """
+    Uma página de query por ordem (created_at DESC, id DESC), a seguir ao cursor.
+    Sem cursor aceita ainda um offset (clientes antigos); a resposta traz na mesma
+    o cursor da página seguinte, para o cliente poder passar a usá-lo.
+
+    Returns:
+        (linhas, cursor da página seguinte ou None se esta for a última)
+    """
+    created = _sortable_created(created_column, dialect_name)
+    query = query.order_by(created.desc(), id_column.desc())
+    if cursor:
+        created_at, row_id = decode_cursor(cursor)
+        value = _created_at_value(created_at, dialect_name)
+        query = query.filter(or_(
+            created < value,
+            and_(created == value, id_column < row_id)
+        ))
+    elif offset:
+        query = query.offset(offset)
+
+    # Uma linha a mais diz se há página seguinte sem contar nada
+    rows = query.limit(limit + 1).all()
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    last = rows[-1]
+    return rows, encode_cursor(last.created_at, last.id)
+
+
+class CountCache:
+    """Totais por conjunto de filtros, reaproveitados durante ttl segundos"""
+
+    def __init__(self, ttl: float = 30.0, max_entries: int = 256):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: Dict[Hashable, Tuple[float, int]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, count: Callable[[], int]) -> int:
+        """Total em cache para key ou, se expirado, o resultado de count()"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry[0] > now:
+                return entry[1]
+
+        value = count()
+        with self._lock:
+            if len(self._entries) >= self.max_entries:
+                # Descartar primeiro as entradas expiradas; senão a mais antiga
+                expired = [k for k, (expires, _) in self._entries.items() if expires <= now]
+                for k in expired or [min(self._entries, key=lambda k: self._entries[k][0])]:
+                    del self._entries[k]
+            self._entries[key] = (now + self.ttl, value)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+__all__ = ["encode_cursor", "decode_cursor", "keyset_page", "CountCache"]
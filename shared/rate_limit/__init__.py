@@ -0,0 +1,231 @@
+"""
+Limitador de taxa hierárquico (token bucket) do AMAMESSAGE
+Aplica os limites RATE_LIMIT_* por âmbito (modem/SIM, utilizador, destinatário, API, USSD).
+Cada âmbito tem um balde por janela (minuto/hora/dia); um pedido só passa se todos os
+baldes envolvidos tiverem fichas, e nesse caso consome-as em todos (tudo ou nada).
+Cada decisão custa O(número de baldes), independente do histórico de envios.
+Em memória por omissão; com redis_url os baldes ficam no Redis (vários processos/hosts).
+"""
+import threading
+import time
+import logging
+from typing import Dict, List, Optional, Tuple
+
+from shared.constants import (
+    RATE_LIMIT_SMS_PER_MINUTE, RATE_LIMIT_SMS_PER_HOUR, RATE_LIMIT_SMS_PER_DAY,
+    RATE_LIMIT_USSD_PER_MINUTE, RATE_LIMIT_API_CALLS_PER_MINUTE
+)
+
+logger = logging.getLogger(__name__)
+
+SMS_LIMITS = [
+    (RATE_LIMIT_SMS_PER_MINUTE, 60),
+    (RATE_LIMIT_SMS_PER_HOUR, 3600),
+    (RATE_LIMIT_SMS_PER_DAY, 86400),
+]
+
+# Âmbito -> [(fichas, período em segundos)]
+DEFAULT_LIMITS: Dict[str, List[Tuple[int, int]]] = {
+    "modem": SMS_LIMITS,          # Por SIM: evita bloqueio/abrandamento pela operadora
+    "user": SMS_LIMITS,           # Por utilizador (ou cliente da API)
+    "destination": SMS_LIMITS,    # Por número de destino
+    "ussd": [(RATE_LIMIT_USSD_PER_MINUTE, 60)],
+    "api": [(RATE_LIMIT_API_CALLS_PER_MINUTE, 60)],
+}
+
+# Verificar e consumir vários baldes de forma atómica no Redis
+# KEYS: baldes; ARGV: agora, custo, consumir(0/1), depois pares capacidade/taxa por balde
+_REDIS_SCRIPT = """
+local now = tonumber(ARGV[1])
+local cost = tonumber(ARGV[2])
+local consume = tonumber(ARGV[3])
+local wait = 0
+local tokens = {}
+for i, key in ipairs(KEYS) do
+    local capacity = tonumber(ARGV[2 + i * 2])
+    local rate = tonumber(ARGV[3 + i * 2])
+    local state = redis.call('HMGET', key, 'tokens', 'ts')
+    local available = tonumber(state[1]) or capacity
+    local ts = tonumber(state[2]) or now
+    available = math.min(capacity, available + math.max(0, now - ts) * rate)
+    tokens[i] = available
+    local need = math.min(cost, capacity)
+    if available < need then
+        wait = math.max(wait, (need - available) / rate)
+    end
+end
+if wait == 0 and consume == 1 then
+    for i, key in ipairs(KEYS) do
+        local capacity = tonumber(ARGV[2 + i * 2])
+        local rate = tonumber(ARGV[3 + i * 2])
+        redis.call('HSET', key, 'tokens', tokens[i] - math.min(cost, capacity), 'ts', now)
+        redis.call('EXPIRE', key, math.ceil(capacity / rate) + 60)
+    end
+end
+return tostring(wait)
+"""
+
+
+class TokenBucket:
+    """Balde de fichas: capacidade = limite da janela, reposição contínua a limite/período"""
+
+    __slots__ = ("capacity", "rate", "tokens", "updated")
+
+    def __init__(self, capacity: float, period: float, now: float):
+        self.capacity = float(capacity)
+        self.rate = capacity / period
+        self.tokens = float(capacity)
+        self.updated = now
+
+    def _refill(self, now: float):
+        if now > self.updated:
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+
+    def wait_time(self, cost: float, now: float) -> float:
+        """Segundos até haver fichas para o custo (0 = já)"""
+        self._refill(now)
+        need = min(cost, self.capacity)  # Um pedido maior que o balde passa quando este estiver cheio
+        return 0.0 if self.tokens >= need else (need - self.tokens) / self.rate
+
+    def consume(self, cost: float):
+        self.tokens -= min(cost, self.capacity)
+
+
+class RateLimiter:
+    """Limitador hierárquico: âmbitos x janelas, decisão tudo-ou-nada"""
+
+    def __init__(self, limits: Optional[Dict[str, List[Tuple[int, int]]]] = None,
+                 redis_url: Optional[str] = None, enabled: bool = True, prefix: str = "ratelimit"):
+        self.limits = dict(DEFAULT_LIMITS if limits is None else limits)
+        self.enabled = enabled
+        self.prefix = prefix
+        self._lock = threading.Lock()
+        self._buckets: Dict[Tuple[str, str, int], TokenBucket] = {}
+        self._prune_at = 10000
+        self._stats: Dict[str, Dict[str, int]] = {}
+        self._redis = None
+        self._redis_script = None
+        if redis_url and enabled:
+            self._connect_redis(redis_url)
+
+    @property
+    def backend(self) -> str:
+        return "redis" if self._redis is not None else "memory"
+
+    def _connect_redis(self, redis_url: str):
+        try:
+            import redis
+            client = redis.Redis.from_url(redis_url, socket_timeout=1)
+            client.ping()
+            self._redis = client
+            self._redis_script = client.register_script(_REDIS_SCRIPT)
+        except Exception as e:
+            logger.warning(f"⚠️ Redis indisponível para limitação de taxa, a usar memória: {e}")
+            self._redis = None
+
+    def _windows(self, scopes: Dict[str, Optional[str]]) -> List[Tuple[str, str, int, int]]:
+        """(âmbito, valor, limite, período) para os âmbitos com valor e limites definidos"""
+        windows = []
+        for scope, value in scopes.items():
+            if value is None:
+                continue
+            for limit, period in self.limits.get(scope, ()):
+                windows.append((scope, str(value), limit, period))
+        return windows
+
+    def check(self, scopes: Dict[str, Optional[str]], cost: float = 1, consume: bool = True) -> float:
+        """
+        Verificar (e, se permitido e consume=True, consumir) as fichas de todos os âmbitos.
+
+        Args:
+            scopes: ex. {"modem": "/dev/ttyUSB0", "destination": "+258841234567"}
+            cost: fichas pedidas (ex: segmentos de um SMS)
+
+        Returns:
+            0.0 se permitido; senão segundos até poder passar (nada é consumido)
+        """
+        if not self.enabled:
+            return 0.0
+        windows = self._windows(scopes)
+        if not windows:
+            return 0.0
+
+        if self._redis is not None:
+            try:
+                wait = self._check_redis(windows, cost, consume)
+                with self._lock:
+                    self._count(scopes, wait)
+                return wait
+            except Exception as e:
+                logger.warning(f"⚠️ Erro no Redis, limitação de taxa passa a memória: {e}")
+                self._redis = None
+
+        now = time.monotonic()
+        with self._lock:
+            if len(self._buckets) > self._prune_at:
+                self._prune(now)
+            buckets = []
+            for scope, value, limit, period in windows:
+                key = (scope, value, period)
+                bucket = self._buckets.get(key)
+                if bucket is None:
+                    bucket = self._buckets[key] = TokenBucket(limit, period, now)
+                buckets.append(bucket)
+            wait = max(bucket.wait_time(cost, now) for bucket in buckets)
+            if wait == 0 and consume:
+                for bucket in buckets:
+                    bucket.consume(cost)
+            self._count(scopes, wait)
+        return wait
+
+    def _prune(self, now: float):
+        """Descartar baldes já cheios (equivalem a um balde novo): memória limitada aos âmbitos ativos"""
+        for key, bucket in list(self._buckets.items()):
+            if bucket.wait_time(bucket.capacity, now) == 0:
+                del self._buckets[key]
+        self._prune_at = max(10000, 2 * len(self._buckets))
+
+    def _check_redis(self, windows, cost: float, consume: bool) -> float:
+        keys = [f"{self.prefix}:{scope}:{value}:{period}" for scope, value, limit, period in windows]
+        args = [time.time(), cost, 1 if consume else 0]
+        for scope, value, limit, period in windows:
+            args += [limit, limit / period]
+        return float(self._redis_script(keys=keys, args=args))
+
+    def acquire(self, scopes: Dict[str, Optional[str]], cost: float = 1, timeout: float = 0) -> float:
+        """
+        Esperar (até timeout segundos) por fichas em todos os âmbitos e consumi-las.
+
+        Returns:
+            0.0 se as fichas foram consumidas; senão segundos até poder passar (nada é consumido)
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            wait = self.check(scopes, cost)
+            if wait == 0:
+                return 0.0
+            if time.monotonic() + wait > deadline:
+                return wait
+            time.sleep(wait)
+
+    def _count(self, scopes: Dict[str, Optional[str]], wait: float):
+        outcome = "allowed" if wait == 0 else "limited"
+        for scope, value in scopes.items():
+            if value is not None:
+                stats = self._stats.setdefault(scope, {"allowed": 0, "limited": 0})
+                stats[outcome] += 1
+
+    def get_stats(self) -> dict:
+        """Decisões por âmbito (permitidas/limitadas) e configuração ativa"""
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "backend": self.backend,
+                "limits": {
+                    scope: [{"limit": limit, "period_seconds": period} for limit, period in windows]
+                    for scope, windows in self.limits.items()
+                },
+                "decisions": {scope: dict(stats) for scope, stats in self._stats.items()},
+                "buckets": len(self._buckets),
+            }
@@ -15,7 +15,8 @@ sys.path.append(os.path.dirname(os.path.dirname(__file__)))
 
 from models import MessageStatus, MessageType, UserType, USSDSessionStatus, PlatformType
 from utils import validate_phone_number, validate_ussd_code
-from constants import MAX_SMS_LENGTH, MAX_CONTACTS_PER_USER
+from constants import MAX_SMS_MESSAGE_LENGTH, MAX_CONTACTS_PER_USER
+from sms import message_too_long
 
 # Schemas de autenticação
 class LoginRequest(BaseModel):
@@ -99,7 +100,7 @@ class UserUpdate(BaseModel):
 class SMSSendRequest(BaseModel):
     """Schema para envio de SMS."""
     to: str = Field(..., description="Número de destino")
-    message: str = Field(..., min_length=1, max_length=MAX_SMS_LENGTH, description="Mensagem")
+    message: str = Field(..., min_length=1, max_length=MAX_SMS_MESSAGE_LENGTH, description="Mensagem")
     schedule_at: Optional[datetime] = Field(None, description="Agendamento (opcional)")
     
     @validator('to')
@@ -107,11 +108,19 @@ class SMSSendRequest(BaseModel):
         if not validate_phone_number(v):
             raise ValueError('Número de telefone inválido')
         return v
+    
+    @validator('message')
+    def validate_message(cls, v):
+        # max_length só vale para GSM; em UCS-2 cada parte leva 67 caracteres
+        reason = message_too_long(v)
+        if reason:
+            raise ValueError(reason)
+        return v
 
 class SMSBulkSendRequest(BaseModel):
     """Schema para envio de SMS em lote."""
     recipients: List[str] = Field(..., min_items=1, max_items=100, description="Lista de destinatários")
-    message: str = Field(..., min_length=1, max_length=MAX_SMS_LENGTH, description="Mensagem")
+    message: str = Field(..., min_length=1, max_length=MAX_SMS_MESSAGE_LENGTH, description="Mensagem")
     schedule_at: Optional[datetime] = Field(None, description="Agendamento (opcional)")
     
     @validator('recipients')
@@ -120,6 +129,13 @@ class SMSBulkSendRequest(BaseModel):
             if not validate_phone_number(phone):
                 raise ValueError(f'Número de telefone inválido: {phone}')
         return list(set(v))  # Remove duplicatas
+    
+    @validator('message')
+    def validate_message(cls, v):
+        reason = message_too_long(v)
+        if reason:
+            raise ValueError(reason)
+        return v
 
 class SMSResponse(BaseModel):
     """Schema para response de SMS."""
@@ -133,10 +149,11 @@ class SMSResponse(BaseModel):
 class SMSListResponse(BaseModel):
     """Schema para lista de SMS."""
     messages: List[SMSResponse]
-    total: int
+    total: Optional[int] = None
     page: int
     per_page: int
     has_next: bool
+    next_cursor: Optional[str] = None
 
 # Schemas de USSD
 class USSDSendRequest(BaseModel):
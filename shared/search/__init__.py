@@ -0,0 +1,177 @@
+"""
+Pesquisa de texto integral do AMAMESSAGE
+Substitui LIKE '%termo%' (que lê todas as mensagens) por um índice invertido:
+- PostgreSQL: índice GIN sobre to_tsvector('portuguese', coluna), mantido pelo próprio
+  PostgreSQL em cada INSERT/UPDATE; consultas com to_tsquery e ordenação por ts_rank;
+- SQLite (desenvolvimento): tabela FTS5 <tabela>_fts com conteúdo externo, mantida por
+  triggers, e ordenação por bm25.
+Cada palavra do termo é procurada como prefixo ("confirm" encontra "confirmado").
+Noutros motores a pesquisa volta a ser LIKE.
+"""
+import re
+import threading
+import logging
+from typing import Dict, List, Optional
+
+from sqlalchemy import column, func, literal_column, select, table
+
+logger = logging.getLogger(__name__)
+
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def search_terms(text: Optional[str]) -> List[str]:
+    """Palavras do termo de pesquisa (sem operadores nem pontuação)"""
+    return _WORD_RE.findall(text or "")
+
+
+class FullTextIndex:
+    """Índice de texto integral de uma coluna (a tabela tem de ter chave primária inteira)"""
+
+    def __init__(self, text_column, language: str = "portuguese"):
+        self.column = text_column
+        self.table = text_column.table
+        self.id_column = list(self.table.primary_key.columns)[0]
+        self.language = language
+        self.index_name = f"ix_{self.table.name}_{text_column.name}_fts"
+        self.fts_name = f"{self.table.name}_fts"
+        self._ready = set()  # URLs dos motores onde o índice já foi verificado
+        self._lock = threading.Lock()
+
+    # Criação do índice
+
+    def ensure(self, engine) -> bool:
+        """
+        Criar o índice (uma vez por motor) e, no SQLite, indexar as linhas existentes.
+        False se não foi possível (a pesquisa usa então LIKE).
+        """
+        key = str(engine.url)
+        if key in self._ready:
+            return True
+        with self._lock:
+            if key in self._ready:
+                return True
+            try:
+                dialect = engine.dialect.name
+                if dialect == "postgresql":
+                    self._ensure_postgresql(engine)
+                elif dialect == "sqlite":
+                    self._ensure_sqlite(engine)
+                else:
+                    return False
+            except Exception as e:
+                logger.error(f"Erro ao criar o índice de texto integral de {self.table.name}: {str(e)}")
+                return False
+            self._ready.add(key)
+            return True
+
+    def _ensure_postgresql(self, engine):
+        with engine.connect() as conn:
+            exists = conn.exec_driver_sql(
+                "SELECT 1 FROM pg_indexes WHERE tablename = %s AND indexname = %s",
+                (self.table.name, self.index_name)
+            ).first()
+        if exists:
+            return
+        logger.info(f"🔎 Criando índice de texto integral {self.index_name}...")
+        # CONCURRENTLY (fora de transação): a tabela continua a receber linhas durante a criação
+        with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+            conn.exec_driver_sql(
+                f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {self.index_name} ON {self.table.name} "
+                f"USING GIN (to_tsvector('{self.language}'::regconfig, {self.column.name}))"
+            )
+
+    def _ensure_sqlite(self, engine):
+        name, source, text_name, id_name = self.fts_name, self.table.name, self.column.name, self.id_column.name
+        with engine.begin() as conn:
+            exists = conn.exec_driver_sql(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (name,)
+            ).first()
+            if exists:
+                return
+            logger.info(f"🔎 Criando índice de texto integral {name}...")
+            conn.exec_driver_sql(
+                f"CREATE VIRTUAL TABLE {name} USING fts5({text_name}, content='{source}', "
+                f"content_rowid='{id_name}', tokenize='unicode61 remove_diacritics 2')"
+            )
+            conn.exec_driver_sql(
+                f"CREATE TRIGGER {name}_ai AFTER INSERT ON {source} BEGIN "
+                f"INSERT INTO {name}(rowid, {text_name}) VALUES (new.{id_name}, new.{text_name}); END"
+            )
+            conn.exec_driver_sql(
+                f"CREATE TRIGGER {name}_ad AFTER DELETE ON {source} BEGIN "
+                f"INSERT INTO {name}({name}, rowid, {text_name}) VALUES ('delete', old.{id_name}, old.{text_name}); END"
+            )
+            conn.exec_driver_sql(
+                f"CREATE TRIGGER {name}_au AFTER UPDATE OF {text_name} ON {source} BEGIN "
+                f"INSERT INTO {name}({name}, rowid, {text_name}) VALUES ('delete', old.{id_name}, old.{text_name}); "
+                f"INSERT INTO {name}(rowid, {text_name}) VALUES (new.{id_name}, new.{text_name}); END"
+            )
+            conn.exec_driver_sql(f"INSERT INTO {name}({name}) VALUES ('rebuild')")
+
+    # Consultas
+
+    def _tsvector(self):
+        return func.to_tsvector(literal_column(f"'{self.language}'::regconfig"), self.column)
+
+    def _tsquery(self, terms: List[str]):
+        # Mesma configuração do índice; ':*' = prefixo
+        return func.to_tsquery(
+            literal_column(f"'{self.language}'::regconfig"), " & ".join(f"{term}:*" for term in terms)
+        )
+
+    def _fts(self):
+        return table(self.fts_name, column("rowid"), column(self.fts_name))
+
+    @staticmethod
+    def _match_expression(terms: List[str]) -> str:
+        return " ".join(f'"{term}"*' for term in terms)
+
+    def filter(self, query, text: str, engine):
+        """Restringir query às linhas cuja coluna contém todas as palavras de text (como prefixo)"""
+        terms = search_terms(text)
+        if not terms:
+            return query
+        if not self.ensure(engine):
+            return query.filter(self.column.contains(text))
+
+        if engine.dialect.name == "postgresql":
+            return query.filter(self._tsvector().op("@@")(self._tsquery(terms)))
+        fts = self._fts()
+        return query.filter(self.id_column.in_(
+            select(fts.c.rowid).where(fts.c[self.fts_name].op("MATCH")(self._match_expression(terms)))
+        ))
+
+    def ranked(self, query, text: str, engine):
+        """Como filter, ordenado por relevância (mais relevante primeiro), depois pelo mais recente"""
+        terms = search_terms(text)
+        if not terms:
+            return query
+        if not self.ensure(engine):
+            return query.filter(self.column.contains(text)).order_by(self.id_column.desc())
+
+        if engine.dialect.name == "postgresql":
+            tsquery = self._tsquery(terms)
+            return query.filter(self._tsvector().op("@@")(tsquery)).order_by(
+                func.ts_rank(self._tsvector(), tsquery).desc(), self.id_column.desc()
+            )
+        fts = self._fts()
+        # bm25: menor = mais relevante
+        return query.join(fts, fts.c.rowid == self.id_column).filter(
+            fts.c[self.fts_name].op("MATCH")(self._match_expression(terms))
+        ).order_by(func.bm25(literal_column(self.fts_name)), self.id_column.desc())
+
+
+_indexes: Dict[tuple, FullTextIndex] = {}
+
+
+def full_text_index(text_column, language: str = "portuguese") -> FullTextIndex:
+    """Índice partilhado da coluna (criado na primeira utilização)"""
+    key = (text_column.table.name, text_column.name, language)
+    index = _indexes.get(key)
+    if index is None:
+        index = _indexes[key] = FullTextIndex(text_column, language)
+    return index
+
+
+__all__ = ["FullTextIndex", "full_text_index", "search_terms"]
@@ -0,0 +1,102 @@
+"""
+Segmentação de SMS do AMAMESSAGE (3GPP TS 23.038)
+Alfabeto GSM 03.38 de 7 bits (com tabela de extensão), escolha GSM7/UCS-2 e divisão em
+segmentos (160/153 GSM7, 70/67 UCS-2). O limite de uma mensagem é em segmentos e não em
+caracteres: um acento fora do alfabeto GSM passa a mensagem inteira para UCS-2.
+"""
+from typing import List, Optional
+
+from shared.constants import MAX_SMS_PARTS
+
+# Alfabeto GSM 03.38 por omissão (posição = valor do septeto)
+GSM7_BASIC = (
+    "@£$¥èéùìòÇ\nØø\rÅåΔ_ΦΓΛΩΠΨΣΘΞ\x1bÆæßÉ !\"#¤%&'()*+,-./0123456789:;<=>?"
+    "¡ABCDEFGHIJKLMNOPQRSTUVWXYZÄÖÑÜ§¿abcdefghijklmnopqrstuvwxyzäöñüà"
+)
+GSM7_ESCAPE = 0x1B
+
+# Tabela de extensão (precedida de ESC, ocupa 2 septetos)
+GSM7_EXTENSION = {
+    "\f": 0x0A, "^": 0x14, "{": 0x28, "}": 0x29, "\\": 0x2F,
+    "[": 0x3C, "~": 0x3D, "]": 0x3E, "|": 0x40, "€": 0x65,
+}
+
+GSM7_INDEX = {char: index for index, char in enumerate(GSM7_BASIC) if index != GSM7_ESCAPE}
+
+ENCODING_GSM7 = "GSM7"
+ENCODING_UCS2 = "UCS2"
+
+# Caracteres por SMS: (mensagem simples, segmento de mensagem concatenada com UDH de 6 octetos)
+SEGMENT_LIMITS = {"GSM7": (160, 153), "UCS2": (70, 67)}
+
+
+def is_gsm7(text: str) -> bool:
+    """Verificar se o texto cabe no alfabeto GSM 03.38 (sem UCS-2)"""
+    return all(char in GSM7_INDEX or char in GSM7_EXTENSION for char in text)
+
+
+def detect_encoding(text: str) -> str:
+    """GSM7 quando possível, senão UCS2 (acentos fora do alfabeto, emoji, etc.)"""
+    return ENCODING_GSM7 if is_gsm7(text) else ENCODING_UCS2
+
+
+def char_units(char: str, encoding: str) -> int:
+    """Unidades do TP-UD ocupadas por um caractere (septetos GSM7 ou unidades de 16 bits UCS-2)"""
+    if encoding == ENCODING_GSM7:
+        return 2 if char in GSM7_EXTENSION else 1
+    return len(char.encode("utf-16-be")) // 2
+
+
+def message_units(text: str, encoding: Optional[str] = None) -> int:
+    """Tamanho da mensagem nas unidades do TP-UD (septetos GSM7 ou unidades de 16 bits UCS-2)"""
+    encoding = encoding or detect_encoding(text)
+    return sum(char_units(char, encoding) for char in text)
+
+
+def split_message(text: str, encoding: Optional[str] = None) -> List[str]:
+    """
+    Dividir texto em segmentos (160/153 GSM7, 70/67 UCS-2) sem partir
+    sequências ESC da extensão GSM nem pares de substitutos UCS-2 (emoji)
+    """
+    encoding = encoding or detect_encoding(text)
+    single, multi = SEGMENT_LIMITS[encoding]
+    if message_units(text, encoding) <= single:
+        return [text]
+
+    segments = []
+    current = []
+    units = 0
+    for char in text:
+        size = char_units(char, encoding)
+        if units + size > multi:
+            segments.append("".join(current))
+            current, units = [], 0
+        current.append(char)
+        units += size
+    if current:
+        segments.append("".join(current))
+    return segments
+
+
+def count_segments(text: str) -> int:
+    """Número exato de segmentos SMS necessários para o texto"""
+    return len(split_message(text))
+
+
+def message_too_long(text: str, max_parts: int = MAX_SMS_PARTS) -> Optional[str]:
+    """Motivo de recusa se o texto precisar de mais de max_parts segmentos; None se couber"""
+    encoding = detect_encoding(text)
+    segments = len(split_message(text, encoding))
+    if segments <= max_parts:
+        return None
+    return (
+        f"Mensagem muito longa: {segments} partes em {'GSM' if encoding == ENCODING_GSM7 else 'UCS-2'} "
+        f"(máximo {max_parts} partes, {max_parts * SEGMENT_LIMITS[encoding][1]} caracteres)"
+    )
+
+
+__all__ = [
+    "GSM7_BASIC", "GSM7_ESCAPE", "GSM7_EXTENSION", "GSM7_INDEX", "ENCODING_GSM7", "ENCODING_UCS2",
+    "SEGMENT_LIMITS", "is_gsm7", "detect_encoding", "char_units", "message_units",
+    "split_message", "count_segments", "message_too_long",
+]
@@ -0,0 +1,122 @@
+"""
+Testes da paginação por cursor (keyset) numa base SQLite em memória
+"""
+import sys
+import os
+import base64
+from datetime import datetime, timedelta
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from sqlalchemy import Column, DateTime, Integer, create_engine, text
+from sqlalchemy.orm import Session, declarative_base
+
+from shared.pagination import CountCache, decode_cursor, encode_cursor, keyset_page
+
+Base = declarative_base()
+
+
+class Row(Base):
+    __tablename__ = "rows"
+    id = Column(Integer, primary_key=True)
+    created_at = Column(DateTime)
+
+
+def make_session() -> Session:
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+    return Session(engine)
+
+
+def walk(session: Session, limit: int):
+    """Percorrer todas as páginas seguindo o cursor"""
+    ids, cursor, pages = [], None, 0
+    while True:
+        rows, cursor = keyset_page(session.query(Row), Row.created_at, Row.id, limit,
+                                   cursor=cursor, dialect_name="sqlite")
+        ids += [row.id for row in rows]
+        pages += 1
+        if cursor is None:
+            return ids, pages
+
+
+def test_cursor_round_trip():
+    moment = datetime(2026, 10, 17, 10, 0, 0, 123456)
+    cursor = encode_cursor(moment, 42)
+    assert "=" not in cursor
+    assert decode_cursor(cursor) == (moment, 42)
+
+
+def test_invalid_cursors():
+    """Lixo, ids não inteiros (incluindo bool) e datas inválidas dão ValueError"""
+    def raw(payload: str) -> str:
+        return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+    for cursor in ("@@@", raw("[]"), raw('["2026-10-17T10:00:00", "7"]'),
+                   raw('["2026-10-17T10:00:00", true]'), raw('["ontem", 7]')):
+        try:
+            decode_cursor(cursor)
+        except ValueError:
+            continue
+        assert False, f"ValueError esperado para {cursor}"
+
+
+def test_keyset_pages_without_gaps():
+    """Ordem (created_at DESC, id DESC), sem falhas nem repetidos, empates desfeitos pelo id"""
+    session = make_session()
+    start = datetime(2026, 10, 17, 10, 0, 0)
+    for index in range(25):
+        session.add(Row(created_at=start + timedelta(seconds=index // 3)))
+    session.commit()
+
+    ids, pages = walk(session, limit=4)
+    expected = [row.id for row in session.query(Row).order_by(Row.created_at.desc(), Row.id.desc())]
+    assert ids == expected
+    assert pages == 7
+
+
+def test_keyset_mixed_sqlite_formats():
+    """Datas de CURRENT_TIMESTAMP ('... 10:00:00') e do ORM ('... 10:00:00.000000') no mesmo instante"""
+    session = make_session()
+    session.execute(text("INSERT INTO rows (id, created_at) VALUES "
+                         "(1, '2026-10-17 10:00:00'), (2, '2026-10-17 10:00:00.000000'), "
+                         "(3, '2026-10-17 10:00:00'), (4, '2026-10-17 10:00:00.5'), "
+                         "(5, '2026-10-17 09:59:59.999999'), (6, '2026-10-17 10:00:00.000001')"))
+    session.commit()
+
+    for limit in (1, 2, 3):
+        ids, _ = walk(session, limit)
+        assert ids == [4, 6, 3, 2, 1, 5], (limit, ids)
+
+
+def test_keyset_offset_fallback():
+    """Sem cursor aceita offset e devolve na mesma o cursor seguinte"""
+    session = make_session()
+    start = datetime(2026, 10, 17, 10, 0, 0)
+    for index in range(5):
+        session.add(Row(created_at=start + timedelta(minutes=index)))
+    session.commit()
+
+    rows, cursor = keyset_page(session.query(Row), Row.created_at, Row.id, 2, offset=2, dialect_name="sqlite")
+    assert [row.id for row in rows] == [3, 2]
+    rows, cursor = keyset_page(session.query(Row), Row.created_at, Row.id, 2, cursor=cursor, dialect_name="sqlite")
+    assert [row.id for row in rows] == [1]
+    assert cursor is None
+
+
+def test_count_cache():
+    calls = []
+    cache = CountCache(ttl=60, max_entries=2)
+    assert cache.get("a", lambda: calls.append("a") or 10) == 10
+    assert cache.get("a", lambda: calls.append("a") or 99) == 10
+    cache.get("b", lambda: 1)
+    cache.get("c", lambda: 2)  # Cheio: descarta a mais antiga ("a")
+    assert cache.get("a", lambda: calls.append("a") or 11) == 11
+    assert calls == ["a", "a"]
+
+
+if __name__ == "__main__":
+    tests = [value for name, value in list(globals().items()) if name.startswith("test_")]
+    for test in tests:
+        test()
+        print(f"✅ {test.__name__}")
+    print(f"\n🎉 {len(tests)} testes passaram")
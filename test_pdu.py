@@ -0,0 +1,167 @@
+"""
+Testes do modo PDU e da segmentação de SMS (sem modem)
+"""
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.utils.pdu import (
+    ENCODING_GSM7, ENCODING_UCS2, PDUError, build_concat_udh, count_segments, decode_pdu,
+    encode_address, encode_submit, encode_ucs2, from_septets, pack_septets, parse_udh,
+    split_message, to_septets, unpack_septets
+)
+from shared.sms import message_too_long
+
+# SMS-DELIVER de +31641600986 com "How are you?" (exemplo clássico de GSM 03.40)
+DELIVER_PDU = "07911326040000F0040B911346610089F60000208062917314080CC8F71D14969741F977FD07"
+SCTS = "02806291731408"  # 02/08/26,19:37:41-00
+
+
+def build_deliver(sender: str, text: str, udh: bytes = b"", encoding: str = ENCODING_GSM7) -> str:
+    """SMS-DELIVER (com SCA vazio) para testar a receção"""
+    first_octet = 0x40 if udh else 0x00
+    if encoding == ENCODING_GSM7:
+        septets = to_septets(text)
+        udh_septets = -(-len(udh) * 8 // 7)
+        user_data = udh + pack_septets(septets, udh_septets * 7 - len(udh) * 8)
+        dcs, length = 0x00, udh_septets + len(septets)
+    else:
+        user_data = udh + encode_ucs2(text)
+        dcs, length = 0x08, len(user_data)
+    tpdu = bytes([first_octet]) + encode_address(sender) + bytes([0x00, dcs]) + bytes.fromhex(SCTS)
+    return "00" + (tpdu + bytes([length]) + user_data).hex().upper()
+
+
+def test_septets_round_trip():
+    """Alfabeto GSM 03.38 com a tabela de extensão (ESC + código)"""
+    text = "Olà {mundo} €5 [ok]"
+    septets = to_septets(text)
+    assert len(septets) == len(text) + 5  # { } € [ ] ocupam 2 septetos
+    assert from_septets(septets) == text
+    assert unpack_septets(pack_septets(septets), len(septets)) == septets
+
+
+def test_pack_septets_with_padding():
+    """Bits de enchimento após o UDH não alteram os septetos"""
+    septets = to_septets("hellohello")
+    packed = pack_septets(septets, 1)
+    assert unpack_septets(packed, len(septets), 1) == septets
+    assert pack_septets(to_septets("hellohello")).hex() == "e8329bfd4697d9ec37"
+
+
+def test_decode_deliver_reference_pdu():
+    """PDU de referência: remetente, carimbo temporal e texto"""
+    message = decode_pdu(DELIVER_PDU)
+    assert message["type"] == "DELIVER"
+    assert message["sender"] == "+31641600986"
+    assert message["timestamp"] == "02/08/26,19:37:41-00"
+    assert message["content"] == "How are you?"
+    assert message["encoding"] == ENCODING_GSM7
+    assert message["concat"] is None
+
+
+def test_encode_submit_gsm7():
+    """SMS-SUBMIT em GSM7: TPDU e comprimento para AT+CMGS"""
+    pdu, length = encode_submit("+258841234567", "hellohello")
+    assert pdu == "0011000C915288143254760000A70AE8329BFD4697D9EC37"
+    assert length == len(pdu) // 2 - 1  # Sem o octeto do SCA
+
+
+def test_encode_submit_flags_and_ucs2():
+    """Pedido de relatório (TP-SRR), UDH (TP-UDHI) e UCS-2"""
+    udh = build_concat_udh(7, 2, 1)
+    pdu, _ = encode_submit("841234567", "Olá 😀", udh=udh, status_report=True)
+    data = bytes.fromhex(pdu)
+    assert data[1] == 0x11 | 0x40 | 0x20
+    assert data[3:5] == bytes([9, 0x81])  # Número nacional
+    user_data = udh + encode_ucs2("Olá 😀")
+    assert data[-len(user_data) - 3] == 0x08  # DCS UCS-2
+    assert data[-len(user_data) - 1] == len(user_data)
+    assert data.endswith(user_data)
+
+
+def test_encode_submit_too_long():
+    """Mais de 140 octetos de TP-UD é recusado"""
+    try:
+        encode_submit("+258841234567", "a" * 161)
+    except PDUError:
+        pass
+    else:
+        assert False, "PDUError esperado"
+
+
+def test_concat_udh_round_trip():
+    """UDH de concatenação de 8 bits e leitura da variante de 16 bits"""
+    udh = build_concat_udh(300, 3, 2)
+    assert udh == bytes([0x05, 0x00, 0x03, 300 & 0xFF, 3, 2])
+    assert parse_udh(udh) == {"reference": 300 & 0xFF, "total": 3, "sequence": 2}
+    udh16 = bytes([0x06, 0x08, 0x04, 0x01, 0x2C, 4, 1])
+    assert parse_udh(udh16) == {"reference": 300, "total": 4, "sequence": 1}
+
+
+def test_decode_concatenated_parts():
+    """Partes GSM7 e UCS-2 com UDH: texto após o enchimento e dados de concatenação"""
+    text = "Parte um de uma mensagem longa {ext}"
+    message = decode_pdu(build_deliver("+258841234567", text, build_concat_udh(42, 2, 1)))
+    assert message["sender"] == "+258841234567"
+    assert message["content"] == text
+    assert message["concat"] == {"reference": 42, "total": 2, "sequence": 1}
+
+    message = decode_pdu(build_deliver("+258841234567", "Olá 😀", build_concat_udh(42, 2, 2), ENCODING_UCS2))
+    assert message["content"] == "Olá 😀"
+    assert message["encoding"] == ENCODING_UCS2
+    assert message["concat"]["sequence"] == 2
+
+
+def test_decode_status_report():
+    """+CDS: referência, destinatário e estado"""
+    tpdu = bytes([0x06, 0x2A]) + encode_address("+258841234567") + bytes.fromhex(SCTS * 2) + bytes([0x00])
+    report = decode_pdu("00" + tpdu.hex())
+    assert report["type"] == "STATUS_REPORT"
+    assert report["reference"] == 0x2A
+    assert report["recipient"] == "+258841234567"
+    assert report["status"] == 0
+
+
+def test_decode_invalid_pdu():
+    """PDU não hexadecimal ou truncado levanta PDUError"""
+    for pdu in ("XYZ", DELIVER_PDU[:30]):
+        try:
+            decode_pdu(pdu)
+        except PDUError:
+            continue
+        assert False, f"PDUError esperado para {pdu}"
+
+
+def test_split_message_limits():
+    """160/153 em GSM7, 70/67 em UCS-2; extensão e emoji nunca partidos"""
+    assert split_message("a" * 160) == ["a" * 160]
+    assert [len(part) for part in split_message("a" * 161)] == [153, 8]
+    assert count_segments("á" * 70) == 1  # á não está no alfabeto GSM: UCS-2
+    assert count_segments("ã" * 71) == 2
+    assert [len(part) for part in split_message("ã" * 135)] == [67, 67, 1]
+
+    parts = split_message("a" * 152 + "€" + "b" * 7)
+    assert parts[0] == "a" * 152  # O € (ESC + código) não cabe no septeto 153
+    assert parts[1] == "€" + "b" * 7
+
+    parts = split_message("ã" * 66 + "😀")
+    assert parts == ["ã" * 66 + "😀"]  # 68 unidades de 16 bits cabem numa só mensagem (<= 70)
+    parts = split_message("ã" * 66 + "😀" + "ã" * 4)
+    assert parts[0] == "ã" * 66  # O par de substitutos não é partido
+    assert "".join(parts) == "ã" * 66 + "😀" + "ã" * 4
+
+
+def test_message_too_long():
+    """Limite em segmentos, com o motivo de recusa"""
+    assert message_too_long("a" * 153 * 3, max_parts=3) is None
+    reason = message_too_long("a" * (153 * 3 + 1), max_parts=3)
+    assert reason is not None and "4 partes" in reason
+
+
+if __name__ == "__main__":
+    tests = [value for name, value in list(globals().items()) if name.startswith("test_")]
+    for test in tests:
+        test()
+        print(f"✅ {test.__name__}")
+    print(f"\n🎉 {len(tests)} testes passaram")
@@ -0,0 +1,133 @@
+"""
+Testes do limitador de taxa (token bucket, em memória)
+"""
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import shared.rate_limit as rate_limit
+from shared.rate_limit import RateLimiter, TokenBucket
+
+
+class FakeClock:
+    """Substitui time.monotonic para avançar o tempo sem esperar"""
+
+    def __init__(self, now: float = 1000.0):
+        self.now = now
+
+    def monotonic(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float):
+        self.now += seconds
+
+
+def with_clock(test):
+    def wrapper():
+        clock = FakeClock()
+        original = rate_limit.time
+        rate_limit.time = clock
+        try:
+            test(clock)
+        finally:
+            rate_limit.time = original
+    wrapper.__name__ = test.__name__
+    wrapper.__doc__ = test.__doc__
+    return wrapper
+
+
+def test_token_bucket_refill():
+    """Capacidade inicial cheia e reposição contínua a limite/período"""
+    bucket = TokenBucket(2, 60, now=0)
+    assert bucket.wait_time(1, 0) == 0
+    bucket.consume(1)
+    bucket.consume(1)
+    assert bucket.wait_time(1, 0) == 30.0
+    assert bucket.wait_time(1, 15) == 15.0
+    assert bucket.wait_time(1, 30) == 0
+    assert bucket.wait_time(1, 10000) == 0
+    assert bucket.tokens == 2  # Nunca passa da capacidade
+
+
+def test_token_bucket_cost_above_capacity():
+    """Um pedido maior que o balde passa quando este estiver cheio (e esvazia-o)"""
+    bucket = TokenBucket(3, 60, now=0)
+    assert bucket.wait_time(5, 0) == 0
+    bucket.consume(5)
+    assert bucket.tokens == 0
+    assert bucket.wait_time(5, 0) == 60.0
+
+
+@with_clock
+def test_limiter_window(clock):
+    """Limite por âmbito e valor; cada destino tem o seu balde"""
+    limiter = RateLimiter(limits={"destination": [(2, 60)]})
+    assert limiter.check({"destination": "+258841"}) == 0
+    assert limiter.check({"destination": "+258841"}) == 0
+    assert limiter.check({"destination": "+258841"}) == 30.0
+    assert limiter.check({"destination": "+258842"}) == 0
+    clock.now += 30
+    assert limiter.check({"destination": "+258841"}) == 0
+
+
+@with_clock
+def test_limiter_all_or_nothing(clock):
+    """Se um âmbito está esgotado, nada é consumido nos outros"""
+    limiter = RateLimiter(limits={"modem": [(5, 60)], "user": [(1, 60)]})
+    assert limiter.check({"modem": "m1", "user": "u1"}) == 0
+    assert limiter.check({"modem": "m1", "user": "u1"}) == 60.0
+    assert limiter.check({"modem": "m1", "user": "u1"}) == 60.0
+    # O modem só gastou a ficha do pedido permitido
+    assert limiter._buckets[("modem", "m1", 60)].tokens == 4
+    assert limiter.get_stats()["decisions"]["user"] == {"allowed": 1, "limited": 2}
+
+
+@with_clock
+def test_limiter_multiple_windows_and_cost(clock):
+    """Janelas minuto/hora: a espera é a da janela mais restritiva; custo = segmentos"""
+    limiter = RateLimiter(limits={"modem": [(10, 60), (20, 3600)]})
+    assert limiter.check({"modem": "m1"}, cost=10) == 0
+    assert limiter.check({"modem": "m1"}, cost=3) == 18.0  # Falta o minuto; a hora tem 10
+    clock.now += 60
+    assert limiter.check({"modem": "m1"}, cost=10) == 0
+    assert round(limiter.check({"modem": "m1"}, cost=3), 6) == 480.0  # Agora falta a hora
+
+
+@with_clock
+def test_limiter_preview_does_not_consume(clock):
+    """consume=False só pergunta"""
+    limiter = RateLimiter(limits={"api": [(1, 60)]})
+    assert limiter.check({"api": "k"}, consume=False) == 0
+    assert limiter.check({"api": "k"}, consume=False) == 0
+    assert limiter.check({"api": "k"}) == 0
+    assert limiter.check({"api": "k"}, consume=False) == 60.0
+
+
+@with_clock
+def test_limiter_ignores_unknown_and_empty_scopes(clock):
+    """Âmbitos sem valor ou sem limites não limitam; desativado deixa tudo passar"""
+    limiter = RateLimiter(limits={"user": [(1, 60)]})
+    assert limiter.check({"user": None, "ussd": "x"}) == 0
+    assert limiter.check({"user": None, "ussd": "x"}) == 0
+    disabled = RateLimiter(limits={"user": [(1, 60)]}, enabled=False)
+    for _ in range(5):
+        assert disabled.check({"user": "u1"}) == 0
+
+
+@with_clock
+def test_acquire_waits_or_returns_wait(clock):
+    """acquire espera dentro do timeout; fora dele devolve a espera sem consumir"""
+    limiter = RateLimiter(limits={"modem": [(1, 60)]})
+    assert limiter.acquire({"modem": "m1"}) == 0
+    assert limiter.acquire({"modem": "m1"}, timeout=10) == 60.0
+    started = clock.now
+    assert limiter.acquire({"modem": "m1"}, timeout=120) == 0
+    assert clock.now - started == 60.0
+
+
+if __name__ == "__main__":
+    tests = [value for name, value in list(globals().items()) if name.startswith("test_")]
+    for test in tests:
+        test()
+        print(f"✅ {test.__name__}")
+    print(f"\n🎉 {len(tests)} testes passaram")
@@ -0,0 +1,77 @@
+"""
+Testes da política de novas tentativas (classificação e atraso exponencial)
+"""
+import sys
+import os
+from datetime import datetime
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.services.retry_policy import FAILURE_PERMANENT, FAILURE_TRANSIENT, RetryPolicy
+
+
+def make_policy() -> RetryPolicy:
+    return RetryPolicy(max_retries=3, base_delay=60, max_delay=300)
+
+
+def seconds_until(moment: datetime) -> float:
+    return (moment - datetime.utcnow()).total_seconds()
+
+
+def test_classify():
+    """CMS de número/assinante inválido ou 'permanent' são permanentes; o resto é transitório"""
+    assert RetryPolicy.classify({"cms_error": 1}) == FAILURE_PERMANENT
+    assert RetryPolicy.classify({"cms_error": 30}) == FAILURE_PERMANENT
+    assert RetryPolicy.classify({"permanent": True, "error": "Mensagem muito longa"}) == FAILURE_PERMANENT
+    assert RetryPolicy.classify({"cms_error": 42}) == FAILURE_TRANSIENT
+    assert RetryPolicy.classify({"error": "Timeout"}) == FAILURE_TRANSIENT
+    assert RetryPolicy.classify({}) == FAILURE_TRANSIENT
+
+
+def test_backoff_doubles_with_jitter_and_cap():
+    """base * 2^(n-1) com jitter na metade superior, limitado a max_delay"""
+    policy = make_policy()
+    for attempts, delay in ((1, 60), (2, 120), (3, 240), (4, 300), (10, 300)):
+        for _ in range(50):
+            assert delay / 2 <= policy.backoff(attempts) <= delay
+    assert 30 <= policy.backoff(0) <= 60  # Primeira falha ainda sem retry_count
+
+
+def test_next_attempt_transient():
+    """Falha transitória volta à fila enquanto houver tentativas"""
+    policy = make_policy()
+    wait = seconds_until(policy.next_attempt_at(2, {"error": "Timeout"}))
+    assert 59 <= wait <= 121
+    assert policy.next_attempt_at(3, {"error": "Timeout"}) is None
+
+
+def test_next_attempt_permanent():
+    """Falha permanente nunca é repetida"""
+    policy = make_policy()
+    assert policy.next_attempt_at(0, {"cms_error": 1}) is None
+    assert policy.next_attempt_at(0, {"permanent": True}) is None
+
+
+def test_next_attempt_rate_limited():
+    """Limite de taxa não gasta tentativas e respeita retry_after"""
+    policy = make_policy()
+    moment = policy.next_attempt_at(3, {"rate_limited": True, "retry_after": 12.5})
+    assert moment is not None
+    assert 12 <= seconds_until(moment) <= 13.6
+    wait = seconds_until(policy.next_attempt_at(0, {"rate_limited": True}))
+    assert 59 <= wait <= 61.1  # Sem retry_after: atraso base
+
+
+def test_defaults_from_settings():
+    from app.core.config import settings
+    policy = RetryPolicy()
+    assert policy.max_retries == settings.SMS_MAX_RETRIES
+    assert policy.base_delay == settings.SMS_RETRY_DELAY
+    assert policy.max_delay == settings.SMS_RETRY_MAX_DELAY
+
+
+if __name__ == "__main__":
+    tests = [value for name, value in list(globals().items()) if name.startswith("test_")]
+    for test in tests:
+        test()
+        print(f"✅ {test.__name__}")
+    print(f"\n🎉 {len(tests)} testes passaram")
@@ -0,0 +1,138 @@
+"""
+Testes do ritmo de envio adaptativo (AIMD) por modem
+"""
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import app.services.send_pacing as send_pacing
+from app.services.send_pacing import SendPacer, parse_cms_error
+
+
+class FakeClock:
+    """Substitui time.monotonic para avançar o tempo sem esperar"""
+
+    def __init__(self, now: float = 1000.0):
+        self.now = now
+
+    def monotonic(self) -> float:
+        return self.now
+
+
+def make_pacer(**overrides) -> SendPacer:
+    options = dict(initial_rate=10, min_rate=2, max_rate=20, increase=1, decrease=0.5,
+                   latency_target=10, enabled=True)
+    options.update(overrides)
+    return SendPacer(**options)
+
+
+def with_clock(test):
+    def wrapper():
+        clock = FakeClock()
+        original = send_pacing.time
+        send_pacing.time = clock
+        try:
+            test(clock)
+        finally:
+            send_pacing.time = original
+    wrapper.__name__ = test.__name__
+    wrapper.__doc__ = test.__doc__
+    return wrapper
+
+
+def test_parse_cms_error():
+    assert parse_cms_error("\r\n+CMS ERROR: 42\r\n") == 42
+    assert parse_cms_error("+CMS ERROR:500") == 500
+    assert parse_cms_error("OK") is None
+    assert parse_cms_error(None) is None
+
+
+def test_additive_increase_up_to_max():
+    """Cada envio bem-sucedido a tempo soma 'increase' até max_rate"""
+    pacer = make_pacer()
+    for _ in range(5):
+        pacer.record(latency=2, success=True)
+    assert pacer.rate == 15
+    assert pacer.sent == 5
+    for _ in range(20):
+        pacer.record(latency=2, success=True)
+    assert pacer.rate == 20
+
+
+def test_multiplicative_decrease_down_to_min():
+    """Congestionamento (CMS 38/41/42/47, timeout, latência acima do alvo) divide o ritmo"""
+    pacer = make_pacer(initial_rate=16)
+    pacer.record(latency=2, success=False, cms_error=42)
+    assert pacer.rate == 8
+    pacer.record(latency=None, success=False, timed_out=True)
+    assert pacer.rate == 4
+    pacer.record(latency=15, success=True)  # Aceite, mas acima do alvo
+    assert pacer.rate == 2
+    pacer.record(latency=None, success=False, cms_error=47)
+    assert pacer.rate == 2
+    assert pacer.congestion_events == 4
+    assert pacer.last_cms_error == 47
+
+
+def test_other_failures_keep_rate():
+    """Falhas que não indicam carga (ex: número inválido) não mexem no ritmo"""
+    pacer = make_pacer()
+    pacer.record(latency=1, success=False, cms_error=1)
+    assert pacer.rate == 10
+    assert pacer.congestion_events == 0
+    assert pacer.last_cms_error == 1
+
+
+def test_latency_moving_average():
+    """Média móvel exponencial; timeouts não entram na média"""
+    pacer = make_pacer()
+    pacer.record(latency=5, success=True)
+    pacer.record(latency=10, success=True)
+    assert pacer.latency == 6.0
+    pacer.record(latency=60, success=False, timed_out=True)
+    assert pacer.latency == 6.0
+
+
+def test_initial_rate_clamped():
+    assert make_pacer(initial_rate=100).rate == 20
+    assert make_pacer(initial_rate=0.5).rate == 2
+    assert make_pacer(initial_rate=12).interval == 5.0
+
+
+@with_clock
+def test_reserve_spaces_sends_by_segments(clock):
+    """O próximo envio fica um intervalo por segmento depois do início do anterior"""
+    pacer = make_pacer(initial_rate=12)  # 5 s por segmento
+    assert pacer.delay() == 0
+    pacer.reserve(segments=3)
+    assert pacer.delay() == 15.0
+    clock.now += 10
+    assert pacer.delay() == 5.0
+    pacer.reserve()  # Reservas seguidas acumulam
+    assert pacer.delay() == 10.0
+    clock.now += 60
+    assert pacer.delay() == 0
+
+
+@with_clock
+def test_congestion_pushes_next_send(clock):
+    """Um sinal de congestionamento adia o próximo envio pelo novo intervalo"""
+    pacer = make_pacer(initial_rate=12)
+    pacer.record(latency=None, success=False, cms_error=41)
+    assert pacer.interval == 10.0
+    assert pacer.delay() == 10.0
+
+
+@with_clock
+def test_disabled_never_waits(clock):
+    pacer = make_pacer(enabled=False)
+    pacer.reserve(segments=10)
+    assert pacer.delay() == 0
+
+
+if __name__ == "__main__":
+    tests = [value for name, value in list(globals().items()) if name.startswith("test_")]
+    for test in tests:
+        test()
+        print(f"✅ {test.__name__}")
+    print(f"\n🎉 {len(tests)} testes passaram")
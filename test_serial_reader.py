@@ -0,0 +1,167 @@
+"""
+Testes do leitor serial dedicado com uma porta simulada (sem modem)
+"""
+import sys
+import os
+import queue
+import threading
+import time
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.services.serial_reader import SerialReader, is_final_result
+from app.services.urc_dispatcher import URCDispatcher
+
+
+class FakeSerial:
+    """Porta serial simulada: cada comando escrito recebe a resposta programada"""
+
+    def __init__(self, replies: dict):
+        self.port = "FAKE"
+        self.is_open = True
+        self.replies = replies
+        self.written = []
+        self._incoming: queue.Queue = queue.Queue()
+
+    @property
+    def in_waiting(self) -> int:
+        return 0
+
+    def write(self, payload: bytes):
+        self.written.append(payload)
+        reply = self.replies.get(payload.decode(errors="ignore").strip())
+        # Uma resposta em tuplo chega em várias leituras
+        for chunk in (reply if isinstance(reply, tuple) else (reply,)):
+            if chunk is not None:
+                self.push(chunk)
+
+    def push(self, data: bytes):
+        self._incoming.put(data)
+
+    def read(self, size: int = 1) -> bytes:
+        if not self.is_open:
+            raise OSError("porta fechada")
+        try:
+            return self._incoming.get(timeout=0.05)
+        except queue.Empty:
+            return b""
+
+
+def make_reader(replies: dict, **kwargs):
+    connection = FakeSerial(replies)
+    unsolicited = []
+    reader = SerialReader(connection, on_unsolicited=unsolicited.append, **kwargs)
+    reader.start()
+    return reader, connection, unsolicited
+
+
+def test_is_final_result():
+    assert is_final_result("OK")
+    assert is_final_result("ERROR")
+    assert is_final_result("+CMS ERROR: 42")
+    assert is_final_result("+CME ERROR: 10")
+    assert not is_final_result("+CSQ: 20,99")
+    assert not is_final_result("OKAY")
+
+
+def test_execute_collects_lines():
+    """Eco ignorado, linhas intermédias guardadas, código final separado"""
+    reader, _, _ = make_reader({"AT+CSQ": b"AT+CSQ\r\r\n+CSQ: 20,99\r\n\r\nOK\r\n"})
+    try:
+        response = reader.execute("AT+CSQ", timeout=2)
+        assert response.success
+        assert response.lines == ["+CSQ: 20,99"]
+        assert response.text == "+CSQ: 20,99\r\nOK"
+    finally:
+        reader.stop()
+
+
+def test_execute_error_and_timeout():
+    reader, _, _ = make_reader({"AT+CMGS=1": b"+CMS ERROR: 38\r\n"})
+    try:
+        response = reader.execute("AT+CMGS=1", timeout=2)
+        assert not response.success
+        assert response.error_code == "38"
+
+        response = reader.execute("AT+NADA", timeout=0.2)
+        assert response.timed_out and response.final is None
+    finally:
+        reader.stop()
+
+
+def test_prompt_without_newline():
+    """O prompt '> ' do AT+CMGS resolve o comando sem fim de linha"""
+    reader, _, _ = make_reader({"AT+CMGS=23": b"\r\n> "})
+    try:
+        response = reader.execute("AT+CMGS=23", timeout=2, expect_prompt=True)
+        assert response.is_prompt and response.success
+    finally:
+        reader.stop()
+
+
+def test_unsolicited_between_commands():
+    """Linhas sem comando em curso vão para on_unsolicited"""
+    reader, connection, unsolicited = make_reader({})
+    try:
+        connection.push(b'\r\n+CMTI: "SM",3\r\n')
+        deadline = time.monotonic() + 2
+        while not unsolicited and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert unsolicited == ['+CMTI: "SM",3']
+    finally:
+        reader.stop()
+
+
+def test_urc_interleaved_with_response():
+    """+CMTI no meio da resposta a AT+CSQ sai como URC; +CREG de AT+CREG? fica na resposta"""
+    dispatcher = URCDispatcher()
+    reader, _, unsolicited = make_reader({
+        "AT+CSQ": b'+CSQ: 18,99\r\n+CMTI: "SM",7\r\nOK\r\n',
+        "AT+CREG?": b"+CREG: 0,1\r\nOK\r\n",
+    }, is_unsolicited=dispatcher.claims)
+    try:
+        response = reader.execute("AT+CSQ", timeout=2)
+        assert response.lines == ["+CSQ: 18,99"]
+        assert unsolicited == ['+CMTI: "SM",7']
+
+        response = reader.execute("AT+CREG?", timeout=2)
+        assert response.lines == ["+CREG: 0,1"]
+        assert unsolicited == ['+CMTI: "SM",7']
+    finally:
+        reader.stop()
+
+
+def test_split_chunks_and_on_result():
+    """Linhas partidas entre leituras; on_result vê cada código final antes das linhas seguintes"""
+    results = []
+    reader, _, _ = make_reader({"AT+CSQ": (b"+CSQ: 1", b"5,99\r", b"\nO", b"K\r\n")},
+                               on_result=lambda command, final: results.append((command, final)))
+    try:
+        response = reader.execute("AT+CSQ", timeout=2)
+        assert response.lines == ["+CSQ: 15,99"]
+        assert results == [("AT+CSQ", "OK")]
+    finally:
+        reader.stop()
+
+
+def test_stop_releases_waiting_caller():
+    """Porta fechada: o leitor termina e o chamador recebe timeout em vez de ficar preso"""
+    reader, connection, _ = make_reader({})
+    holder = []
+    worker = threading.Thread(target=lambda: holder.append(reader.execute("AT", timeout=5)))
+    worker.start()
+    deadline = time.monotonic() + 2
+    while not connection.written and time.monotonic() < deadline:
+        time.sleep(0.01)  # Comando já escrito e à espera
+    connection.is_open = False
+    worker.join(3)
+    assert holder and holder[0].timed_out
+    assert not reader.is_running
+    reader.stop()
+
+
+if __name__ == "__main__":
+    tests = [value for name, value in list(globals().items()) if name.startswith("test_")]
+    for test in tests:
+        test()
+        print(f"✅ {test.__name__}")
+    print(f"\n🎉 {len(tests)} testes passaram")
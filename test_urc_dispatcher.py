@@ -0,0 +1,122 @@
+"""
+Testes do encaminhador de URC (+CMTI, +CDS, +CUSD, +CREG...) sem modem
+"""
+import sys
+import os
+import threading
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.services.urc_dispatcher import URCDispatcher, expects_body, parse_urc_params, urc_type
+
+
+def collect(dispatcher: URCDispatcher, urc: str, expected: int):
+    """Subscrever e esperar (na thread do dispatcher) por 'expected' eventos"""
+    events = []
+    done = threading.Event()
+
+    def callback(event):
+        events.append(event)
+        if len(events) >= expected:
+            done.set()
+
+    dispatcher.subscribe(urc, callback)
+    return events, done
+
+
+def test_urc_type_and_params():
+    assert urc_type('+CMTI: "SM",3') == "CMTI"
+    assert urc_type("RING") == "RING"
+    assert urc_type("OK") is None
+    assert parse_urc_params('+CMTI: "SM",3') == ["SM", "3"]
+    assert parse_urc_params('+CUSD: 0,"Saldo: 10,50 MT",15') == ["0", "Saldo: 10,50 MT", "15"]
+    assert parse_urc_params("RING") == []
+
+
+def test_expects_body():
+    """+CMT/+CBM e +CDS em modo PDU trazem uma linha de dados; +CDS em texto não"""
+    assert expects_body('+CMT: "+258841234567",,"26/10/17,10:00:00+08"')
+    assert expects_body("+CDS: 26")
+    assert not expects_body("+CDS: 6,42,\"+258841234567\",145")
+    assert not expects_body('+CMTI: "SM",3')
+
+
+def test_claims_without_command():
+    """Sem comando em curso, só URCs conhecidos são não solicitados"""
+    dispatcher = URCDispatcher()
+    assert dispatcher.claims('+CMTI: "SM",3')
+    assert dispatcher.claims("+CREG: 1")
+    assert not dispatcher.claims("+CSQ: 20,99")
+    assert not dispatcher.claims("OK")
+
+
+def test_claims_during_command():
+    """A resposta a AT+CREG? não é URC; +CMTI intercalado continua a ser"""
+    dispatcher = URCDispatcher()
+    assert not dispatcher.claims("+CREG: 0,1", "AT+CREG?")
+    assert not dispatcher.claims('+CUSD: 0,"Saldo",15', 'AT+CUSD=1,"*124#",15')
+    assert dispatcher.claims('+CMTI: "SM",4', "AT+CSQ")
+    assert dispatcher.claims("+CREG: 1", "AT+CSQ")
+
+
+def test_claims_body_line_after_header():
+    """A linha a seguir a +CMT é o corpo, mesmo que pareça resposta"""
+    dispatcher = URCDispatcher()
+    dispatcher.feed('+CMT: "+258841234567",,"26/10/17,10:00:00+08"')
+    assert dispatcher.claims("OK", "AT+CSQ")
+    dispatcher.feed("OK")
+    assert not dispatcher.claims("OK", "AT+CSQ")
+
+
+def test_feed_publishes_events():
+    """Subscritores por tipo e '*'; corpo juntado ao cabeçalho; linhas soltas ignoradas"""
+    dispatcher = URCDispatcher()
+    cmti, cmti_done = collect(dispatcher, "+CMTI", 1)
+    everything, all_done = collect(dispatcher, "*", 2)
+
+    dispatcher.feed("lixo sem prefixo")
+    dispatcher.feed('+CMTI: "SM",5')
+    dispatcher.feed('+CMT: "+258841234567",,"26/10/17,10:00:00+08"')
+    dispatcher.feed("Olá mundo")
+
+    assert cmti_done.wait(2) and all_done.wait(2)
+    assert cmti[0]["params"] == ["SM", "5"]
+    assert cmti[0]["body"] is None
+    assert [event["type"] for event in everything] == ["CMTI", "CMT"]
+    assert everything[1]["body"] == "Olá mundo"
+
+
+def test_context_taken_at_header():
+    """O contexto (ex: modo AT+CMGF) é o do cabeçalho, não o da linha de dados"""
+    state = {"pdu_mode": True}
+    dispatcher = URCDispatcher(context=lambda: dict(state))
+    events, done = collect(dispatcher, "CDS", 1)
+
+    dispatcher.feed("+CDS: 26")
+    state["pdu_mode"] = False
+    dispatcher.feed("0006D60B911326880736F4111011719551401110117195714000")
+
+    assert done.wait(2)
+    assert events[0]["pdu_mode"] is True
+    assert events[0]["body"].startswith("0006")
+
+
+def test_unsubscribe_and_failing_subscriber():
+    """Um subscritor que falha não impede os outros; removido deixa de receber"""
+    dispatcher = URCDispatcher()
+    removed = []
+    dispatcher.subscribe("RING", removed.append)
+    dispatcher.unsubscribe("RING", removed.append)
+    dispatcher.subscribe("RING", lambda event: 1 / 0)
+    events, done = collect(dispatcher, "RING", 1)
+
+    dispatcher.feed("RING")
+    assert done.wait(2)
+    assert removed == []
+
+
+if __name__ == "__main__":
+    tests = [value for name, value in list(globals().items()) if name.startswith("test_")]
+    for test in tests:
+        test()
+        print(f"✅ {test.__name__}")
+    print(f"\n🎉 {len(tests)} testes passaram")